@@ -0,0 +1,86 @@
+# benchmark -- the compiled model (refer "sensor/compiled_model.py") against "predict" of the model itself on
+# synthetic APS data (refer "sensor/synthetic.py"):
+#   parity     -- the labels of both are the same for every row (and the margins bit for bit), for the dense
+#                 matrix and for its CSR form (the "native" missing value mode, refer "missing_values.py")
+#   load       -- "load_object" of the pickled model against the memory mapped arrays of the compiled model
+#   latency    -- the median time of one "predict" call, for every batch size in "--batch-sizes"
+#   throughput -- rows per second of one "predict" call on the whole test set
+#
+# example:
+#   python benchmarks/bench_compiled_model.py --rows 60000 --engine booster --batch-sizes 1 10 100 1000
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from sensor.components.data_transformation import DataTransformation
+from sensor.config import TARGET_COLUMN
+from sensor.synthetic import make_aps_dataframe
+
+
+def median_time(function, repeat:int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="the compiled model against the predict of xgboost")
+    parser.add_argument("--rows", type=int, default=60000)
+    parser.add_argument("--engine", default="xgbclassifier")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10, 100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from scipy import sparse
+    from sklearn.model_selection import train_test_split
+    from sensor.compiled_model import CompiledTreeEnsemble, compile_model
+    from sensor.training_engine import get_base_booster, get_training_engine
+    from sensor.utils import load_object, save_object
+
+    df = make_aps_dataframe(args.rows, seed=args.seed)
+    x, y = df.drop(columns=TARGET_COLUMN).astype(np.float32), (df[TARGET_COLUMN] == "pos").to_numpy().astype(np.int64)
+    x_train, x_test, y_train, y_test = train_test_split(x, y, test_size=0.2, random_state=42, stratify=y)
+    # the "native" missing value mode -- the missing values stay np.nan
+    transformer = DataTransformation.get_data_transformer_object(missing_value_mode="native").fit(x_train)
+    x_train, x_test = np.asarray(transformer.transform(x_train)), np.asarray(transformer.transform(x_test))
+    model = get_training_engine(args.engine).train(x_train, y_train, x_test, y_test).model
+
+    with tempfile.TemporaryDirectory() as dir_path:
+        model_path, compiled_path = os.path.join(dir_path, "model.pkl"), os.path.join(dir_path, "compiled_model")
+        save_object(file_path=model_path, obj=model)
+        compile_model(model).save(compiled_path)
+        load_time = median_time(lambda: load_object(file_path=model_path), 5)
+        compiled_load_time = median_time(lambda: CompiledTreeEnsemble.load(compiled_path), 5)
+        compiled = CompiledTreeEnsemble.load(compiled_path)
+
+        # parity
+        x_sparse = sparse.csr_matrix(np.nan_to_num(x_test, nan=0.0))
+        for name, matrix in [("dense", x_test), ("csr", x_sparse)]:
+            labels, compiled_labels = model.predict(matrix), compiled.predict(matrix)
+            mismatches = int(np.count_nonzero(labels != compiled_labels))
+            print(f"parity {name:5s} rows={matrix.shape[0]} label mismatches={mismatches}")
+            assert mismatches == 0, f"the compiled model does not match the model ({name})"
+        # the trees which "predict" uses (up to the best iteration)
+        margin = get_base_booster(model).inplace_predict(x_test, predict_type="margin")
+        print(f"parity margin bit-exact={np.array_equal(margin, compiled.predict_margin(x_test))}")
+
+        print(f"trees={compiled.n_trees} nodes={compiled.feature.shape[0]} max depth={compiled.max_depth} engine={args.engine}")
+        print(f"load      pickle={load_time * 1e3:8.2f}ms compiled (mmap)={compiled_load_time * 1e3:8.2f}ms")
+        for batch_size in args.batch_sizes:
+            batch = x_test[:batch_size]
+            model_time = median_time(lambda: model.predict(batch), args.repeat)
+            compiled_time = median_time(lambda: compiled.predict(batch), args.repeat)
+            print(f"latency   batch={batch_size:6d} xgboost={model_time * 1e3:8.3f}ms compiled={compiled_time * 1e3:8.3f}ms "
+                  f"speedup={model_time / compiled_time:5.2f}x")
+        model_time = median_time(lambda: model.predict(x_test), 3)
+        compiled_time = median_time(lambda: compiled.predict(x_test), 3)
+        print(f"throughput rows={x_test.shape[0]} xgboost={x_test.shape[0] / model_time:12.0f} rows/s "
+              f"compiled={x_test.shape[0] / compiled_time:12.0f} rows/s")
@@ -0,0 +1,67 @@
+# benchmark -- data drift of a large dataset: the old serial "ks_2samp" loop vs. the drift engine
+# (refer "sensor/drift.py") with the exact and the approximate (quantile sketch) method
+# the data is random (log-normal, 10% missing) -- one column has a small shift, ie one real drift
+#
+# example:
+#   python benchmarks/bench_drift.py --rows 1000000 --columns 170 --workers 1 4
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from sensor.drift import DriftDetector
+from sensor.profiling import profile_dataframe, profile_chunks
+
+
+def make_dataset(rows:int, columns:int, shift:float, seed:int) -> pd.DataFrame:
+    random = np.random.default_rng(seed)
+    data = random.lognormal(size=(rows, columns)).astype(np.float32)
+    data[:, 0] += shift
+    data[random.random(data.shape) < 0.1] = np.nan
+    return pd.DataFrame(data, columns=[f"s{index:03d}" for index in range(columns)])
+
+
+def old_drift(base_df:pd.DataFrame, current_df:pd.DataFrame) -> list:
+    from scipy.stats import ks_2samp
+    return [ks_2samp(base_df[column].dropna(), current_df[column].dropna()).pvalue for column in base_df.columns]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="serial ks_2samp vs. the drift engine")
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--columns", type=int, default=170)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--chunk-size", type=int, default=100000)
+    parser.add_argument("--sketch-k", type=int, default=1000)
+    parser.add_argument("--skip-old", action="store_true", help="do not run the (slow) serial loop")
+    args = parser.parse_args()
+
+    base_df = make_dataset(args.rows, args.columns, shift=0.0, seed=1)
+    current_df = make_dataset(args.rows // 4, args.columns, shift=0.05, seed=2)
+
+    if not args.skip_old:
+        start = time.perf_counter()
+        old_pvalues = old_drift(base_df, current_df)
+        print(f"serial ks_2samp          time={time.perf_counter() - start:8.2f}s")
+
+    start = time.perf_counter()
+    base_profile, current_profile = profile_dataframe(base_df), profile_dataframe(current_df)
+    print(f"profiles (sorted)        time={time.perf_counter() - start:8.2f}s")
+    for workers in args.workers:
+        start = time.perf_counter()
+        results = DriftDetector(base_profile, max_workers=workers, min_parallel_values=0).detect(current_profile)
+        elapsed = time.perf_counter() - start
+        if not args.skip_old:
+            assert np.allclose([result.pvalue for result in results], old_pvalues), "exact drift differs from ks_2samp"
+        print(f"exact, {workers:>2} workers      time={elapsed:8.2f}s drifted={sum(result.pvalue <= 0.05 for result in results)}")
+
+    start = time.perf_counter()
+    chunks = lambda df: (df.iloc[index:index + args.chunk_size] for index in range(0, df.shape[0], args.chunk_size))
+    base_profile = profile_chunks(chunks(base_df), sketch_k=args.sketch_k)
+    current_profile = profile_chunks(chunks(current_df), sketch_k=args.sketch_k)
+    print(f"profiles (sketches)      time={time.perf_counter() - start:8.2f}s")
+    start = time.perf_counter()
+    results = DriftDetector(base_profile, method="approximate", max_workers=1).detect(current_profile)
+    print(f"approximate              time={time.perf_counter() - start:8.2f}s drifted={sum(result.pvalue <= 0.05 for result in results)}")
@@ -0,0 +1,66 @@
+# import time budget -- how long does it take to import the entry points of the package?
+# every module is imported in a fresh python process (so nothing is cached), a few times, and the
+# best time is compared with the budget. The heavy libraries (pymongo, sklearn, xgboost, imblearn,
+# scipy) must not be imported by the prediction entry point at all -- they are only imported when
+# they are really used.
+# the script exits with status 1 if the budget is exceeded -- so it can be used as a check in CI
+#
+# example:
+#   python benchmarks/bench_import_time.py --budget-ms 800
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ["pymongo", "sklearn", "xgboost", "imblearn", "scipy"]
+
+# module -> should the heavy modules stay unimported?
+ENTRY_POINTS = {
+    "sensor.pipeline.batch_prediction": True,
+    "sensor.pipeline.training_pipeline": True,
+}
+
+MEASURE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "heavy": sorted(m for m in {heavy} if m in sys.modules)}}))
+"""
+
+
+def measure(module:str) -> dict:
+    code = MEASURE.format(module=module, heavy=HEAVY_MODULES)
+    # we run inside a temporary folder -- so the log files of the package do not end up in the repo
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([PACKAGE_ROOT, os.environ.get("PYTHONPATH", "")]))
+    with tempfile.TemporaryDirectory() as work_dir:
+        output = subprocess.run([sys.executable, "-c", code], cwd=work_dir, env=env, capture_output=True, text=True, check=True)
+    # the last line is ours -- the package itself may print something while it is imported
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="import time budget of the package entry points")
+    parser.add_argument("--budget-ms", type=float, default=1000.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    failed = False
+    for module, must_be_light in ENTRY_POINTS.items():
+        results = [measure(module) for _ in range(args.repeat)]
+        best_ms = 1000 * min(result["seconds"] for result in results)
+        heavy = results[-1]["heavy"]
+        status = "ok"
+        if best_ms > args.budget_ms:
+            status = f"OVER BUDGET ({args.budget_ms:.0f} ms)"
+            failed = True
+        if must_be_light and len(heavy) > 0:
+            status = f"imports heavy modules eagerly: {heavy}"
+            failed = True
+        print(f"{module:<40} {best_ms:8.1f} ms  {status}")
+
+    sys.exit(1 if failed else 0)
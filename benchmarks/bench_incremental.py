@@ -0,0 +1,64 @@
+# benchmark -- the incremental training (refer "sensor/incremental.py") on synthetic APS data (refer
+# "sensor/synthetic.py"): a production model is trained on the older rows, then "--new" rows arrive.
+# the full retrain (all the rows, all the rounds) is compared with the warm start (the production model
+# boosted "--rounds" more rounds on the new rows + a replay sample of the older rows): the time of the
+# training and the F1 score on the test set
+#
+# example:
+#   python benchmarks/bench_incremental.py --rows 600000 --new 0.05 0.2 --engine booster
+
+import argparse
+import time
+
+import numpy as np
+
+from sensor.components.data_transformation import DataTransformation
+from sensor.config import TARGET_COLUMN
+from sensor.synthetic import make_aps_dataframe
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="time and F1 of the warm start against the full retrain")
+    parser.add_argument("--rows", type=int, default=60000)
+    parser.add_argument("--new", type=float, nargs="+", default=[0.1], help="the share of new rows")
+    parser.add_argument("--engine", default="xgbclassifier")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--replay-ratio", type=float, default=1.0)
+    parser.add_argument("--min-replay-rows", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from sklearn.metrics import f1_score
+    from sklearn.model_selection import train_test_split
+    from sensor.incremental import select_delta_rows
+    from sensor.training_engine import get_training_engine
+
+    df = make_aps_dataframe(args.rows, seed=args.seed)
+    x, y = df.drop(columns=TARGET_COLUMN).astype(np.float32), (df[TARGET_COLUMN] == "pos").to_numpy().astype(np.int64)
+    # the position of a row is its row of the feature store -- the last rows are the new ones
+    train_rows, test_rows = train_test_split(np.arange(args.rows), test_size=0.2, random_state=42, stratify=y)
+    for new in args.new:
+        trained_rows = int(round(args.rows * (1 - new)))
+        # the transformer of the production model -- fitted on the older rows, and kept
+        transformer = DataTransformation.get_data_transformer_object().fit(x.iloc[train_rows[train_rows < trained_rows]])
+        x_train, y_train = transformer.transform(x.iloc[train_rows]), y[train_rows]
+        x_test, y_test = transformer.transform(x.iloc[test_rows]), y[test_rows]
+        old = train_rows < trained_rows
+        engine = get_training_engine(args.engine)
+        base_model = engine.train(x_train[old], y_train[old], x_test, y_test).model
+
+        start = time.perf_counter()
+        full = engine.train(x_train, y_train, x_test, y_test)
+        full_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        new_rows, replay_rows = select_delta_rows(train_rows=train_rows, y=y_train, trained_rows=trained_rows,
+                                                  replay_ratio=args.replay_ratio, min_replay_rows=args.min_replay_rows)
+        delta = np.sort(np.concatenate([new_rows, replay_rows]))
+        warm = engine.train(x_train[delta], y_train[delta], x_test, y_test, base_model=base_model, rounds=args.rounds)
+        warm_time = time.perf_counter() - start
+
+        print(f"rows={args.rows} new={new_rows.shape[0]} replay={replay_rows.shape[0]} engine={args.engine}")
+        print(f"  production model      f1 test={f1_score(y_test, base_model.predict(x_test)):6.4f}")
+        print(f"  full retrain          time={full_time:7.2f}s f1 test={full.f1_test_score:6.4f}")
+        print(f"  warm start            time={warm_time:7.2f}s f1 test={warm.f1_test_score:6.4f} speedup={full_time / warm_time:5.2f}x")
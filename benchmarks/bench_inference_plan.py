@@ -0,0 +1,56 @@
+# benchmark -- the inference plan (refer "sensor/inference_plan.py") against "transformer.transform(df[columns])"
+# on synthetic APS data (refer "sensor/synthetic.py"), for both missing value modes: the result has to be the
+# same bit for bit (and of the same dtype), then the time of one transform for every number of rows in "--rows"
+#
+# example:
+#   python benchmarks/bench_inference_plan.py --rows 100 10000 200000
+
+import argparse
+import time
+
+import numpy as np
+
+from sensor.components.data_transformation import DataTransformation
+from sensor.config import TARGET_COLUMN
+from sensor.synthetic import make_aps_dataframe
+
+
+def median_time(function, repeat:int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+def same(expected, result) -> bool:
+    if hasattr(expected, "indptr"):
+        return hasattr(result, "indptr") and expected.dtype == result.dtype and (expected != result).nnz == 0
+    return expected.dtype == result.dtype and np.array_equal(expected, result, equal_nan=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="the fused inference plan against the sklearn transform")
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from sensor.inference_plan import compile_transformer
+
+    df = make_aps_dataframe(max(args.rows), seed=args.seed)
+    x = df.drop(columns=TARGET_COLUMN).astype(np.float32)
+    for missing_value_mode in ("impute", "native"):
+        transformer = DataTransformation.get_data_transformer_object(missing_value_mode=missing_value_mode).fit(x)
+        plan = compile_transformer(transformer)
+        columns = list(transformer.feature_names_in_)
+        for rows in args.rows:
+            # the whole input dataframe -- as the batch prediction has it (the target column included)
+            batch = df.iloc[:rows].astype({column: np.float32 for column in columns})
+            expected, result = transformer.transform(batch[columns]), plan.transform(batch)
+            assert same(expected, result), f"the inference plan differs from the transformer ({missing_value_mode}, {rows} rows)"
+            sklearn_time = median_time(lambda: transformer.transform(batch[columns]), args.repeat)
+            plan_time = median_time(lambda: plan.transform(batch), args.repeat)
+            print(f"{missing_value_mode:7s} rows={rows:7d} identical=True sklearn={sklearn_time * 1e3:9.2f}ms "
+                  f"plan={plan_time * 1e3:9.2f}ms speedup={sklearn_time / plan_time:5.2f}x")
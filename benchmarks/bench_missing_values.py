@@ -0,0 +1,70 @@
+# benchmark -- the missing value modes of the transformer (refer "sensor/missing_values.py") on synthetic
+# APS data (refer "sensor/synthetic.py"): "impute" (na -> 0, the default), "native" (na stays np.nan) and
+# "native_sparse" (the same, as a CSR matrix of the observed values -- ie "sparse_threshold" = 0).
+# for every mode: the time of the transformation, the size of the transformed train matrix, the time of the
+# model fit and of the prediction of the test set, and the F1 score on the test set
+#
+# example:
+#   python benchmarks/bench_missing_values.py --rows 60000 600000 --missing 0.1 0.6
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from sensor.components.data_transformation import DataTransformation
+from sensor.config import TARGET_COLUMN
+from sensor.synthetic import make_aps_dataframe
+
+MODES = {"impute": ("impute", None), "native": ("native", None), "native_sparse": ("native", 0.0)}
+
+
+# missing: if given, values are removed at random until this share of the values is missing (the
+# synthetic data has about 12% of missing values)
+def make_frames(rows:int, seed:int, missing:float=None):
+    from sklearn.model_selection import train_test_split
+    df = make_aps_dataframe(rows, seed=seed)
+    x, y = df.drop(columns=TARGET_COLUMN).astype(np.float32), (df[TARGET_COLUMN] == "pos").to_numpy().astype(np.int64)
+    if missing is not None:
+        values = x.to_numpy(copy=True)
+        current = np.isnan(values).mean()
+        if missing > current:
+            drop = np.random.default_rng(seed).random(values.shape) < (missing - current) / (1 - current)
+            values[drop] = np.nan
+            x = pd.DataFrame(values, columns=x.columns, index=x.index)
+    return train_test_split(x, y, test_size=0.2, random_state=42, stratify=y)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="time, memory and F1 of the missing value modes")
+    parser.add_argument("--rows", type=int, nargs="+", default=[60000])
+    parser.add_argument("--missing", type=float, nargs="+", default=[None])
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from sklearn.metrics import f1_score
+    from xgboost import XGBClassifier
+    from sensor.missing_values import matrix_nbytes
+
+    for rows in args.rows:
+        for missing in args.missing:
+            x_train, x_test, y_train, y_test = make_frames(rows, args.seed, missing)
+            print(f"rows={rows} missing={np.isnan(x_train.to_numpy()).mean():.3f}")
+            for mode in args.modes:
+                missing_value_mode, sparse_threshold = MODES[mode]
+                start = time.perf_counter()
+                transformer = DataTransformation.get_data_transformer_object(missing_value_mode=missing_value_mode,
+                                                                             sparse_threshold=sparse_threshold)
+                train, test = transformer.fit_transform(x_train), transformer.transform(x_test)
+                transform_time = time.perf_counter() - start
+
+                start = time.perf_counter()
+                model = XGBClassifier().fit(train, y_train)
+                fit_time = time.perf_counter() - start
+                start = time.perf_counter()
+                y_pred = model.predict(test)
+                predict_time = time.perf_counter() - start
+                print(f"  {mode:<14} transform={transform_time:7.2f}s size={matrix_nbytes(train) / 2**20:8.1f}MB "
+                      f"fit={fit_time:7.2f}s predict={predict_time:6.2f}s f1={f1_score(y_test, y_pred):6.4f}")
@@ -0,0 +1,142 @@
+# benchmark -- the model bundle (refer "sensor/model_bundle.py") against the three dill pickles
+# ("transformer.pkl", "model.pkl", "target_encoder.pkl") on synthetic APS data (refer "sensor/synthetic.py"),
+# for both missing value modes:
+#   parity     -- the plan, the model and the label mapping of the bundle give the same result as the pickled
+#                 objects; a bundle with one changed byte is refused (checksum)
+#   warm load  -- the median time of loading all the objects in a process which has imported everything already
+#                 (the three "load_object" calls against "ModelBundle.load", with and without the booster of
+#                 "model" -- parsing the booster is the same work for both, the pickle of xgboost keeps it
+#                 in the same native format)
+#   cold load  -- a new python process which loads the objects and predicts one row (the imports included):
+#                 the pickles, the bundle with "model" (xgboost), the bundle with its compiled model
+#
+# example:
+#   python benchmarks/bench_model_bundle.py --rows 20000 --engine booster
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from sensor.components.data_transformation import DataTransformation
+from sensor.config import TARGET_COLUMN
+from sensor.schema import SensorSchema
+from sensor.synthetic import make_aps_dataframe
+
+# the script of the cold load -- prints the seconds from its start to the first prediction
+COLD_LOAD_SCRIPTS = {
+    "pickles": """
+from sensor.utils import load_object
+from sensor.inference_plan import compile_transformer
+transformer = load_object(file_path=os.path.join(dir_path, "transformer.pkl"))
+model = load_object(file_path=os.path.join(dir_path, "model.pkl"))
+target_encoder = load_object(file_path=os.path.join(dir_path, "target_encoder.pkl"))
+target_encoder.inverse_transform(model.predict(compile_transformer(transformer).transform(df)))
+""",
+    "bundle": """
+from sensor.model_bundle import ModelBundle
+bundle = ModelBundle.load(file_path=os.path.join(dir_path, "model.bundle"))
+bundle.target_encoder.inverse_transform(bundle.model.predict(bundle.plan.transform(df)))
+""",
+    "bundle+compiled": """
+from sensor.model_bundle import ModelBundle
+bundle = ModelBundle.load(file_path=os.path.join(dir_path, "model.bundle"))
+bundle.target_encoder.inverse_transform(bundle.compiled_model.predict(bundle.plan.transform(df)))
+""",
+}
+
+
+def median_time(function, repeat:int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+def cold_load_time(name:str, dir_path:str, repeat:int) -> float:
+    script = ("import time\nstart = time.perf_counter()\nimport os\nimport pandas as pd\n"
+              f"dir_path = {dir_path!r}\ndf = pd.read_parquet(os.path.join(dir_path, 'row.parquet'))\n"
+              f"{COLD_LOAD_SCRIPTS[name]}\nprint(time.perf_counter() - start)\n")
+    times = [float(subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True,
+                                  cwd=dir_path).stdout.split()[-1]) for _ in range(repeat)]
+    return float(np.median(times))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="the single file model bundle against the three dill pickles")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--engine", default="xgbclassifier")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from sklearn.preprocessing import LabelEncoder
+    from sensor.compiled_model import compile_model
+    from sensor.inference_plan import compile_transformer
+    from sensor.model_bundle import ModelBundle, write_model_bundle
+    from sensor.training_engine import get_training_engine
+    from sensor.utils import load_object, save_object
+
+    df = make_aps_dataframe(args.rows, seed=args.seed)
+    x = df.drop(columns=TARGET_COLUMN).astype(np.float32)
+    target_encoder = LabelEncoder().fit(df[TARGET_COLUMN])
+    y = target_encoder.transform(df[TARGET_COLUMN])
+    schema = SensorSchema.from_dataframe(df)
+    for missing_value_mode in ("impute", "native"):
+        transformer = DataTransformation.get_data_transformer_object(missing_value_mode=missing_value_mode).fit(x)
+        x_arr = transformer.transform(x)
+        model = get_training_engine(args.engine).train(x_arr, y, x_arr, y).model
+
+        with tempfile.TemporaryDirectory() as dir_path:
+            paths = {name: os.path.join(dir_path, f"{name}.pkl") for name in ("transformer", "model", "target_encoder")}
+            save_object(file_path=paths["transformer"], obj=transformer)
+            save_object(file_path=paths["model"], obj=model)
+            save_object(file_path=paths["target_encoder"], obj=target_encoder)
+            bundle_path = os.path.join(dir_path, "model.bundle")
+            assert write_model_bundle(file_path=bundle_path, transformer=transformer, model=model, target_encoder=target_encoder,
+                                      schema=schema, compiled_model=compile_model(model))
+            bundle = ModelBundle.load(file_path=bundle_path)
+
+            # parity
+            batch = df.astype({column: np.float32 for column in transformer.feature_names_in_})
+            expected, result = compile_transformer(transformer).transform(batch), bundle.plan.transform(batch)
+            if hasattr(expected, "indptr"):
+                expected, result = expected.toarray(), result.toarray()
+            assert np.array_equal(expected, result, equal_nan=True), "the plan of the bundle differs from the transformer"
+            labels = model.predict(x_arr)
+            assert np.array_equal(labels, bundle.model.predict(x_arr)), "the model of the bundle differs from the model"
+            assert np.array_equal(labels, bundle.compiled_model.predict(x_arr)), "the compiled model of the bundle differs from the model"
+            assert np.array_equal(target_encoder.inverse_transform(labels), bundle.target_encoder.inverse_transform(labels))
+            assert np.array_equal(y, bundle.target_encoder.transform(df[TARGET_COLUMN]))
+            assert bundle.schema == schema
+            # one changed byte in the middle of the booster
+            corrupt_path = os.path.join(dir_path, "corrupt.bundle")
+            data = bytearray(open(bundle_path, "rb").read())
+            section = bundle.manifest["sections"]["booster"]
+            data[section["offset"] + section["length"] // 2] ^= 0xFF
+            open(corrupt_path, "wb").write(data)
+            try:
+                ModelBundle.load(file_path=corrupt_path)
+                raise AssertionError("a corrupt bundle was loaded")
+            except Exception as e:
+                assert "checksum" in str(e), e
+
+            # load
+            sizes = {name: os.path.getsize(path) for name, path in paths.items()}
+            pickles_time = median_time(lambda: [load_object(file_path=path) for path in paths.values()], args.repeat)
+            bundle_time = median_time(lambda: ModelBundle.load(file_path=bundle_path).model, args.repeat)
+            bundle_lazy_time = median_time(lambda: ModelBundle.load(file_path=bundle_path), args.repeat)
+            df.iloc[:1].to_parquet(os.path.join(dir_path, "row.parquet"))
+            cold = {name: cold_load_time(name, dir_path, args.repeat) for name in COLD_LOAD_SCRIPTS}
+            print(f"{missing_value_mode:7s} parity=True corrupt bundle refused=True pickles={sum(sizes.values())}B "
+                  f"bundle={os.path.getsize(bundle_path)}B (with the compiled model)")
+            print(f"{missing_value_mode:7s} warm load: pickles={pickles_time * 1e3:8.2f}ms bundle={bundle_time * 1e3:8.2f}ms "
+                  f"speedup={pickles_time / bundle_time:5.2f}x bundle without the booster={bundle_lazy_time * 1e3:8.2f}ms")
+            print(f"{missing_value_mode:7s} cold load + 1 row: " +
+                  " ".join(f"{name}={seconds * 1e3:8.1f}ms" for name, seconds in cold.items()))
@@ -0,0 +1,86 @@
+# benchmark -- the registry index of "saved_models" (refer "sensor/model_registry.py") against listing the folder
+# ("os.listdir" + "max(map(int, ...))" -- how "ModelResolver.get_latest_dir_path" used to find the production model):
+#   lookup     -- the median time of "get_latest_dir_path" for every number of versions in "--versions"
+#                 (the index is cached, so a lookup is one "os.stat" of the "CURRENT" pointer)
+#   concurrent -- "--processes" processes push "--pushes" versions each at the same time (lock, next version,
+#                 write the folder, register): every push has to get its own version, and all of them are in the index
+#
+# example:
+#   python benchmarks/bench_model_registry.py --versions 10 1000 10000 --processes 4 --pushes 5
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+import numpy as np
+import yaml
+
+
+def median_time(function, repeat:int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+# the lookup as it was -- the largest folder
+def scan_latest_dir_path(registry_dir:str) -> str:
+    return os.path.join(registry_dir, f"{max(map(int, os.listdir(registry_dir)))}")
+
+
+# one process of the concurrent pushes -- returns the versions it pushed
+def push(registry_dir:str, pushes:int) -> list:
+    from sensor.predictor import ModelResolver
+    resolver, versions = ModelResolver(model_registry=registry_dir), []
+    for _ in range(pushes):
+        with resolver.registry.lock():
+            # the paths are taken first (as the model pusher does) -- then the folder is written
+            version, model_path = int(os.path.basename(resolver.get_latest_save_dir_path())), resolver.get_latest_save_model_path()
+            os.makedirs(os.path.dirname(model_path))
+            with open(model_path, "w") as file_obj:
+                file_obj.write(f"{os.getpid()}")
+            resolver.registry.register(version=version, metrics={"f1_test_score": 1.0})
+        versions.append(version)
+    return versions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="the registry index of saved_models against listing the folder")
+    parser.add_argument("--versions", type=int, nargs="+", default=[10, 1000, 10000])
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--pushes", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    from sensor.predictor import ModelResolver
+
+    for n_versions in args.versions:
+        with tempfile.TemporaryDirectory() as registry_dir:
+            for version in range(n_versions):
+                os.makedirs(os.path.join(registry_dir, f"{version}"))
+            resolver = ModelResolver(model_registry=registry_dir)
+            # a folder pushed before the index existed -- the pointer falls back to the largest folder
+            assert resolver.get_latest_dir_path() == os.path.join(registry_dir, f"{n_versions - 1}")
+            scan_time = median_time(lambda: scan_latest_dir_path(registry_dir), args.repeat)
+            with resolver.registry.lock():
+                resolver.registry.register(version=n_versions - 1)
+            # (the folder has "CURRENT" and "registry.yaml" now -- the old lookup would crash on them)
+            assert resolver.get_latest_dir_path() == os.path.join(registry_dir, f"{n_versions - 1}")
+            index_time = median_time(lambda: resolver.get_latest_dir_path(), args.repeat)
+            print(f"lookup versions={n_versions:6d} listdir={scan_time * 1e6:10.1f}us index={index_time * 1e6:8.1f}us "
+                  f"speedup={scan_time / index_time:8.1f}x")
+
+    with tempfile.TemporaryDirectory() as registry_dir:
+        with multiprocessing.Pool(args.processes) as pool:
+            pushed = sum(pool.starmap(push, [(registry_dir, args.pushes)] * args.processes), [])
+        with open(os.path.join(registry_dir, "registry.yaml"), "r") as file_obj:
+            registered = [entry["version"] for entry in yaml.safe_load(file_obj)["versions"]]
+        expected = list(range(args.processes * args.pushes))
+        assert sorted(pushed) == expected, f"two pushes got the same version: {sorted(pushed)}"
+        assert sorted(registered) == expected, f"a push is missing in the index: {sorted(registered)}"
+        assert ModelResolver(model_registry=registry_dir).get_latest_dir_path() == os.path.join(registry_dir, f"{expected[-1]}")
+        print(f"concurrent processes={args.processes} pushes={len(pushed)} distinct versions=True all registered=True")
@@ -0,0 +1,43 @@
+# benchmark -- reading the sensor collection with one cursor vs. with parallel "_id" partitions
+# it needs a running mongod -- the url is read from "MONGO_DB_URL" (ie the ".env" file)
+#
+# example:
+#   python benchmarks/bench_partitioned_reads.py --database aps --collection sensor --partitions 2 4 8
+
+import argparse
+import time
+
+from sensor.utils import utils
+
+
+def time_it(function, repeat:int):
+    # we take the best of "repeat" runs -- the other runs are mostly noise from the page cache
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="single cursor vs. partitioned reads of a mongodb collection")
+    parser.add_argument("--database", default="aps")
+    parser.add_argument("--collection", default="sensor")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--partitions", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    baseline, df = time_it(lambda: utils.get_collection_as_dataframe(args.database, args.collection), args.repeat)
+    print(f"list(find())               rows={df.shape[0]:>9} time={baseline:8.2f}s")
+
+    streaming, df = time_it(lambda: utils.get_collection_as_dataframe_streaming(
+        args.database, args.collection, batch_size=args.batch_size), args.repeat)
+    print(f"single cursor (streaming)  rows={df.shape[0]:>9} time={streaming:8.2f}s speedup={baseline / streaming:5.2f}x")
+
+    for n_partitions in args.partitions:
+        elapsed, df = time_it(lambda: utils.get_collection_as_dataframe_partitioned(
+            args.database, args.collection, n_partitions=n_partitions, batch_size=args.batch_size), args.repeat)
+        print(f"partitioned (n={n_partitions:<2})         rows={df.shape[0]:>9} time={elapsed:8.2f}s speedup={baseline / elapsed:5.2f}x")
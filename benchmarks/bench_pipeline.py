@@ -0,0 +1,217 @@
+# benchmark -- the whole project, component by component, on synthetic APS data (refer "sensor/synthetic.py")
+# at every scale ("--rows"):
+#   - one synthetic csv is generated (and kept in "--work-dir" for the next runs) -- it is loaded into
+#     mongodb, it is the base file of "data validation" and the input file of the batch prediction
+#   - DataIngestion, DataValidation, DataTransformation, ModelTrainer, ModelEvaluation, ModelPusher and
+#     start_batch_prediction run one after the other in a fresh folder, each one timed (wall, cpu and
+#     peak memory -- refer "sensor/instrumentation.py")
+#   - the results are appended to "--results" (one json line per scale) along with the git commit, so
+#     two commits can be compared later:
+#         python benchmarks/bench_pipeline.py --compare <old commit> <new commit>
+#
+# mongodb: "--mongo-url" (default: MONGO_DB_URL, ie the ".env" file) -- or "--mongomock" (in memory, no
+# server needed, but only sensible for small data)
+#
+# example:
+#   python benchmarks/bench_pipeline.py --rows 60000 600000 6000000
+#   python benchmarks/bench_pipeline.py --rows 60000 --mongomock
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)        # for "data_dump.py"
+
+from sensor import config, instrumentation
+from sensor.synthetic import write_aps_csv
+
+COMPONENTS = ("data_ingestion", "data_validation", "data_transformation", "model_trainer",
+              "model_evaluation", "model_pusher", "batch_prediction")
+DEFAULT_RESULTS_FILE = os.path.join(ROOT_DIR, "benchmarks", "results", "pipeline.jsonl")
+
+
+def git_commit() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        return {"commit": commit, "dirty": len(status) > 0}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+def host_info() -> dict:
+    info = {"platform": platform.platform(), "python": platform.python_version(), "cpu_count": os.cpu_count()}
+    try:
+        import psutil
+        info["memory_mb"] = round(psutil.virtual_memory().total / (1 << 20))
+    except ImportError:
+        pass
+    return info
+
+
+# the synthetic csv of this scale -- generated only once
+def dataset_file(work_dir:str, rows:int, seed:int) -> str:
+    file_path = os.path.join(work_dir, f"aps_synthetic_{rows}_{seed}.csv")
+    if not os.path.exists(file_path):
+        print(f"generating {file_path}")
+        write_aps_csv(file_path, n_rows=rows, seed=seed)
+    return file_path
+
+
+# an empty "aps.sensor" collection with the rows of the csv
+def load_collection(file_path:str, mongo_url, run_dir:str):
+    import data_dump
+    if mongo_url is None:
+        import mongomock
+        import pandas as pd
+        client = mongomock.MongoClient()
+        config._mongo_client, config._mongo_client_pid = client, os.getpid()
+        collection = client[data_dump.DATABASE_NAME][data_dump.COLLECTION_NAME]
+        for batch_number, chunk in enumerate(pd.read_csv(file_path, chunksize=10000, na_values=[data_dump.NA_TOKEN], keep_default_na=False)):
+            collection.insert_many(data_dump.chunk_to_documents(chunk, epoch=int(time.time()), first_row=batch_number * 10000))
+        return
+    config.env_var.mongo_db_url, config._mongo_client = mongo_url, None
+    config.get_mongo_client()[data_dump.DATABASE_NAME].drop_collection(data_dump.COLLECTION_NAME)
+    data_dump.load_csv_to_mongodb(file_path=file_path, mongo_db_url=mongo_url, database_name=data_dump.DATABASE_NAME,
+                                  collection_name=data_dump.COLLECTION_NAME, batch_size=5000, workers=4,
+                                  checkpoint_path=os.path.join(run_dir, "load.checkpoint.json"))
+
+
+# runs every component once -- in a fresh folder (no saved model, no cache), ie a cold run
+def run_components(file_path:str, mongo_url, run_dir:str) -> list:
+    from sensor.entity import config_entity
+    from sensor.components.data_ingestion import DataIngestion
+    from sensor.components.data_validation import DataValidation
+    from sensor.components.data_transformation import DataTransformation
+    from sensor.components.model_trainer import ModelTrainer
+    from sensor.components.model_evaluation import ModelEvaluation
+    from sensor.components.model_pusher import ModelPusher
+    from sensor.pipeline.batch_prediction import start_batch_prediction
+
+    shutil.rmtree(run_dir, ignore_errors=True)
+    os.makedirs(run_dir)
+    os.chdir(run_dir)
+    load_collection(file_path, mongo_url, run_dir)
+    instrumentation.reset_measurements()
+
+    training_pipeline_config = config_entity.TrainingPipelineConfig()
+    artifacts = dict()
+
+    with instrumentation.instrument("bench.data_ingestion"):
+        data_ingestion_config = config_entity.DataIngestionConfig(training_pipeline_config=training_pipeline_config)
+        if mongo_url is None:
+            # the worker processes of a partitioned read cannot see an in-memory collection
+            data_ingestion_config.n_partitions = 1
+        artifacts["data_ingestion"] = DataIngestion(data_ingestion_config).initiate_data_ingestion()
+
+    with instrumentation.instrument("bench.data_validation"):
+        data_validation_config = config_entity.DataValidationConfig(training_pipeline_config=training_pipeline_config)
+        data_validation_config.base_file_path = file_path
+        DataValidation(data_validation_config, artifacts["data_ingestion"]).initiate_data_validation()
+
+    with instrumentation.instrument("bench.data_transformation"):
+        data_transformation_config = config_entity.DataTransformationConfig(training_pipeline_config=training_pipeline_config)
+        artifacts["data_transformation"] = DataTransformation(data_transformation_config, artifacts["data_ingestion"]).initiate_data_transformation()
+
+    with instrumentation.instrument("bench.model_trainer"):
+        model_trainer_config = config_entity.ModelTrainerConfig(training_pipeline_config=training_pipeline_config)
+        artifacts["model_trainer"] = ModelTrainer(model_trainer_config, artifacts["data_transformation"]).initiate_model_trainer()
+
+    with instrumentation.instrument("bench.model_evaluation"):
+        model_eval_config = config_entity.ModelEvaluationConfig(training_pipeline_config=training_pipeline_config)
+        ModelEvaluation(model_eval_config, artifacts["data_ingestion"], artifacts["data_transformation"],
+                        artifacts["model_trainer"]).initiate_model_evaluation()
+
+    with instrumentation.instrument("bench.model_pusher"):
+        model_pusher_config = config_entity.ModelPusherConfig(training_pipeline_config)
+        ModelPusher(model_pusher_config, artifacts["data_transformation"], artifacts["model_trainer"]).initiate_model_pusher()
+
+    with instrumentation.instrument("bench.batch_prediction"):
+        start_batch_prediction(input_file_path=file_path)
+
+    return instrumentation.drain_measurements()
+
+
+def run_benchmark(args):
+    work_dir = os.path.abspath(args.work_dir)
+    os.makedirs(work_dir, exist_ok=True)
+    os.makedirs(os.path.dirname(os.path.abspath(args.results)), exist_ok=True)
+    commit, host = git_commit(), host_info()
+    if args.mongomock:
+        args.mongo_url = None
+
+    for rows in args.rows:
+        file_path = dataset_file(work_dir, rows, args.seed)
+        measurements = run_components(file_path, args.mongo_url, os.path.join(work_dir, f"run_{rows}"))
+        os.chdir(ROOT_DIR)
+        components = {record["name"][len("bench."):]: {"wall_time_s": record["wall_time_s"], "cpu_time_s": record["cpu_time_s"],
+                                                      "peak_rss_mb": record["peak_rss_mb"]}
+                      for record in measurements if record["name"].startswith("bench.")}
+        result = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), **commit, "host": host, "rows": rows, "seed": args.seed,
+                  "mongo": "mongomock" if args.mongo_url is None else "mongodb", "components": components,
+                  "steps": [record for record in measurements if not record["name"].startswith("bench.")]}
+        with open(args.results, "a") as file_obj:
+            file_obj.write(json.dumps(result, default=str) + "\n")
+
+        print(f"rows={rows}")
+        for name in COMPONENTS:
+            component = components[name]
+            print(f"  {name:<22} wall={component['wall_time_s']:9.2f}s cpu={component['cpu_time_s']:9.2f}s "
+                  f"peak_rss={component['peak_rss_mb']:9.1f}MB")
+
+
+# the last result of every (commit, rows) -- "commit" may be a prefix
+def latest_results(results_file:str, commit:str) -> dict:
+    results = dict()
+    with open(results_file, "r") as file_obj:
+        for line in file_obj:
+            result = json.loads(line)
+            if result.get("commit") and result["commit"].startswith(commit):
+                results[result["rows"]] = result
+    return results
+
+
+def compare(args) -> int:
+    base_commit, new_commit = args.compare[0], (args.compare[1] if len(args.compare) > 1 else git_commit()["commit"])
+    base, new = latest_results(args.results, base_commit), latest_results(args.results, new_commit)
+    regressions = 0
+    for rows in sorted(set(base) & set(new)):
+        print(f"rows={rows}  {base_commit[:10]} -> {new_commit[:10]}")
+        for name in COMPONENTS:
+            if name not in base[rows]["components"] or name not in new[rows]["components"]:
+                continue
+            old_wall, new_wall = base[rows]["components"][name]["wall_time_s"], new[rows]["components"][name]["wall_time_s"]
+            old_rss, new_rss = base[rows]["components"][name]["peak_rss_mb"], new[rows]["components"][name]["peak_rss_mb"]
+            ratio = new_wall / max(old_wall, 1e-9)
+            # a regression -- slower than the threshold (very short components are noise, so they are skipped)
+            slower = ratio > 1 + args.threshold and new_wall - old_wall > 0.5
+            regressions += slower
+            print(f"  {name:<22} wall {old_wall:9.2f}s -> {new_wall:9.2f}s ({ratio:5.2f}x)  "
+                  f"peak_rss {old_rss:9.1f}MB -> {new_rss:9.1f}MB{'  REGRESSION' if slower else ''}")
+    if len(set(base) & set(new)) == 0:
+        print(f"no common results of {base_commit} and {new_commit} in {args.results}")
+    return 1 if regressions > 0 else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="end to end benchmark of the components on synthetic APS data")
+    parser.add_argument("--rows", type=int, nargs="+", default=[60000, 600000, 6000000])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mongo-url", default=os.getenv("MONGO_DB_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--mongomock", action="store_true", help="an in-memory collection instead of a mongodb server")
+    parser.add_argument("--work-dir", default=os.path.join(ROOT_DIR, "benchmarks", "work"))
+    parser.add_argument("--results", default=DEFAULT_RESULTS_FILE)
+    parser.add_argument("--compare", nargs="+", metavar="COMMIT", help="compare the results of two commits (default new commit: HEAD)")
+    parser.add_argument("--threshold", type=float, default=0.1, help="slower by more than this fraction => regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(compare(args))
+    run_benchmark(args)
@@ -0,0 +1,52 @@
+# benchmark -- the rebalancing strategies (refer "sensor/rebalancing.py") on synthetic APS data (refer
+# "sensor/synthetic.py"): the time of "fit_resample" on the train set, the time of the model fit on
+# what it returned, and the F1 score of the model on an untouched (not resampled) test set
+#
+# example:
+#   python benchmarks/bench_rebalancing.py --rows 60000 600000 --strategies approximate_smote class_weight
+
+import argparse
+import time
+
+import numpy as np
+
+from sensor.components.data_transformation import DataTransformation
+from sensor.config import TARGET_COLUMN
+from sensor.rebalancing import REBALANCERS, get_rebalancer
+from sensor.synthetic import make_aps_dataframe
+
+
+def make_arrays(rows:int, seed:int):
+    from sklearn.model_selection import train_test_split
+    df = make_aps_dataframe(rows, seed=seed)
+    x, y = df.drop(columns=TARGET_COLUMN).astype(np.float32), (df[TARGET_COLUMN] == "pos").to_numpy().astype(np.int64)
+    x_train, x_test, y_train, y_test = train_test_split(x, y, test_size=0.2, random_state=42, stratify=y)
+    transformer = DataTransformation.get_data_transformer_object().fit(x_train)
+    return transformer.transform(x_train), transformer.transform(x_test), y_train, y_test
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="time and F1 of the rebalancing strategies")
+    parser.add_argument("--rows", type=int, nargs="+", default=[60000])
+    parser.add_argument("--strategies", nargs="+", default=list(REBALANCERS), choices=list(REBALANCERS))
+    parser.add_argument("--n-jobs", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from sklearn.metrics import f1_score
+    from xgboost import XGBClassifier
+
+    for rows in args.rows:
+        x_train, x_test, y_train, y_test = make_arrays(rows, args.seed)
+        print(f"rows={rows} train={x_train.shape[0]} (pos={y_train.sum()}) test={x_test.shape[0]} (pos={y_test.sum()})")
+        for strategy in args.strategies:
+            rebalancer = get_rebalancer(strategy, n_jobs=args.n_jobs)
+            start = time.perf_counter()
+            x, y, sample_weight = rebalancer.fit_resample(x_train, y_train)
+            resample_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            model = XGBClassifier().fit(x, y, sample_weight=sample_weight)
+            fit_time = time.perf_counter() - start
+            f1 = f1_score(y_test, model.predict(x_test))
+            print(f"  {strategy:<20} resample={resample_time:8.2f}s fit={fit_time:8.2f}s rows={x.shape[0]:>9} f1={f1:6.4f}")
@@ -0,0 +1,65 @@
+# benchmark -- the training engines (refer "sensor/training_engine.py") on synthetic APS data (refer
+# "sensor/synthetic.py"): the time of "train" (the fit AND the F1 scores of train and test), the number of
+# rounds, the F1 scores, and the speedup against the current defaults ("XGBClassifier()" + 2 predictions)
+#
+# example:
+#   python benchmarks/bench_training.py --rows 60000 600000 --n-jobs 4
+
+import argparse
+import time
+
+import numpy as np
+
+from sensor.components.data_transformation import DataTransformation
+from sensor.config import TARGET_COLUMN
+from sensor.synthetic import make_aps_dataframe
+
+# name -> (engine, params)
+SETUPS = {
+    "defaults": ("xgbclassifier", {}),
+    # the default tree method of the xgboost in "requirements.txt" (1.6) for less than 2^22 rows -- since
+    # xgboost 2.0 the default is "hist"
+    "defaults_xgboost_1.6": ("xgbclassifier", {"tree_method": "exact"}),
+    "booster_hist": ("booster", {"tree_method": "hist"}),
+    "booster_hist_no_early_stopping": ("booster", {"tree_method": "hist", "early_stopping_rounds": None}),
+    "booster_approx": ("booster", {"tree_method": "approx"}),
+}
+
+
+def make_arrays(rows:int, seed:int):
+    from sklearn.model_selection import train_test_split
+    df = make_aps_dataframe(rows, seed=seed)
+    x, y = df.drop(columns=TARGET_COLUMN).astype(np.float32), (df[TARGET_COLUMN] == "pos").to_numpy().astype(np.int64)
+    x_train, x_test, y_train, y_test = train_test_split(x, y, test_size=0.2, random_state=42, stratify=y)
+    transformer = DataTransformation.get_data_transformer_object().fit(x_train)
+    return transformer.transform(x_train), transformer.transform(x_test), y_train, y_test
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="time and F1 of the training engines")
+    parser.add_argument("--rows", type=int, nargs="+", default=[60000])
+    parser.add_argument("--setups", nargs="+", default=list(SETUPS), choices=list(SETUPS))
+    parser.add_argument("--n-jobs", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from sensor.training_engine import get_training_engine
+
+    for rows in args.rows:
+        x_train, x_test, y_train, y_test = make_arrays(rows, args.seed)
+        print(f"rows={rows} train={x_train.shape[0]} (pos={y_train.sum()}) test={x_test.shape[0]} (pos={y_test.sum()})")
+        # the times of the "defaults" setups -- every setup is compared with each of them
+        baselines = dict()
+        for setup in args.setups:
+            engine, params = SETUPS[setup]
+            # the defaults are the old behaviour -- ie no thread setting either
+            n_jobs = None if setup.startswith("defaults") else args.n_jobs
+            start = time.perf_counter()
+            result = get_training_engine(engine, params=params, n_jobs=n_jobs).train(x_train, y_train, x_test, y_test)
+            train_time = time.perf_counter() - start
+            if setup.startswith("defaults"):
+                baselines[setup] = train_time
+            rounds = "-" if not result.evals_result else len(result.evals_result["train"]["f1"])
+            speedup = "".join(f" vs {name}={baseline / train_time:5.2f}x" for name, baseline in baselines.items())
+            print(f"  {setup:<31} time={train_time:7.2f}s rounds={rounds:>4} f1 train={result.f1_train_score:6.4f} "
+                  f"test={result.f1_test_score:6.4f}{speedup}")
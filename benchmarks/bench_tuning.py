@@ -0,0 +1,66 @@
+# benchmark -- the hyperparameter tuning (refer "sensor/tuning.py") on synthetic APS data (refer
+# "sensor/synthetic.py"): the time of every strategy, the number of trials, the validation logloss and F1
+# score of the best configuration, the F1 score on the test set of a model trained with it (against the
+# defaults of xgboost), and the time of a second, resumed run (every trial read from the cache)
+#
+# example:
+#   python benchmarks/bench_tuning.py --rows 60000 --n-candidates 27 --max-workers 4
+
+import argparse
+import os
+import tempfile
+import time
+
+from sensor import utils
+from sensor.components.data_transformation import DataTransformation
+from sensor.config import TARGET_COLUMN
+from sensor.synthetic import make_aps_dataframe
+
+STRATEGIES = ["successive_halving", "hyperband"]
+
+
+# the transformed train set is written the same way as by the data transformation -- the tuner reads it from there
+def make_dataset(rows:int, seed:int, dir_path:str):
+    import numpy as np
+    from sklearn.model_selection import train_test_split
+    df = make_aps_dataframe(rows, seed=seed)
+    x, y = df.drop(columns=TARGET_COLUMN).astype(np.float32), (df[TARGET_COLUMN] == "pos").to_numpy().astype(np.int64)
+    x_train, x_test, y_train, y_test = train_test_split(x, y, test_size=0.2, random_state=42, stratify=y)
+    transformer = DataTransformation.get_data_transformer_object().fit(x_train)
+    x_train, x_test = transformer.transform(x_train), transformer.transform(x_test)
+    utils.save_transformed_dataset(dir_path=dir_path, features=x_train, labels=y_train)
+    return x_train, x_test, y_train, y_test
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="time and quality of the hyperparameter tuning strategies")
+    parser.add_argument("--rows", type=int, default=60000)
+    parser.add_argument("--strategies", nargs="+", default=STRATEGIES, choices=STRATEGIES)
+    parser.add_argument("--n-candidates", type=int, default=27)
+    parser.add_argument("--max-workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from sensor.training_engine import get_training_engine
+    from sensor.tuning import HyperparameterTuner
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dataset_path = os.path.join(tmp_dir, "train")
+        x_train, x_test, y_train, y_test = make_dataset(args.rows, args.seed, dataset_path)
+        print(f"rows={args.rows} train={x_train.shape[0]} (pos={y_train.sum()}) test={x_test.shape[0]} (pos={y_test.sum()})")
+        result = get_training_engine("xgbclassifier").train(x_train, y_train, x_test, y_test)
+        print(f"  {'defaults':<19} f1 test={result.f1_test_score:6.4f}")
+
+        for strategy in args.strategies:
+            cache_dir = os.path.join(tmp_dir, f"cache_{strategy}")
+            times = []
+            for _ in range(2):
+                tuner = HyperparameterTuner(dataset_path=dataset_path, strategy=strategy, n_candidates=args.n_candidates,
+                                            max_workers=args.max_workers, cache_dir=cache_dir)
+                start = time.perf_counter()
+                tuning_result = tuner.tune()
+                times.append(time.perf_counter() - start)
+            best = tuning_result.best_trial
+            result = get_training_engine("xgbclassifier", params=best.params).train(x_train, y_train, x_test, y_test)
+            print(f"  {strategy:<19} time={times[0]:7.2f}s resumed={times[1]:6.2f}s trials={len(tuning_result.trials):>3} "
+                  f"validation logloss={best.logloss:.5f} f1={best.f1:6.4f} f1 test={result.f1_test_score:6.4f}")
@@ -1,48 +1,171 @@
-# This py file is used to dump our csv file into MongoDB (in the form of 'json' files)
-# Each row (from csv) is converted into a file (json file) inside MongoDB
+# This py file is used to dump our csv file into MongoDB
+# Each row (from csv) is converted into a document inside MongoDB
 
-import pymongo
-import pandas as pd
-import json
+# Earlier, we read the whole csv and converted it with "json.loads(df.T.to_json())" -- ie we transposed
+# the whole dataframe and sent everything through one big json string before a single "insert_many".
+# For a few million rows that is very slow and needs a lot of memory.
+# So now:
+#   - the csv is read in chunks ("--batch-size" rows at a time) -- one chunk = one "insert_many" batch
+#   - the rows are converted to documents directly from the column arrays (no json in between)
+#   - the batches are inserted with unordered "insert_many" by a small pool of worker threads
+#   - the progress (rows and rows/sec) is printed, and the finished batches are written into a
+#     checkpoint file -- if the load fails, running the same command again resumes from there
+#
+# example:
+#   python data_dump.py --file aps_failure_training_set1.csv --workers 4 --batch-size 5000
 
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
-# Provide the mongodb localhost url to connect python to mongodb
-client = pymongo.MongoClient("mongodb://localhost:27017")
+import pandas as pd
+import pymongo
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
 
 
 DATABASE_NAME = "aps"
 COLLECTION_NAME = "sensor"
-DATAFILE_PATH = r"E:\E\DATA SCIENCE INEURON\Machine Learning Projects (Industry Grade Projects)\1) Sensor Fault Detection\aps_failure_training_set1.csv"          
+DATAFILE_PATH = r"E:\E\DATA SCIENCE INEURON\Machine Learning Projects (Industry Grade Projects)\1) Sensor Fault Detection\aps_failure_training_set1.csv"
+NA_TOKEN = "na"
+DUPLICATE_KEY_ERROR = 11000
 
 
-if __name__ == "__main__":
-    df = pd.read_csv(DATAFILE_PATH)
-    print(f"Rows and Columns: {df.shape}") # Just to see how many rows and columns are there in our data 
+# every document gets an "_id" which is built from the start time of the load and the row number
+# ie the same row always gets the same "_id" -- so when a batch is inserted again after a failure,
+# the rows which were already inserted are rejected as duplicates (instead of being inserted twice)
+# the "_id" values also increase with the row number -- so the ingestion watermark keeps working
+def make_object_id(epoch:int, row_number:int) -> ObjectId:
+    return ObjectId(struct.pack(">IQ", epoch, row_number))
+
+
+# converts one chunk of the csv into a list of documents -- column by column (no json, no transpose)
+# the missing values are written back as "na" -- the same as in the documents which are already there
+def chunk_to_documents(chunk:pd.DataFrame, epoch:int, first_row:int) -> list:
+    columns = list(chunk.columns)
+    values = []
+    for column in columns:
+        column_values = chunk[column].to_numpy(dtype=object)
+        column_values[pd.isna(column_values)] = NA_TOKEN
+        values.append(column_values.tolist())
+    documents = []
+    for offset, row in enumerate(zip(*values)):
+        document = {"_id": make_object_id(epoch, first_row + offset)}
+        document.update(zip(columns, row))
+        documents.append(document)
+    return documents
+
+
+def insert_batch(collection, documents:list) -> int:
+    try:
+        collection.insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        # duplicates are fine -- ie this batch was (partly) inserted by an earlier run
+        errors = e.details.get("writeErrors", [])
+        if any(error.get("code") != DUPLICATE_KEY_ERROR for error in errors):
+            raise
+    return len(documents)
 
-# Let us drop the indexes ie row indexes or row numbers
-# and inplace = True -- means it is overwitten permanently in that df itself; no new df created               
-    df.reset_index(drop = True, inplace=True)
 
+# the checkpoint is a small json file -- which batches are done, and the "epoch" used for the "_id"s
+def read_checkpoint(checkpoint_path:str, file_path:str, batch_size:int) -> dict:
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path, "r") as file_obj:
+            checkpoint = json.load(file_obj)
+        if checkpoint["file_path"] == os.path.abspath(file_path) and checkpoint["batch_size"] == batch_size:
+            return checkpoint
+        print(f"checkpoint {checkpoint_path} belongs to another file or batch size -- starting again")
+    return {"file_path": os.path.abspath(file_path), "batch_size": batch_size,
+            "epoch": int(time.time()), "done_batches": [], "finished": False}
 
 
-# Now let us convert the dataframe into json files - so that we can dump these json files into mongodb
+def write_checkpoint(checkpoint_path:str, checkpoint:dict):
+    tmp_path = f"{checkpoint_path}.tmp"
+    with open(tmp_path, "w") as file_obj:
+        json.dump(checkpoint, file_obj)
+    os.replace(tmp_path, checkpoint_path)
 
 
-# we have to take "Transpose" of the df and then apply "to_json" inbuilt function
-# and then we use "json.loads()" - so that any new object, is loaded as json file itself 
-# and then we use ".values()" - so that we get all in the form of values only
-# and then we will store this overall - as a list
-# to use this "to_json()", we have imported "json" library in the beginnning 
-    json_record = list(json.loads(df.T.to_json()).values())    
-    print(json_record[9])    # Let us print one element of the list - Just to see how it looks
-                         # This one record represents one row from csv file = one json file 
+def load_csv_to_mongodb(file_path:str, mongo_db_url:str, database_name:str, collection_name:str,
+                        batch_size:int=5000, workers:int=4, checkpoint_path:str=None) -> int:
+    checkpoint_path = checkpoint_path or f"{file_path}.checkpoint.json"
+    checkpoint = read_checkpoint(checkpoint_path, file_path, batch_size)
+    if checkpoint["finished"]:
+        print(f"{file_path} is already loaded (remove {checkpoint_path} to load it again)")
+        return 0
+    done_batches = set(checkpoint["done_batches"])
 
-# Now that we have our json records, we have to now insert these json records inside mongodb
-    client[DATABASE_NAME][COLLECTION_NAME].insert_many(json_record)
+    # the batches 0, 1, ..., n-1 which are all done do not even have to be parsed again
+    done_prefix = 0
+    while done_prefix in done_batches:
+        done_prefix += 1
+    skip_rows = range(1, done_prefix * batch_size + 1) if done_prefix > 0 else None
+
+    client = pymongo.MongoClient(mongo_db_url)
+    collection = client[database_name][collection_name]
+
+    # "na" is read as NaN -- so the numeric columns are parsed as numbers straight away
+    reader = pd.read_csv(file_path, chunksize=batch_size, skiprows=skip_rows,
+                         na_values=[NA_TOKEN], keep_default_na=False)
+
+    start_time = time.perf_counter()
+    inserted_rows = 0
+    pending = dict()
+
+    # a finished batch is written into the checkpoint only after its "insert_many" returned
+    def collect(futures):
+        nonlocal inserted_rows
+        for future in futures:
+            batch_number = pending.pop(future)
+            inserted_rows += future.result()
+            done_batches.add(batch_number)
+        checkpoint["done_batches"] = sorted(done_batches)
+        write_checkpoint(checkpoint_path, checkpoint)
+        elapsed = time.perf_counter() - start_time
+        print(f"\rinserted {inserted_rows} rows in {elapsed:.1f}s ({inserted_rows / max(elapsed, 1e-9):,.0f} rows/sec)", end="")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for batch_number, chunk in enumerate(reader, start=done_prefix):
+            if batch_number in done_batches:
+                continue
+            documents = chunk_to_documents(chunk, epoch=checkpoint["epoch"], first_row=batch_number * batch_size)
+            pending[pool.submit(insert_batch, collection, documents)] = batch_number
+
+            # at most 2 batches per worker are waiting -- so the memory stays bounded
+            if len(pending) >= 2 * workers:
+                finished, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                collect(finished)
+
+        if len(pending) > 0:
+            finished, _ = wait(list(pending))
+            collect(finished)
+
+    checkpoint["finished"] = True
+    write_checkpoint(checkpoint_path, checkpoint)
+    print()
+    return inserted_rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="load the sensor csv file into mongodb")
+    parser.add_argument("--file", default=DATAFILE_PATH, help="csv file to load")
+    parser.add_argument("--url", default=os.getenv("MONGO_DB_URL", "mongodb://localhost:27017"), help="mongodb url")
+    parser.add_argument("--database", default=DATABASE_NAME)
+    parser.add_argument("--collection", default=COLLECTION_NAME)
+    parser.add_argument("--batch-size", type=int, default=5000, help="rows per insert_many batch")
+    parser.add_argument("--workers", type=int, default=4, help="number of insert threads")
+    parser.add_argument("--checkpoint", default=None, help="checkpoint file (default: <file>.checkpoint.json)")
+    args = parser.parse_args()
 
-'''
-Now that we have inserted the json_records inside our mongodb, we can now see a new folder 
-named as "aps" -- inside it, we have a folder named "sensor" -- inside this,
-we have 36k "Documents" -- ie each row/line in csv = is now converted into a separate
-json document
-'''      
\ No newline at end of file
+    try:
+        rows = load_csv_to_mongodb(file_path=args.file, mongo_db_url=args.url, database_name=args.database,
+                                   collection_name=args.collection, batch_size=args.batch_size,
+                                   workers=args.workers, checkpoint_path=args.checkpoint)
+        print(f"Rows inserted: {rows}")
+    except Exception as e:
+        print(f"\nload failed: {e} -- run the same command again to resume")
+        sys.exit(1)
@@ -56,10 +56,18 @@ from sensor.pipeline.training_pipeline import start_training_pipeline
 print(__name__)
 if __name__=="__main__":
      try:
-          
+          # --resume-from model_evaluation  => the stages before "model_evaluation" are loaded from the
+          # last artifacts folder (or "--artifact-dir") instead of being run again
+          import argparse
+          from sensor.pipeline.training_pipeline import STAGES
+          parser = argparse.ArgumentParser(description="run the training pipeline")
+          parser.add_argument("--resume-from", choices=STAGES, default=None, help="stage to resume the pipeline from")
+          parser.add_argument("--artifact-dir", default=None, help="artifacts folder to resume (default: the latest one)")
+          args = parser.parse_args()
+
           # we will start the training pipeline
           # we will call the "start_training_pipeline()" from the file "training_pipeline.py" inside the "pipeline" folder
-          start_training_pipeline()
+          start_training_pipeline(resume_from=args.resume_from, artifact_dir=args.artifact_dir)
 
      except Exception as e:
           print(e)
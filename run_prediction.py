@@ -12,14 +12,20 @@ file_path="/config/workspace/aps_failure_training_set1.csv"
 
 print(__name__)
 if __name__=="__main__":
+    # the input file can also be given on the command line -- eg: python run_prediction.py sensor1.csv
+    # (importing the prediction pipeline is cheap -- mongodb, sklearn and xgboost are only loaded
+    # when they are really needed, refer the file "config.py" inside the "sensor" folder)
+    import argparse
+    parser = argparse.ArgumentParser(description="batch prediction on a sensor file")
+    parser.add_argument("input_file_path", nargs="?", default=file_path)
+    args = parser.parse_args()
      
     try:
           
           # we will start the batch prediction pipeline
           # we will call the "start_batch_prediction()" from the file "batch_prediction.py" inside the "pipeline" folder
-          output_file = start_batch_prediction(input_file_path=file_path)
+          output_file = start_batch_prediction(input_file_path=args.input_file_path)
           print(output_file)
 
     except Exception as e:
           print(e)      
-          
\ No newline at end of file
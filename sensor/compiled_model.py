@@ -0,0 +1,276 @@
+'''
+The batch prediction and the model evaluation load "model.pkl" with dill and call "predict" of the
+"XGBClassifier" (or "BoosterClassifier") -- every call goes through the sklearn wrapper and builds a new
+matrix for xgboost, which is most of the time of a small batch; and a dill pickle of a booster cannot be
+shared between processes without every process unpickling (copying) it.
+
+The task of the file "compiled_model.py" is the "compiled" model -- the boosted trees flattened into a few
+contiguous numpy arrays (one entry per node of every tree, every tree laid out level by level):
+    feature    -- int64, the column which the node splits on -- plus "n_features" if the missing values
+                  (np.nan) go to the right child
+    threshold  -- float32, the rows with "value >= threshold" go to the right child (np.nan for a leaf)
+    left       -- int64, the left child (the index of the node in the arrays) -- the right child is always
+                  "left + 1"; a leaf points to itself
+    leaf_value -- float32, the value of a leaf (0 for a split)
+    roots      -- int64, the index of the root of every tree
+(the indices are int64 -- the type "np.take" gathers with, so the evaluator converts nothing)
+and an evaluator which walks all the trees for a batch of rows at once -- one vectorized step per level
+of the trees, "node = left[node] + (value >= threshold[node])" -- and adds the leaf values up like xgboost
+does (float32, tree by tree, starting from the base margin), so "predict" gives exactly the same labels as
+the model (the margins are the same bit for bit).
+The missing values need no branch: the batch is evaluated as two copies side by side -- np.nan as -inf
+(goes left at every split) and np.nan as +inf (goes right) -- and "feature" picks the copy of the default
+direction of the node.
+
+The model pusher exports it next to "model.pkl" ("compiled_model/", refer "ModelResolver" in
+"predictor.py"); every array is a ".npy" file, so it is loaded memory mapped -- the processes which load
+it share the same pages of the page cache.
+
+Only the models of "gbtree" with the "binary:logistic" objective and numerical splits are compiled (the
+models of "training_engine.py"); for the others "compile_model" returns None, and the prediction keeps
+using "model.pkl".
+
+(refer "benchmarks/bench_compiled_model.py" -- the evaluator is single threaded numpy: it is faster than
+"predict" of xgboost for the small batches, where the call itself is most of the time, but slower for the
+large ones; so the batch prediction uses it for the small input files only)
+'''
+
+import os
+import sys
+import json
+import yaml
+import numpy as np
+from typing import Optional
+from sensor.exception import SensorException
+from sensor.logger import logging
+
+COMPILED_MODEL_META_FILE_NAME = "compiled_model.yaml"
+COMPILED_MODEL_ARRAYS = {"feature": np.int64, "threshold": np.float32, "left": np.int64, "leaf_value": np.float32,
+                         "roots": np.int64}
+
+
+class CompiledTreeEnsemble:
+
+    # base_margin: the margin (log odds) before the first tree; max_depth: the deepest leaf of all the trees
+    # batch_size: the rows which are evaluated at once (every step of a batch works on rows x trees nodes) --
+    #             512 rows keep the batch (2 x 170 float32 columns per row) in the cache of the cpu
+    def __init__(self, feature:np.ndarray, threshold:np.ndarray, left:np.ndarray, leaf_value:np.ndarray,
+                 roots:np.ndarray, base_margin:float, n_features:int, max_depth:int, batch_size:int=512):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.leaf_value = leaf_value
+        self.roots = roots
+        self.base_margin = np.float32(base_margin)
+        self.n_features = n_features
+        self.max_depth = max_depth
+        self.batch_size = batch_size
+        self.classes_ = np.array([0, 1])
+
+    @property
+    def n_trees(self) -> int:
+        return self.roots.shape[0]
+
+    # the rows [start, stop) of x as the two copies side by side -- (rows, 2 * n_features) float32, np.nan as
+    # -inf and as +inf; a CSR matrix (refer "missing_values.py") has np.nan where it has no value, the same as
+    # xgboost reads it
+    def _batch(self, x, start:int, stop:int) -> np.ndarray:
+        batch = np.empty((stop - start, 2 * self.n_features), dtype=np.float32)
+        if hasattr(x, "indptr"):
+            coo = x[start:stop].tocoo()
+            batch[:, :self.n_features] = -np.inf
+            batch[:, self.n_features:] = np.inf
+            batch[coo.row, coo.col] = coo.data
+            batch[coo.row, coo.col + self.n_features] = coo.data
+            return batch
+        # "fmax"/"fmin" take the other value where one is np.nan
+        dense = np.asarray(x[start:stop], dtype=np.float32)
+        np.fmax(dense, np.float32(-np.inf), out=batch[:, :self.n_features])
+        np.fmin(dense, np.float32(np.inf), out=batch[:, self.n_features:])
+        return batch
+
+    # the leaf of every tree for every row -- (rows, trees)
+    # every step is a few "np.take" (flat gathers) into buffers which are reused from level to level
+    def _leaves(self, batch:np.ndarray) -> np.ndarray:
+        shape = (batch.shape[0], self.n_trees)
+        feature, threshold, left = np.asarray(self.feature), np.asarray(self.threshold), np.asarray(self.left)
+        nodes = np.empty(shape, dtype=np.int64)
+        nodes[:] = self.roots
+        # the first value of every row in the flat batch
+        row_offsets = (np.arange(batch.shape[0], dtype=np.int64) * batch.shape[1])[:, None]
+        flat_batch = batch.ravel()
+        index, value, node_threshold = np.empty(shape, dtype=np.int64), np.empty(shape, dtype=np.float32), np.empty(shape, dtype=np.float32)
+        go_right = np.empty(shape, dtype=np.bool_)
+        # a leaf points to itself (and "value >= np.nan" is False) -- so the rows which reached a leaf stay
+        # there until the deepest leaf is reached
+        for _ in range(self.max_depth):
+            np.take(feature, nodes, out=index)
+            index += row_offsets
+            np.take(flat_batch, index, out=value)
+            np.take(threshold, nodes, out=node_threshold)
+            np.greater_equal(value, node_threshold, out=go_right)
+            np.take(left, nodes, out=nodes)
+            nodes += go_right
+        return nodes
+
+    # the margin (log odds of the "pos" class) of every row -- float32, like xgboost
+    def predict_margin(self, x) -> np.ndarray:
+        try:
+            if x.ndim != 2 or x.shape[1] != self.n_features:
+                raise Exception(f"the compiled model takes {self.n_features} columns, got the shape {x.shape}")
+            margin = np.empty(x.shape[0], dtype=np.float32)
+            for start in range(0, x.shape[0], self.batch_size):
+                stop = min(start + self.batch_size, x.shape[0])
+                values = np.empty((stop - start, self.n_trees + 1), dtype=np.float32)
+                values[:, 0] = self.base_margin
+                np.take(np.asarray(self.leaf_value), self._leaves(self._batch(x, start, stop)), out=values[:, 1:])
+                # "cumsum" adds tree by tree -- the same order of the float32 additions as xgboost ("sum" would
+                # add pairwise)
+                margin[start:stop] = np.cumsum(values, axis=1, dtype=np.float32)[:, -1]
+            return margin
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    # the sigmoid of xgboost ("common::Sigmoid") in float32 -- "exp" in float64 and rounded to float32 is what
+    # "expf" of the C library gives (the float32 "exp" of numpy is off by one bit for a quarter of the values);
+    # the probabilities are the same as those of xgboost up to the last bit of a few of them
+    def predict_proba(self, x) -> np.ndarray:
+        margin = self.predict_margin(x)
+        exp = np.exp(np.minimum(-margin, np.float32(88.7)).astype(np.float64)).astype(np.float32)
+        probability = np.float32(1) / (exp + np.float32(1))
+        return np.column_stack([1 - probability, probability])
+
+    def predict(self, x) -> np.ndarray:
+        return (self.predict_proba(x)[:, 1] > 0.5).astype(np.int64)
+
+    def save(self, dir_path:str):
+        try:
+            from sensor.utils import save_numpy_array_data, write_yaml_file
+            os.makedirs(dir_path, exist_ok=True)
+            for name, dtype in COMPILED_MODEL_ARRAYS.items():
+                save_numpy_array_data(file_path=os.path.join(dir_path, f"{name}.npy"),
+                                      array=np.ascontiguousarray(getattr(self, name), dtype=dtype))
+            write_yaml_file(file_path=os.path.join(dir_path, COMPILED_MODEL_META_FILE_NAME),
+                            data={"base_margin": float(self.base_margin), "n_features": int(self.n_features),
+                                  "max_depth": int(self.max_depth), "n_trees": int(self.n_trees)})
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    # mmap_mode: "r" => the arrays are memory mapped (None => read into memory)
+    @classmethod
+    def load(cls, dir_path:str, mmap_mode:Optional[str]="r", batch_size:int=512) -> "CompiledTreeEnsemble":
+        try:
+            from sensor.utils import load_numpy_array_data
+            with open(os.path.join(dir_path, COMPILED_MODEL_META_FILE_NAME), "r") as file_obj:
+                meta = yaml.safe_load(file_obj)
+            arrays = {name: load_numpy_array_data(file_path=os.path.join(dir_path, f"{name}.npy"), mmap_mode=mmap_mode)
+                      for name in COMPILED_MODEL_ARRAYS}
+            return cls(**arrays, base_margin=meta["base_margin"], n_features=meta["n_features"],
+                       max_depth=meta["max_depth"], batch_size=batch_size)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+# the booster of a trained model and the number of rounds which its "predict" uses -- (booster, rounds),
+# rounds None => all the rounds; (None, None) => not a model of xgboost
+def get_model_booster(model) -> tuple:
+    import xgboost as xgb
+    from sensor.training_engine import BoosterClassifier
+    if isinstance(model, BoosterClassifier):
+        booster = model.booster
+        n_rounds = None if model.best_iteration is None else model.best_iteration + 1
+    elif isinstance(model, xgb.XGBModel):
+        booster = model.get_booster()
+        # "XGBClassifier.predict" stops at the best iteration, if the model was trained with early stopping
+        try:
+            n_rounds = model.best_iteration + 1
+        except AttributeError:
+            n_rounds = None
+    else:
+        return None, None
+    return booster, n_rounds
+
+
+# one tree of the json model of xgboost -- laid out level by level from the root, with the two children of
+# every split next to each other (the unused nodes of xgboost are dropped); offset: the index of its root
+# returns (feature, threshold, left, leaf_value, depth) -- None if np.nan as -inf/+inf would not go to the
+# default child (a split on an infinite threshold)
+def _flatten_tree(tree:dict, n_features:int, offset:int) -> tuple:
+    children = list(zip(tree["left_children"], tree["right_children"]))
+    order, depth, level = [0], 0, [0]
+    while True:
+        level = [child for node in level if children[node][0] != -1 for child in children[node]]
+        if len(level) == 0:
+            break
+        order.extend(level)
+        depth += 1
+    position = {node: index for index, node in enumerate(order)}
+
+    feature = np.zeros(len(order), dtype=np.int64)
+    threshold = np.full(len(order), np.nan, dtype=np.float32)
+    left = np.arange(offset, offset + len(order), dtype=np.int64)
+    leaf_value = np.zeros(len(order), dtype=np.float32)
+    for index, node in enumerate(order):
+        # a leaf keeps its value in "split_conditions"
+        condition = np.float32(tree["split_conditions"][node])
+        if children[node][0] == -1:
+            leaf_value[index] = condition
+            continue
+        if not np.isfinite(condition):
+            return None
+        feature[index] = tree["split_indices"][node] + (0 if tree["default_left"][node] else n_features)
+        threshold[index] = condition
+        left[index] = offset + position[children[node][0]]
+    return feature, threshold, left, leaf_value, depth
+
+
+# the compiled model of an "XGBClassifier" or a "BoosterClassifier" (refer "training_engine.py") -- None if the
+# model cannot be compiled
+def compile_model(model) -> Optional[CompiledTreeEnsemble]:
+    try:
+        booster, n_rounds = get_model_booster(model)
+        if booster is None:
+            logging.info(f"cannot compile a model of type {type(model).__name__}")
+            return None
+        learner = json.loads(booster.save_raw(raw_format="json"))["learner"]
+        objective = learner["objective"]["name"]
+        gradient_booster = learner["gradient_booster"]
+        if gradient_booster["name"] != "gbtree" or objective != "binary:logistic":
+            logging.info(f"cannot compile a model of booster {gradient_booster['name']} and objective {objective}")
+            return None
+        trees = gradient_booster["model"]["trees"]
+        # the rounds after the best one are not used
+        if n_rounds is not None:
+            trees = trees[:n_rounds * int(gradient_booster["model"]["gbtree_model_param"]["num_parallel_tree"])]
+
+        # the base score is kept as a probability ("5E-1", or "[5E-1]" since xgboost 2) -- its margin, in float32
+        base_score = np.float32(learner["learner_model_param"]["base_score"].strip("[]"))
+        base_margin = -np.log(np.float32(1) / base_score - np.float32(1))
+
+        n_features = int(learner["learner_model_param"]["num_feature"])
+        feature, threshold, left, leaf_value, roots, max_depth = [], [], [], [], [], 0
+        offset = 0
+        for tree in trees:
+            flat_tree = None
+            if all(split_type == 0 for split_type in tree.get("split_type", [])):
+                flat_tree = _flatten_tree(tree, n_features, offset)
+            if flat_tree is None:
+                logging.info(f"cannot compile a model with categorical splits or infinite thresholds")
+                return None
+            tree_feature, tree_threshold, tree_left, tree_leaf_value, tree_depth = flat_tree
+            feature.append(tree_feature)
+            threshold.append(tree_threshold)
+            left.append(tree_left)
+            leaf_value.append(tree_leaf_value)
+            roots.append(offset)
+            max_depth = max(max_depth, tree_depth)
+            offset += tree_left.shape[0]
+
+        compiled = CompiledTreeEnsemble(feature=np.concatenate(feature), threshold=np.concatenate(threshold),
+                                        left=np.concatenate(left), leaf_value=np.concatenate(leaf_value),
+                                        roots=np.asarray(roots, dtype=np.int64), base_margin=base_margin,
+                                        n_features=n_features, max_depth=max_depth)
+        logging.info(f"compiled model: {compiled.n_trees} trees, {offset} nodes, max depth {max_depth}")
+        return compiled
+    except Exception as e:
+        raise SensorException(e, sys)
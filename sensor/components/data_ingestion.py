@@ -5,11 +5,28 @@ from sensor.entity import config_entity      # we want input to the data ingesti
 from sensor.entity import artifact_entity    # and also, we want output of the data ingestion component    
 from sensor.exception import SensorException
 from sensor.logger import logging
+from sensor.feature_store import FeatureStore, link_or_copy
+from sensor.schema import SensorSchema
+from typing import Optional
 import os
 import sys  
 import pandas as pd 
 import numpy as np
-from sklearn.model_selection import train_test_split
+
+# the side (train or test) of every row -- True for a test row. The side is a hash of the row number
+# (splitmix64, seeded), so a row keeps its side when the feature store grows: the old rows stay where they
+# were and only the new rows are split. (a "train_test_split" of the whole store shuffled all the rows
+# again -- old train rows moved into the test set, which the production model had been trained on)
+# about "test_size" of the rows are test rows (not exactly -- every row is drawn on its own)
+def split_test_rows(rows:np.ndarray, test_size:float, seed:int=42) -> np.ndarray:
+    with np.errstate(over="ignore"):
+        z = rows.astype(np.uint64) + np.uint64(seed) * np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        z = z ^ (z >> np.uint64(31))
+    # the upper 53 bits as a number in [0, 1)
+    return (z >> np.uint64(11)).astype(np.float64) / float(1 << 53) < test_size
+
 
 class DataIngestion:
     def __init__(self, data_ingestion_config:config_entity.DataIngestionConfig):
@@ -22,35 +39,109 @@ class DataIngestion:
         except Exception as e:
             raise SensorException(e,sys)
 
-    def initiate_data_ingestion(self)->artifact_entity.DataIngestionArtifact:
-    # ie the output of this function is- (file name. data type) 'artifact_entity.DataIngestionArtifact'
-
+    # reads the collection from mongodb as one dataframe -- using whichever reading mode is configured
+    # min_id: only the documents with "_id" > min_id are read (used by the incremental ingestion)
+    # keep_id: if True, the "_id" column is also returned
+    def read_collection(self, min_id=None, keep_id:bool=False) -> pd.DataFrame:
         try:
-            logging.info(f"exporting collection data as pandas dataframe")
-            # exporting collection data as pandas dataframe
+            incremental_read = min_id is not None or keep_id
+            if self.data_ingestion_config.n_partitions > 1:
+                # parallel reads -- one worker process per "_id" range
+                return utils.get_collection_as_dataframe_partitioned(
+                    database_name=self.data_ingestion_config.database_name,
+                    collection_name=self.data_ingestion_config.collection_name,
+                    n_partitions=self.data_ingestion_config.n_partitions,
+                    batch_size=self.data_ingestion_config.batch_size,
+                    min_id=min_id, keep_id=keep_id)
+
+            if self.data_ingestion_config.streaming or incremental_read:
+                # the chunks are already typed (the "na" values are np.nan) -- so no replace needed
+                if not incremental_read:
+                    return utils.get_collection_as_dataframe_streaming(
+                        database_name=self.data_ingestion_config.database_name,
+                        collection_name=self.data_ingestion_config.collection_name,
+                        batch_size=self.data_ingestion_config.batch_size)
+                # in "_id" order
+                chunks = utils.iter_collection_chunks(
+                    database_name=self.data_ingestion_config.database_name,
+                    collection_name=self.data_ingestion_config.collection_name,
+                    batch_size=self.data_ingestion_config.batch_size,
+                    query=None if min_id is None else {"_id": {"$gt": min_id}},
+                    sort=[("_id", 1)], keep_id=keep_id)
+                return utils.concat_dataframe_chunks(chunks)
+
             df:pd.DataFrame  = utils.get_collection_as_dataframe(
                 database_name=self.data_ingestion_config.database_name, 
                 collection_name=self.data_ingestion_config.collection_name)
 
             logging.info("replace na values with np.Nan")
             # replace na with np.Nan -- because we had some missing values in the data
-            df.replace(to_replace="na",value=np.NAN,inplace=True)
+            df.replace(to_replace="na",value=np.nan,inplace=True)
+            return df
 
-            logging.info("save data in feature store")
-            # save data in feature store
-            logging.info("create feature store folder if not available")
-            # create feature store folder if not available
-            feature_store_dir = os.path.dirname(self.data_ingestion_config.feature_store_file_path)
-            os.makedirs(feature_store_dir,exist_ok=True)
+        except Exception as e:
+            raise SensorException(e, sys)
 
-            logging.info("save df to feature store folder")
-            # save df to feature store folder
-            df.to_csv(path_or_buf=self.data_ingestion_config.feature_store_file_path,index=False,header=True)
+    # incremental ingestion -- pulls only the new documents (after the watermark) into the persistent
+    # feature store, and then rebuilds the train and test files from the whole store
+    # returns the dataframe of the whole store, or None if nothing changed and the cached train and
+    # test files of the store were reused
+    def ingest_delta(self) -> Optional[pd.DataFrame]:
+        try:
+            feature_store = FeatureStore(store_dir=self.data_ingestion_config.feature_store_dir)
+            # the documents after the watermark -- and the ones of the overlap window below it, which the
+            # store drops if it has them already (refer "feature_store.py")
+            overlap_seconds = self.data_ingestion_config.watermark_overlap_seconds
+            read_after_id = feature_store.read_after_id(overlap_seconds=overlap_seconds)
+            logging.info(f"reading documents after: {read_after_id} (watermark: {feature_store.watermark})")
+            delta_df = self.read_collection(min_id=read_after_id, keep_id=True)
 
+            n_new_rows = 0
+            if delta_df.shape[0] > 0:
+                n_new_rows = feature_store.append_new_rows(df=delta_df, overlap_seconds=overlap_seconds)
+            logging.info(f"{n_new_rows} new rows, feature store has {feature_store.n_rows} rows")
+            del delta_df
+
+            # if the store did not change, the train and test files from the last run are still valid
+            split_key = f"test_size={self.data_ingestion_config.test_size},format={self.data_ingestion_config.dataset_format},split=row_hash"
+            cached_split = feature_store.get_cached_split(key=split_key)
+            # (a split cached before the rows of the train set were kept is built again)
+            if cached_split is not None and "train_rows" in cached_split:
+                logging.info("feature store unchanged, reusing the cached train and test files")
+                link_or_copy(cached_split["train"], self.data_ingestion_config.train_file_path)
+                link_or_copy(cached_split["test"], self.data_ingestion_config.test_file_path)
+                link_or_copy(cached_split["schema"], self.data_ingestion_config.schema_file_path)
+                link_or_copy(cached_split["train_rows"], self.data_ingestion_config.train_rows_file_path)
+                return None
+
+            df = feature_store.read()
+            self.split_and_save(df=df, save_train_rows=True)
+            feature_store.save_split(key=split_key, file_paths={
+                "train": self.data_ingestion_config.train_file_path,
+                "test": self.data_ingestion_config.test_file_path,
+                "schema": self.data_ingestion_config.schema_file_path,
+                "train_rows": self.data_ingestion_config.train_rows_file_path})
+            return df
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    # save_train_rows: if True, the index of every train row is saved too -- the store reads its
+    # partitions back in the order they were appended, so the index is the row of the feature store
+    def split_and_save(self, df:pd.DataFrame, save_train_rows:bool=False):
+        try:
+            # the schema (dtype of every column, "na" strings) is derived from the data -- every
+            # later reader parses the files with it (refer "schema.py")
+            logging.info("derive the schema of the data")
+            schema = SensorSchema.from_dataframe(df=df)
+            schema.save(file_path=self.data_ingestion_config.schema_file_path)
 
             logging.info("split dataset into train set and test set")
-            # split dataset into train and test set
-            train_df,test_df = train_test_split(df,test_size=self.data_ingestion_config.test_size,random_state=42)
+            # split dataset into train and test set -- by the row (of the feature store, or of the read
+            # collection), so a row which was a train row in an earlier run is never a test row now
+            # (refer "split_test_rows" above)
+            is_test = split_test_rows(df.index.to_numpy(), test_size=self.data_ingestion_config.test_size)
+            train_df,test_df = df[~is_test],df[is_test]
             
             logging.info("create dataset directory folder if not available")
             # create dataset directory folder if not available
@@ -59,17 +150,64 @@ class DataIngestion:
 
             logging.info("save df to feature store folder")
             # save df to feature store folder
-            train_df.to_csv(path_or_buf=self.data_ingestion_config.train_file_path,index=False,header=True)
-            test_df.to_csv(path_or_buf=self.data_ingestion_config.test_file_path,index=False,header=True)
+            utils.save_dataframe(df=train_df, file_path=self.data_ingestion_config.train_file_path,
+                                 file_format=self.data_ingestion_config.dataset_format,
+                                 compression=self.data_ingestion_config.dataset_compression)
+            utils.save_dataframe(df=test_df, file_path=self.data_ingestion_config.test_file_path,
+                                 file_format=self.data_ingestion_config.dataset_format,
+                                 compression=self.data_ingestion_config.dataset_compression)
+            if save_train_rows:
+                utils.save_numpy_array_data(file_path=self.data_ingestion_config.train_rows_file_path,
+                                            array=train_df.index.to_numpy(dtype=np.int64))
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def initiate_data_ingestion(self)->artifact_entity.DataIngestionArtifact:
+    # ie the output of this function is- (file name. data type) 'artifact_entity.DataIngestionArtifact'
+
+        try:
+            # only the incremental ingestion knows which rows of the feature store are new (refer "incremental.py")
+            train_rows_file_path, feature_store_rows = None, None
+            if self.data_ingestion_config.incremental:
+                # the persistent feature store (outside the "artifacts" folder) is the feature store
+                # of this run -- no copy of it is written into the artifact folder
+                self.ingest_delta()
+                feature_store_file_path = self.data_ingestion_config.feature_store_dir
+                train_rows_file_path = self.data_ingestion_config.train_rows_file_path
+                feature_store_rows = FeatureStore(store_dir=self.data_ingestion_config.feature_store_dir).n_rows
+            else:
+                logging.info(f"exporting collection data as pandas dataframe")
+                # exporting collection data as pandas dataframe
+                df:pd.DataFrame = self.read_collection()
+
+                logging.info("save data in feature store")
+                # save data in feature store
+                logging.info("create feature store folder if not available")
+                # create feature store folder if not available
+                feature_store_dir = os.path.dirname(self.data_ingestion_config.feature_store_file_path)
+                os.makedirs(feature_store_dir,exist_ok=True)
+
+                logging.info("save df to feature store folder")
+                # save df to feature store folder
+                utils.save_dataframe(df=df, file_path=self.data_ingestion_config.feature_store_file_path,
+                                     file_format=self.data_ingestion_config.dataset_format,
+                                     compression=self.data_ingestion_config.dataset_compression)
+                feature_store_file_path = self.data_ingestion_config.feature_store_file_path
+
+                self.split_and_save(df=df)
             
             # prepare output/artifact
             data_ingestion_artifact = artifact_entity.DataIngestionArtifact(
-                feature_store_file_path=self.data_ingestion_config.feature_store_file_path,
+                feature_store_file_path=feature_store_file_path,
                 train_file_path=self.data_ingestion_config.train_file_path, 
-                test_file_path=self.data_ingestion_config.test_file_path)
+                test_file_path=self.data_ingestion_config.test_file_path,
+                schema_file_path=self.data_ingestion_config.schema_file_path,
+                train_rows_file_path=train_rows_file_path,
+                feature_store_rows=feature_store_rows)
 
             logging.info(f"data ingestion artifact: {data_ingestion_artifact}")
             return data_ingestion_artifact
     
         except Exception as e:
-            raise SensorException(error_message=e, error_detail=sys)         
\ No newline at end of file
+            raise SensorException(error_message=e, error_detail=sys)         
@@ -7,15 +7,17 @@ from sensor.logger import logging
 from typing import Optional
 import os
 import sys
-from sklearn.pipeline import Pipeline
+import shutil
 import pandas as pd
 from sensor import utils
 import numpy as np
-from sklearn.preprocessing import LabelEncoder
-from imblearn.combine import SMOTETomek
-from sklearn.impute import SimpleImputer
-from sklearn.preprocessing import RobustScaler
+# sklearn and imblearn are imported inside the functions which use them (and not at the top)
+# so that importing this file (eg: by the training pipeline) does not pay for them up front
 from sensor.config import TARGET_COLUMN
+from sensor.schema import SensorSchema
+from sensor.instrumentation import instrument
+from sensor.rebalancing import REBALANCERS, get_rebalancer
+from sensor.streaming_transformer import fit_transformer_streaming, transform_chunks_to_dataset
 from dataclasses import dataclass
 
 class DataTransformation: 
@@ -40,18 +42,38 @@ class DataTransformation:
     # we are going to create the data transformation pipeline 
     # and so, we will import -- "from sklearn.pipeline import Pipeline"
     # this function will return a "Pipeline"
-    def data_transformer_object(cls) -> Pipeline:  
+    # missing_value_mode: "impute" (fill the NULL values with 0) or "native" (keep them as np.nan for
+    # xgboost) -- refer "missing_values.py"
+    # sparse_threshold: (native mode) the share of missing values from which a matrix is returned as CSR
+    #                   (None => "DEFAULT_SPARSE_THRESHOLD")
+    def get_data_transformer_object(cls, missing_value_mode:str="impute",
+                                    sparse_threshold:Optional[float]=None) -> "Pipeline":  
         try:
+            from sklearn.pipeline import Pipeline
+            from sklearn.impute import SimpleImputer
+            from sklearn.preprocessing import RobustScaler
+            from sensor.missing_values import MISSING_VALUE_MODES, DEFAULT_SPARSE_THRESHOLD, MissingToSparse
+            if missing_value_mode not in MISSING_VALUE_MODES:
+                raise Exception(f"unknown missing value mode: {missing_value_mode}, available modes: {list(MISSING_VALUE_MODES)}")
+
+            # In our dataset, most of the columns are numerical -- so we will use "RobustScaler()" 
+            # it is useful whenever we have OUTLIERS in the data
+            # (If we don't have outliers, we can use "standard scaler or minmax scaler")
+            robust_scaler =  RobustScaler()
+
+            if missing_value_mode == "native":
+                # the NULL values are not filled -- "RobustScaler()" ignores them when it is fitted and
+                # keeps them as np.nan when it transforms, ie only the observed values are scaled
+                return Pipeline(steps=[
+                        ('RobustScaler',robust_scaler),
+                        ('MissingToSparse',MissingToSparse(sparse_threshold=DEFAULT_SPARSE_THRESHOLD if sparse_threshold is None else sparse_threshold))
+                    ])
             
             # in few of the rows in our dataset, we have NULL values 
             # so to impute(/fill) those values, we will use "SimpleImputer()"
             # strategy, we can experiment and see which works better
             simple_imputer = SimpleImputer(strategy='constant', fill_value=0)
 
-            # In our dataset, most of the columns are numerical -- so we will use "RobustScaler()" 
-            # it is useful whenever we have OUTLIERS in the data
-            # (If we don't have outliers, we can use "standard scaler or minmax scaler")
-            robust_scaler =  RobustScaler()
             pipeline = Pipeline(steps=[
                     ('Imputer',simple_imputer),
                     ('RobustScaler',robust_scaler)
@@ -60,13 +82,67 @@ class DataTransformation:
         except Exception as e:
             raise SensorException(e,sys)  
         
-    def initiate_data_transformation(self,) -> artifact_entity.DataTransformationArtifact:
+    # the transformer of the configured missing value mode
+    def get_transformer(self) -> "Pipeline":
+        return DataTransformation.get_data_transformer_object(
+            missing_value_mode=self.data_transformation_config.missing_value_mode,
+            sparse_threshold=self.data_transformation_config.sparse_threshold)
+
+    # the streaming fit -- the train file is read chunk by chunk (twice: to fit the transformer, then to
+    # transform it), and the transformed rows are written chunk by chunk into memory mapped files
+    # returns (transformer, label encoder, streamed) -- streamed: "train"/"test" -> (x, y, directory)
+    # base: the objects of the production model which are kept (refer "get_base_objects") -- then the
+    #       transformer is not fitted (ie the train file is not read for the fit)
+    def transform_streaming(self, schema:SensorSchema, base:Optional[dict]=None) -> tuple:
         try:
+            chunk_size = self.data_transformation_config.transformation_chunk_size
+            train_file_path = self.data_ingestion_artifact.train_file_path
+            test_file_path = self.data_ingestion_artifact.test_file_path
+            columns = utils.read_dataframe_columns(file_path=train_file_path)
+
+            if base is not None:
+                transformation_pipleine, label_encoder = base["transformer"], base["label_encoder"]
+            else:
+                with instrument("data_transformation.fit_transformer") as measurement:
+                    transformation_pipleine, label_encoder, n_rows = fit_transformer_streaming(
+                        pipeline=self.get_transformer(),
+                        chunks=schema.iter_read(file_path=train_file_path, chunk_size=chunk_size),
+                        target_column=TARGET_COLUMN, sketch_k=self.data_transformation_config.transformer_sketch_k)
+                    measurement.rows = n_rows
+
+            streamed = dict()
+            for name, file_path, transformed_path in [("train", train_file_path, self.data_transformation_config.transformed_train_path),
+                                                      ("test", test_file_path, self.data_transformation_config.transformed_test_path)]:
+                with instrument(f"data_transformation.transform_{name}") as measurement:
+                    # the number of rows -- from the target column alone
+                    measurement.rows = sum(chunk.shape[0] for chunk in schema.iter_read(file_path=file_path, chunk_size=chunk_size, columns=[TARGET_COLUMN]))
+                    stream_dir_path = f"{transformed_path}.stream"
+                    features, labels = transform_chunks_to_dataset(pipeline=transformation_pipleine, label_encoder=label_encoder,
+                                                                   chunks=schema.iter_read(file_path=file_path, chunk_size=chunk_size, columns=columns),
+                                                                   n_rows=measurement.rows, dir_path=stream_dir_path, target_column=TARGET_COLUMN)
+                # the features and the labels stay in the memory mapped files
+                streamed[name] = (features, labels, stream_dir_path)
+            return transformation_pipleine, label_encoder, streamed
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    # the transformation in memory -- the train file is read as a whole, the transformer is fitted on it
+    # and both the files are transformed
+    # base: the objects of the production model which are kept (refer "get_base_objects") -- None => the
+    #       transformer and the target encoder are fitted
+    # returns (transformer, label encoder, x train, y train, x test, y test)
+    def transform_in_memory(self, schema:SensorSchema, base:Optional[dict]=None) -> tuple:
+        try:
+            from sklearn.preprocessing import LabelEncoder
 
             # we will read the train file and test file
-            train_df = pd.read_csv(self.data_ingestion_artifact.train_file_path)
-            test_df = pd.read_csv(self.data_ingestion_artifact.test_file_path)
-            
+            # (the format of the files is found from their extension -- refer "dataset_storage.py")
+            # the files are parsed with the schema -- ie float32 columns with np.nan for "na"
+            train_df = schema.read(file_path=self.data_ingestion_artifact.train_file_path)
+            # the test file must have the same columns as the train file -- so we read only those
+            test_df = schema.read(file_path=self.data_ingestion_artifact.test_file_path,
+                                  columns=list(train_df.columns))
+        
             # we will now split the data into -- i) input features and ii) target column
             # (the target column name/output column is "class" -- which has 2 values -- "pos" or "neg")
             # i) let us select the input feature for train and test file
@@ -80,8 +156,12 @@ class DataTransformation:
             # since our target column is CATEGORICAL ie "pos" or "neg", we have to convert it into
             # NUMERICAL -- so we will do labelling
             # we will use "LabelEncoder()"
-            label_encoder = LabelEncoder()
-            label_encoder.fit(target_feature_train_df)
+            # (incremental training: the target encoder of the production model is kept)
+            if base is not None:
+                label_encoder = base["label_encoder"]
+            else:
+                label_encoder = LabelEncoder()
+                label_encoder.fit(target_feature_train_df)
 
             # transformation on target columns of both "train.csv" and "test.csv"
             # LabelEncoder() -- outputs an array -- so "_arr"
@@ -90,36 +170,185 @@ class DataTransformation:
 
             # we have to now trasform the input features -- ie we have to apply
             # all the above transformations that we discussed so far, onto the input features
-            transformation_pipleine = DataTransformation.get_data_transformer_object()
-            transformation_pipleine.fit(input_features_train_df)
+            # (incremental training: the transformer of the production model is kept -- ie it is not fitted)
+            if base is not None:
+                transformation_pipleine = base["transformer"]
+            else:
+                transformation_pipleine = self.get_transformer()
+                with instrument("data_transformation.fit_transformer", rows=input_features_train_df.shape[0]):
+                    transformation_pipleine.fit(input_features_train_df)
 
             # transforming input features
             # outputs an array -- so "_arr"
-            input_feature_train_arr = transformation_pipleine.transform(input_features_train_df)
-            input_feature_test_arr = transformation_pipleine.transform(input_features_test_df)
+            with instrument("data_transformation.transform", rows=input_features_train_df.shape[0] + input_features_test_df.shape[0]):
+                input_feature_train_arr = transformation_pipleine.transform(input_features_train_df)
+                input_feature_test_arr = transformation_pipleine.transform(input_features_test_df)
+            return (transformation_pipleine, label_encoder, input_feature_train_arr, target_feature_train_arr,
+                    input_feature_test_arr, target_feature_test_arr)
+        except Exception as e:
+            raise SensorException(e, sys)
 
+    # the transformation -- in memory or streaming, as configured
+    # returns (transformer, label encoder, x train, y train, x test, y test, streamed) -- streamed: the files
+    # which the streaming transformation wrote (None => in memory)
+    def transform(self, schema:SensorSchema, base:Optional[dict]=None) -> tuple:
+        try:
+            if self.data_transformation_config.transformer_fit_mode == "streaming":
+                # the train set does not have to fit into memory (refer "streaming_transformer.py")
+                transformation_pipleine, label_encoder, streamed = self.transform_streaming(schema=schema, base=base)
+                input_feature_train_arr, target_feature_train_arr, _ = streamed["train"]
+                input_feature_test_arr, target_feature_test_arr, _ = streamed["test"]
+                return (transformation_pipleine, label_encoder, input_feature_train_arr, target_feature_train_arr,
+                        input_feature_test_arr, target_feature_test_arr, streamed)
+            return self.transform_in_memory(schema=schema, base=base) + (None,)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    # incremental training (refer "incremental.py") -- the objects of the production model which are kept:
+    # {"transformer", "label_encoder", "trained_rows", "base_model_dir"}; None => the transformer is fitted
+    # (there is no production model, or it cannot be used -- the reason is logged)
+    def get_base_objects(self, schema:SensorSchema) -> Optional[dict]:
+        try:
+            from sensor.predictor import ModelResolver
+            from sensor.incremental import read_training_state
+            base_model_dir = self.data_transformation_config.base_model_dir
+            if base_model_dir is None:
+                logging.info("incremental training: there is no production model -- full retrain")
+                return None
+            if self.data_ingestion_artifact.train_rows_file_path is None:
+                logging.info("incremental training: the ingestion is not incremental (no new rows known) -- full retrain")
+                return None
+            resolver = ModelResolver()
+            training_state = read_training_state(os.path.join(base_model_dir, resolver.model_dir_name, config_entity.TRAINING_STATE_FILE_NAME))
+            if training_state is None:
+                logging.info(f"incremental training: the production model {base_model_dir} has no training state -- full retrain")
+                return None
+            base_schema_path = os.path.join(base_model_dir, resolver.schema_dir_name, config_entity.SCHEMA_FILE_NAME)
+            if not os.path.exists(base_schema_path) or not schema.is_compatible(SensorSchema.load(file_path=base_schema_path)):
+                logging.info(f"incremental training: the schema changed since the production model {base_model_dir} -- full retrain")
+                return None
+            transformer = utils.load_object(file_path=os.path.join(base_model_dir, resolver.transformer_dir_name, config_entity.TRANSFORMER_OBJECT_FILE_NAME))
+            # the imputer is there only in the "impute" missing value mode (refer "get_data_transformer_object")
+            if ("Imputer" in transformer.named_steps) != (self.data_transformation_config.missing_value_mode == "impute"):
+                logging.info(f"incremental training: the missing value mode changed -- full retrain")
+                return None
+            label_encoder = utils.load_object(file_path=os.path.join(base_model_dir, resolver.target_encoder_dir_name, config_entity.TARGET_ENCODER_OBJECT_FILE_NAME))
+            logging.info(f"incremental training: keeping the transformer of the production model {base_model_dir}")
+            return {"transformer": transformer, "label_encoder": label_encoder, "base_model_dir": base_model_dir,
+                    "trained_rows": training_state["feature_store_rows"]}
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    # incremental training -- the rows of the (transformed, not yet rebalanced) train set which go into the
+    # delta: the new rows and the replay sample; None => no delta (the reason is logged)
+    # returns (rows, drifted) -- drifted: True if there is no delta because the new rows drifted
+    def select_delta(self, x, y:np.ndarray, base:dict, columns:list) -> tuple:
+        try:
+            from sensor.incremental import select_delta_rows, drifted_columns_share
+            train_rows = utils.load_numpy_array_data(file_path=self.data_ingestion_artifact.train_rows_file_path)
+            if train_rows.shape[0] != y.shape[0]:
+                raise Exception(f"the train rows file has {train_rows.shape[0]} rows, the train set {y.shape[0]}")
+            new_rows, replay_rows = select_delta_rows(train_rows=train_rows, y=y, trained_rows=base["trained_rows"],
+                                                      replay_ratio=self.data_transformation_config.replay_ratio,
+                                                      min_replay_rows=self.data_transformation_config.min_replay_rows)
+            logging.info(f"incremental training: {new_rows.shape[0]} new train rows, {replay_rows.shape[0]} replay rows")
+            if new_rows.shape[0] == 0:
+                logging.info("incremental training: there are no new rows -- full retrain")
+                return None, False
+            if new_rows.shape[0] > self.data_transformation_config.max_delta_fraction * y.shape[0]:
+                logging.info(f"incremental training: the new rows are more than {self.data_transformation_config.max_delta_fraction} "
+                             f"of the train set -- full retrain")
+                return None, False
+            if replay_rows.shape[0] > 0:
+                with instrument("data_transformation.delta_drift", rows=new_rows.shape[0] + replay_rows.shape[0]):
+                    share, drifted = drifted_columns_share(x[replay_rows], x[new_rows], columns=columns)
+                logging.info(f"incremental training: {share:.1%} of the columns of the new rows drifted: {drifted[:10]}")
+                if share > self.data_transformation_config.max_drifted_columns_share:
+                    logging.info(f"incremental training: more than {self.data_transformation_config.max_drifted_columns_share:.1%} "
+                                 f"of the columns drifted -- the transformer is fitted again, full retrain")
+                    return None, True
+            return np.sort(np.concatenate([new_rows, replay_rows])), False
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    # saves x (float32) and y into the directory "file_path" (refer "save_transformed_dataset" in "utils.py")
+    # -- or, if x and y are still the arrays which the streaming transformation wrote (ie the rebalancing
+    # did not change them), just moves that directory into place
+    def save_transformed(self, file_path:str, x:np.ndarray, y:np.ndarray, streamed:Optional[tuple]=None):
+        try:
+            if os.path.isdir(file_path):
+                shutil.rmtree(file_path)
+            if streamed is not None and x is streamed[0] and y is streamed[1]:
+                os.replace(streamed[2], file_path)
+                return
+            utils.save_transformed_dataset(dir_path=file_path, features=x, labels=y)
+            if streamed is not None:
+                shutil.rmtree(streamed[2])
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def initiate_data_transformation(self,) -> artifact_entity.DataTransformationArtifact:
+        try:
+            schema = SensorSchema.load(file_path=self.data_ingestion_artifact.schema_file_path)
+            # the rebalancing strategy is checked before the (long) transformation -- the strategies which
+            # measure distances between rows (eg: SMOTE) need every value of a row, ie they do not work
+            # with the missing values of the "native" missing value mode (refer "missing_values.py")
+            rebalancer = get_rebalancer(strategy=self.data_transformation_config.rebalance_strategy,
+                                        params=self.data_transformation_config.rebalance_params,
+                                        n_jobs=self.data_transformation_config.rebalance_n_jobs)
+            if self.data_transformation_config.missing_value_mode == "native" and not rebalancer.supports_missing:
+                raise Exception(f"rebalancing strategy {rebalancer.strategy} does not support missing values -- "
+                                f"use one of {[name for name, strategy in REBALANCERS.items() if strategy.supports_missing]} "
+                                f"with the native missing value mode")
+            # incremental training -- the transformer of the production model is kept (refer "incremental.py")
+            base = self.get_base_objects(schema=schema) if self.data_transformation_config.incremental else None
+            (transformation_pipleine, label_encoder, input_feature_train_arr, target_feature_train_arr,
+             input_feature_test_arr, target_feature_test_arr, streamed) = self.transform(schema=schema, base=base)
+
+            # the rows of the delta (new rows + replay sample) -- taken before the rebalancing, which adds
+            # and removes rows; if the new rows drifted, the transformer is fitted again (ie a full retrain)
+            delta_rows = None
+            if base is not None:
+                delta_rows, drifted = self.select_delta(x=input_feature_train_arr, y=target_feature_train_arr, base=base,
+                                                        columns=list(base["transformer"].feature_names_in_))
+                if drifted:
+                    if streamed is not None:
+                        for _, _, stream_dir_path in streamed.values():
+                            shutil.rmtree(stream_dir_path, ignore_errors=True)
+                    base = None
+                    (transformation_pipleine, label_encoder, input_feature_train_arr, target_feature_train_arr,
+                     input_feature_test_arr, target_feature_test_arr, streamed) = self.transform(schema=schema)
+            # (copied out of the train set -- which may be memory mapped, and is moved or removed below)
+            delta = None
+            if delta_rows is not None:
+                delta = (input_feature_train_arr[delta_rows], np.asarray(target_feature_train_arr[delta_rows]))
 
 
             # In our dataset we see that there is a lot of imbalance - "pos" is very less than "neg" 
             # in the target column. So to balance this, based on the dataset we will populate (/create) 
             # new datapoints for the "pos" class
 
-            # we will use -- "SMOTETomek"
-            # that is why we imported -- from imblearn.combine import SMOTETomek
-            smt = SMOTETomek(random_state=42)
+            # we used to use "SMOTETomek" here -- now the strategy is configurable (refer "rebalancing.py"),
+            # "SMOTETomek" is still the default (the rebalancer is created at the top -- refer above)
+            logging.info(f"rebalancing strategy: {rebalancer.strategy}")
             logging.info(f"before resampling in training set Input: {input_feature_train_arr.shape} Target:{target_feature_train_arr.shape}")
 
             # we have to pass (x & y) ie x = input_feature_train_arr and y = target_feature_train_arr
             # we will override -- this is for train file
-            input_feature_train_arr, target_feature_train_arr = smt.fit_resample(input_feature_train_arr, target_feature_train_arr)
+            # (sample_weight is not None only for the strategies which weight the rows instead of adding rows)
+            # NOTE: the strategies which add or drop rows (eg "smote_tomek") read the whole set into memory,
+            # memory mapped or not -- the nearest neighbour search needs all the rows at once; only "none"
+            # and "class_weight" leave the memory mapped arrays of the streaming transformation as they are
+            with instrument("data_transformation.fit_resample_train", rows=input_feature_train_arr.shape[0]):
+                input_feature_train_arr, target_feature_train_arr, sample_weight = rebalancer.fit_resample(input_feature_train_arr, target_feature_train_arr)
             logging.info(f"after resampling in training set Input: {input_feature_train_arr.shape} Target:{target_feature_train_arr.shape}")
-            
-            logging.info(f"before resampling in testing set Input: {input_feature_test_arr.shape} Target:{target_feature_test_arr.shape}")
 
-            # we have to pass (x & y) ie x = input_feature_train_arr and y = target_feature_train_arr
-            # we will override -- this is for train file
-            input_feature_test_arr, target_feature_test_arr = smt.fit_resample(input_feature_test_arr, target_feature_test_arr)
-            logging.info(f"after resampling in testing set Input: {input_feature_test_arr.shape} Target:{target_feature_test_arr.shape}")
+            if self.data_transformation_config.rebalance_test:
+                logging.info(f"before resampling in testing set Input: {input_feature_test_arr.shape} Target:{target_feature_test_arr.shape}")
+                # the same for the test file -- the weights of the test rows are not needed
+                with instrument("data_transformation.fit_resample_test", rows=input_feature_test_arr.shape[0]):
+                    input_feature_test_arr, target_feature_test_arr, _ = rebalancer.fit_resample(input_feature_test_arr, target_feature_test_arr)
+                logging.info(f"after resampling in testing set Input: {input_feature_test_arr.shape} Target:{target_feature_test_arr.shape}")
 
 
             # we have to save our target encoder. To do this, we will define some helper functions
@@ -134,21 +363,40 @@ class DataTransformation:
             # we have written the functions inside the file "utils.py" inside the "utils" folder
 
             # now, the "input feature" and "target feature" -- are separated -- both in train file and test file
-            # so, we have to now combine it together -- so, we will concatenate them
-            # because we have to save it into one single file -- ie one single file for train and one single file for test
-            train_arr = np.c_[input_feature_train_arr, target_feature_train_arr ]
-            test_arr = np.c_[input_feature_test_arr, target_feature_test_arr]
-
-            
+            # we keep them separated -- the features as float32 in one file and the target in another file
+            # (refer "save_transformed_dataset" in "utils.py") -- so that the model trainer can memory map
+            # the features and use them as they are, without any copy
+            # (the streaming transformation wrote the arrays into files already -- if the rebalancing did
+            # not change them, these files are just moved into place)
             # now let us save all these -- one by one
 
             # i) let us the save the numpy arrays -- ie  train array and test array
             # it will automatically create the directory
-            utils.save_numpy_array_data(file_path=self.data_transformation_config.transformed_train_path,
-                                        array=train_arr)
-
-            utils.save_numpy_array_data(file_path=self.data_transformation_config.transformed_test_path,
-                                        array=test_arr)
+            self.save_transformed(file_path=self.data_transformation_config.transformed_train_path,
+                                  x=input_feature_train_arr, y=target_feature_train_arr,
+                                  streamed=None if streamed is None else streamed["train"])
+
+            self.save_transformed(file_path=self.data_transformation_config.transformed_test_path,
+                                  x=input_feature_test_arr, y=target_feature_test_arr,
+                                  streamed=None if streamed is None else streamed["test"])
+
+            # the weights of the train rows (only if the strategy weights the rows)
+            sample_weight_path = None
+            if sample_weight is not None:
+                sample_weight_path = self.data_transformation_config.sample_weight_path
+                utils.save_numpy_array_data(file_path=sample_weight_path, array=sample_weight)
+
+            # the delta of the train set (incremental training) -- rebalanced the same way as the train set
+            delta_train_path, delta_sample_weight_path = None, None
+            if delta is not None:
+                with instrument("data_transformation.fit_resample_delta", rows=delta[0].shape[0]):
+                    delta_x, delta_y, delta_sample_weight = rebalancer.fit_resample(*delta)
+                delta_train_path = self.data_transformation_config.delta_train_path
+                self.save_transformed(file_path=delta_train_path, x=delta_x, y=delta_y)
+                if delta_sample_weight is not None:
+                    delta_sample_weight_path = self.data_transformation_config.delta_sample_weight_path
+                    utils.save_numpy_array_data(file_path=delta_sample_weight_path, array=delta_sample_weight)
+                logging.info(f"incremental training: delta of the train set {delta_x.shape} saved: {delta_train_path}")
 
 
             # ii) let us the save the transformation object, which is a pipeline object
@@ -160,6 +408,9 @@ class DataTransformation:
             utils.save_object(file_path=self.data_transformation_config.target_encoder_path,
             obj=label_encoder)
 
+            # iv) let us save the schema which the transformer was fitted with -- it goes along with the model
+            schema.save(file_path=self.data_transformation_config.schema_file_path)
+
 
             # we have to prepare the data transformation artifact
             # all the above things which we saved, these are the data transformation objects
@@ -167,8 +418,13 @@ class DataTransformation:
                 transform_object_path=self.data_transformation_config.transform_object_path,
                 transformed_train_path = self.data_transformation_config.transformed_train_path,
                 transformed_test_path = self.data_transformation_config.transformed_test_path,
-                target_encoder_path = self.data_transformation_config.target_encoder_path
-
+                target_encoder_path = self.data_transformation_config.target_encoder_path,
+                schema_file_path = self.data_transformation_config.schema_file_path,
+                sample_weight_path = sample_weight_path,
+                base_model_dir = None if base is None else base["base_model_dir"],
+                delta_train_path = delta_train_path,
+                delta_sample_weight_path = delta_sample_weight_path,
+                feature_store_rows = self.data_ingestion_artifact.feature_store_rows
             )
 
             logging.info(f"data transformation objects {data_transformation_artifact}")
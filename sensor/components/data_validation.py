@@ -10,10 +10,16 @@ import sys
 import pandas as pd
 import numpy as np
 from typing import Optional
-from sensor.utils import utils
+from sensor import utils
 from sensor.config import TARGET_COLUMN
+from sensor.schema import SensorSchema
+from sensor.instrumentation import instrument
+from sensor.profiling import DatasetProfile, profile_dataframe, profile_chunks
+from sensor.drift import DriftDetector
+from sensor.reference_profile import ReferenceProfileCache
 
-from scipy.stats import ks_2samp
+# "scipy" is imported only inside "data_drift" -- ie only when the drift is actually computed
+# (importing it takes a noticeable part of the start up time of every script which imports this file)
 
 class DataValidation:
     # "data_validation_config" is the input to the "Data Validation" component            
@@ -31,6 +37,9 @@ class DataValidation:
             # this dictionary contains all the errors related to validation
             # we will use this to prepare the validation error report
             self.validation_error = dict() 
+
+            # the drift detector of the base dataset -- created once, used for both train and test
+            self.drift_detector = None
         
         except Exception as e:
             raise SensorException(e, sys)    
@@ -51,22 +60,21 @@ class DataValidation:
     # or in other words, just to have things separate-separate 
     # for better understanding, refer the usage of "report_key_name:str" in 
     # the function "initiate_data_validation"
-    def drop_missing_values_columns(self, df:pd.DataFrame, report_key_name:str) -> Optional[pd.DataFrame]:
+    # "profile" is the profile of "df" (refer "profiling.py") -- the null fraction of every column is
+    # read from it, ie this function does not go over the data again (the profile is computed if not given)
+    def drop_missing_values_columns(self, df:pd.DataFrame, report_key_name:str, profile:Optional[DatasetProfile]=None) -> Optional[pd.DataFrame]:
         try:
-            logging.info("selecting column names which has NULL values above {threshold}")
             # this threshold is taken from "config_entiy.py" file inside the "entity" folder
             # in that, "data_validation_config" function -- and in that "missing_threshold" variable
             threshold = self.data_validation_config.missing_threshold
-            drop_column_names = []    # a list which contains the names of columns which we will drop
-                          # ie those columns whose null values are > 30% of total number of values in that column
+            logging.info(f"selecting column names which has NULL values above {threshold}")
+            if profile is None:
+                profile = profile_dataframe(df, keep_sorted=False)
+
+            drop_column_names = [column for column in self.get_missing_values_columns(profile) if column in df.columns]
 
-            for column_name, missing_percentage in zip((df.isnull().sum()/df.shape[0]).index,(df.isnull().sum()/df.shape[0]).values):
-                print(column_name, missing_percentage * 100)
-                if missing_percentage > threshold:
-                    drop_column_names.append(column_name)  
-            
             # we will update all the dropped columns in the "validation_error" dictionary
-            logging.info("columns to be dropped: list({drop_column_names})")
+            logging.info(f"columns to be dropped: {drop_column_names}")
             self.validation_error[report_key_name] = list(drop_column_names)
             df.drop(list(drop_column_names), axis=1, inplace=True)  
 
@@ -77,21 +85,27 @@ class DataValidation:
         except Exception as e:
             raise SensorException(e,sys)
 
+    # the names of columns which we will drop
+    # ie those columns whose null values are > threshold of total number of values in that column
+    def get_missing_values_columns(self, profile:DatasetProfile) -> list:
+        try:
+            null_fraction = profile.null_fraction
+            return list(null_fraction.index[null_fraction.values > self.data_validation_config.missing_threshold])
+        except Exception as e:
+            raise SensorException(e,sys)
+
     # we want to validate -- whether the required columns exists
     # to do this, we have to pass these 2 dataframes -- base dataframe and current dataframe
     def is_required_columns_exists(self,base_df:pd.DataFrame,current_df:pd.DataFrame,report_key_name:str)->bool:# gives "boolean" output (ie True or False)
         try:
-            base_columns = base_df.columns
-            current_columns = current_df.columns
+            # a set -- so every lookup below is O(1) (and not a search through all the columns)
+            current_columns = set(current_df.columns)
 
 # this is a list which contains those columns which are present in the base dataframe, but is missing in the current dataframe
-            missing_columns = []  
-            for base_column in base_columns:
-                if base_column not in current_columns:
-                    logging.info("column {base_column} is not available")
-                    missing_columns.append(base_column)
+            missing_columns = [base_column for base_column in base_df.columns if base_column not in current_columns]
 
             if len(missing_columns)>0:
+                logging.info(f"columns {missing_columns} are not available")
                 self.validation_error[report_key_name] = missing_columns
                 return False
             
@@ -105,16 +119,30 @@ class DataValidation:
     # or when the statistical properties of old/base data and that of new data -- is different
     # this function will be used to detect 'data drift' and to then prepare the data drift report 
     # this will not return anything -- we will just prepare the data drift report        
-    def data_drift(self,base_df:pd.DataFrame,current_df:pd.DataFrame, report_key_name:str):
+    # the test is done by the drift engine (refer "drift.py") -- on the sorted (non-null) values of the
+    # profiles, or on their quantile sketches; the target column (not a number) is not tested
+    def data_drift(self,base_df:pd.DataFrame,current_df:pd.DataFrame, report_key_name:str,
+                   base_profile:Optional[DatasetProfile]=None, current_profile:Optional[DatasetProfile]=None):
         try:
+            if base_profile is None:
+                base_profile = self.profile_dataset(base_df)
+            if current_profile is None:
+                current_profile = self.profile_dataset(current_df)
+            if self.drift_detector is None or self.drift_detector.base_profile is not base_profile:
+                self.drift_detector = DriftDetector(base_profile=base_profile,
+                                                    method=self.data_validation_config.drift_method,
+                                                    max_workers=self.data_validation_config.drift_max_workers,
+                                                    sketch_k=self.data_validation_config.drift_sketch_k)
+
             # we will use this dictionary to prepare the data drift report
             drift_report = dict()
-            base_columns = base_df.columns
-            current_columns = current_df.columns
 
-            for base_column in base_columns:
-                base_data, current_data = base_df[base_column], current_df[base_column]
-                same_distribution = ks_2samp(base_data, current_data) # this gives p-value
+            with instrument(f"data_validation.drift.{report_key_name}", rows=current_profile.n_rows):
+                drift_results = self.drift_detector.detect(current_profile=current_profile, columns=list(base_df.columns))
+
+            for result in drift_results:
+                base_column = result.column
+                same_distribution = result
 
 # we reject null hypothesis -- if "p-value" < 0.05   (ie we accept the alternate hypothesis)
 # ie if "p-value" <= 0.05   => both have different distribution, ie there is a data drift 
@@ -140,50 +168,91 @@ class DataValidation:
             raise SensorException(e,sys)
 
 
+    # the profile of a dataset (refer "profiling.py") -- for the approximate drift method the profile
+    # is built chunk by chunk with quantile sketches (ie the columns are never sorted as a whole)
+    def profile_dataset(self, df:pd.DataFrame) -> DatasetProfile:
+        try:
+            with instrument("data_validation.profile", rows=df.shape[0]):
+                if self.data_validation_config.drift_method == "approximate":
+                    chunk_size = self.data_validation_config.profile_chunk_size
+                    chunks = (df.iloc[start:start + chunk_size] for start in range(0, df.shape[0], chunk_size))
+                    return profile_chunks(chunks, sketch_k=self.data_validation_config.drift_sketch_k)
+                return profile_dataframe(df)
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    # the profile of the base dataset -- from the reference profile cache (refer "reference_profile.py"),
+    # ie the base file is read and profiled only if it changed (or the settings of the profile changed)
+    def get_base_profile(self, schema:SensorSchema) -> DatasetProfile:
+        try:
+            base_file_path = self.data_validation_config.base_file_path
+            build_profile = lambda: self.profile_dataset(schema.read(file_path=base_file_path))
+            if self.data_validation_config.reference_profile_dir is None:
+                return build_profile()
+            settings = {"schema": schema.to_dict(), "drift_method": self.data_validation_config.drift_method,
+                        "drift_sketch_k": self.data_validation_config.drift_sketch_k,
+                        "profile_chunk_size": self.data_validation_config.profile_chunk_size}
+            cache = ReferenceProfileCache(cache_dir=self.data_validation_config.reference_profile_dir)
+            return cache.get_profile(file_path=base_file_path, build_profile=build_profile, settings=settings)
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    # reads only those columns of the dataset which are also in the base dataframe
+    # (a base column which is missing in the dataset is simply not read -- and is then reported
+    # by "is_required_columns_exists")
+    # the file is parsed with the schema -- ie straight into float32 columns, "na" as NaN
+    def read_dataset(self, file_path:str, base_columns:list, schema:SensorSchema) -> pd.DataFrame:
+        try:
+            available_columns = set(utils.read_dataframe_columns(file_path=file_path))
+            columns = [column for column in base_columns + [TARGET_COLUMN] if column in available_columns]
+            return schema.read(file_path=file_path, columns=list(dict.fromkeys(columns)))
+        except Exception as e:
+            raise SensorException(e,sys)
+
     def initiate_data_validation(self) -> artifact_entity.DataValidationArtifact:
     # ie the output of this function is- (file name. data type) 'artifact_entity.DataIngestionArtifact'
         try:
-            logging.info(f"reading base dataframe")
-            # first, we have to read the base/old file (or dataframe)
-            base_df = pd.read_csv(self.data_validation_config.base_file_path)
-
-            logging.info(f"replacing na values to np.NAN in base dataframe")
-            # base/old file (or dataframe) has "na" -- so, we will replace it with "np.NAN"
-            base_df.replace("na",np.NAN, inplace=True)
+            # the schema of the data (refer "schema.py") -- every file below is parsed with it
+            # ie the "na" values are read as np.nan and the columns as float32 straight away
+            # (so no "replace("na", np.NAN)" and no "convert_columns_float" copies are needed)
+            schema = SensorSchema.load(file_path=self.data_ingestion_artifact.schema_file_path)
+
+            # every check below reads from the "profile" of a dataset (refer "profiling.py") --
+            # ie ONE pass over each dataset computes the null fractions, statistics and sorted values
+            # the profile of the base/old file is cached (refer "reference_profile.py") -- so the base
+            # file itself is read only when it has changed
+            logging.info(f"loading the profile of the base dataframe")
+            base_profile = self.get_base_profile(schema=schema)
 
             logging.info(f"dropping NULL values columns from base dataframe")
             # we will drop the columns which have null values > threshold
-            # so, we will call the function "drop_missing_values_columns"
-            base_df = self.drop_missing_values_columns(df = base_df, report_key_name= "missing_values_within_base_dataset")
+            # the checks below only need the column names of the base dataframe -- so "base_df" is an
+            # empty dataframe with the (remaining) columns of the base dataset
+            base_drop_column_names = self.get_missing_values_columns(profile= base_profile)
+            self.validation_error["missing_values_within_base_dataset"] = base_drop_column_names
+            base_df = pd.DataFrame(columns=[column for column in base_profile.columns if column not in base_drop_column_names])
             # CAREFULLY REFER THE USAGE OF "report_key_name:str" above
             # WE WILL USE "report_key_name:str" IN A SIMILAR WAY, EVERYWHERE ELSE
 
             # now, we will read the "train file" and "test file"
             # the output of "data ingestion" phase -- ie "data_ingestion_artifact" -- is the input to "data validation" phase
+            # every check below only looks at the columns of the base dataframe -- so we read only
+            # those columns (column projection), and the target column
             logging.info(f"reading train dataframe")
-            train_df = pd.read_csv(self.data_ingestion_artifact.train_file_path) 
+            train_df = self.read_dataset(file_path=self.data_ingestion_artifact.train_file_path, base_columns=list(base_df.columns), schema=schema)
             logging.info(f"reading test dataframe")
-            test_df = pd.read_csv(self.data_ingestion_artifact.test_file_path)
+            test_df = self.read_dataset(file_path=self.data_ingestion_artifact.test_file_path, base_columns=list(base_df.columns), schema=schema)
+
+            logging.info(f"profiling train and test dataframe")
+            train_profile = self.profile_dataset(train_df)
+            test_profile = self.profile_dataset(test_df)
 
             # we will drop the columns which have null values > threshold -- from both "train file" and "test file"
             # so, we will call the function "drop_missing_values_columns"
             logging.info(f"dropping NULL values columns from train dataframe")
-            train_df = self.drop_missing_values_columns(df = train_df, report_key_name= "missing_values_within_train_dataset")
+            train_df = self.drop_missing_values_columns(df = train_df, report_key_name= "missing_values_within_train_dataset", profile= train_profile)
             logging.info(f"dropping NULL values columns from test dataframe")
-            test_df = self.drop_missing_values_columns(df = test_df, report_key_name= "missing_values_within_test_dataset")
-
-            # refer "utils.py" file inside the "utils" folder -- (C) --
-            # since the target column SHOULD BE a string itself, and is not to be converted to float,
-            # we will create this variable called as "exclude_columns" which is a list
-            # this will be used inside the "utils.py" file inside the "utils" folder -- (C) --
-            # "exclude_columns" will again return back the modified "base_df"
-            # refer the "utils.py" file inside the "utils" folder -- (C) -- 
-            exclude_columns = [TARGET_COLUMN]
-            base_df = utils.convert_columns_float(df=base_df, exclude_columns= exclude_columns)
-
-            # similarly, we will use it for "train_df" and "test_df"
-            train_df = utils.convert_columns_float(df=train_df, exclude_columns= exclude_columns)
-            test_df = utils.convert_columns_float(df=test_df, exclude_columns= exclude_columns)
+            test_df = self.drop_missing_values_columns(df = test_df, report_key_name= "missing_values_within_test_dataset", profile= test_profile)
 
 
             # now, we will check whether the required columns exists or not -- inside from both "train file" and "test file"
@@ -198,11 +267,13 @@ class DataValidation:
 
             if train_df_columns_status:   # ie if train_df_columns_status == True
                 logging.info(f"as all the columns are available in train dataframe, hence detecting data drift")
-                self.data_drift(base_df= base_df, current_df= train_df, report_key_name= "data_drift_within_train_dataset")
+                self.data_drift(base_df= base_df, current_df= train_df, report_key_name= "data_drift_within_train_dataset",
+                                base_profile= base_profile, current_profile= train_profile)
 
             if test_df_columns_status:    # ie if test_df_columns_status == True
                 logging.info(f"as all the columns are available in test dataframe, hence detecting data drift")
-                self.data_drift(base_df= base_df, current_df= test_df, report_key_name= "data_drift_within_test_dataset") 
+                self.data_drift(base_df= base_df, current_df= test_df, report_key_name= "data_drift_within_test_dataset",
+                                base_profile= base_profile, current_profile= test_profile) 
 
             # we have to write/prepare the report -- in ".yaml"
             logging.info(f"write the report in yaml file")
@@ -6,7 +6,8 @@ from sensor.entity import config_entity,artifact_entity
 from sensor.exception import SensorException
 from sensor.logger import logging
 from sensor.utils import load_object
-from sklearn.metrics import f1_score
+from sensor.schema import SensorSchema
+from sensor.inference_plan import compile_transformer
 import pandas  as pd
 import os
 import sys
@@ -42,6 +43,8 @@ class ModelEvaluation:
 
     def initiate_model_evaluation(self)->artifact_entity.ModelEvaluationArtifact:
         try:
+            # sklearn is imported here (and not at the top) -- so that importing this file stays cheap
+            from sklearn.metrics import f1_score
             # if "saved_model" folder has model, then we will compare which model is best
             logging.info("if saved model folder has model the we will compare which model is best")
             latest_dir_path = self.model_resolver.get_latest_dir_path()
@@ -79,15 +82,21 @@ class ModelEvaluation:
             # now, we will do the comparison of the performance of both the models
             # we will do it for the test file ie we will use the "test.csv" file for this
             # we will use f1 score -- as it is a classification problem
-            test_df = pd.read_csv(self.data_ingestion_artifact.test_file_path)
+            # we need only the input features of both the transformers and the target column
+            # so, only these columns are read from the test file (column projection)
+            columns = list(dict.fromkeys(list(transformer.feature_names_in_) + 
+                                         list(current_transformer.feature_names_in_) + [TARGET_COLUMN]))
+            # the file is parsed with the schema of the current run (float32, "na" as np.nan)
+            schema = SensorSchema.load(file_path=self.data_transformation_artifact.schema_file_path)
+            test_df = schema.read(file_path=self.data_ingestion_artifact.test_file_path, columns=columns)
             target_df = test_df[TARGET_COLUMN]
             y_true =target_encoder.transform(target_df)
             
             # accuracy for the previous trained model 
             # ie the LATEST objects from the "saved_models" folder isnide the "sensor" folder
             # we will use f1 score -- as it is a classification problem
-            input_feature_name = list(transformer.feature_names_in_)
-            input_arr =transformer.transform(test_df[input_feature_name])
+            # (the transformer is compiled into one fused pass over its input columns -- refer "inference_plan.py")
+            input_arr =compile_transformer(transformer).transform(test_df)
             y_pred = model.predict(input_arr)
             # we will use "inverse_transform" to get back our actual labels -- ie  "pos" class and "neg class"
             # because we had encoded "1" and "0" for "pos" class and "neg class"
@@ -98,8 +107,7 @@ class ModelEvaluation:
             # accuracy for the current trained model 
             # ie the model which we just trained ie the mdodel which is in the training pipeline
             # we will use f1 score -- as it is a classification problem
-            input_feature_name = list(current_transformer.feature_names_in_)
-            input_arr =current_transformer.transform(test_df[input_feature_name])
+            input_arr =compile_transformer(current_transformer).transform(test_df)
             y_pred = current_model.predict(input_arr)
             y_true =current_target_encoder.transform(target_df)
             # we will use "inverse_transform" to get back our actual labels -- ie  "pos" class and "neg class"
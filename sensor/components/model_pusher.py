@@ -6,9 +6,12 @@ from sensor.entity.config_entity import ModelPusherConfig
 from sensor.exception import SensorException
 import os
 import sys
+import shutil
 from sensor.utils import load_object
 from sensor.utils import save_object
 from sensor.logger import logging
+from sensor.schema import SensorSchema
+from sensor.feature_store import link_or_copy
 from sensor.entity.artifact_entity import DataTransformationArtifact,ModelTrainerArtifact,ModelPusherArtifact
 
 class ModelPusher:
@@ -34,8 +37,48 @@ class ModelPusher:
         except Exception as e:
             raise SensorException(e, sys)
         
-def initiate_model_pusher(self,)->ModelPusherArtifact:
-        
+    # the compiled model (refer "compiled_model.py") -- None if the model cannot be compiled
+    # it has to give the same labels as the model on the (transformed) test set, else it is not pushed at all
+    def compile_model(self, model):
+        try:
+            import numpy as np
+            from sensor.compiled_model import compile_model
+            from sensor.utils import load_transformed_dataset
+            compiled_model = compile_model(model)
+            if compiled_model is None:
+                return None
+            x_test, _ = load_transformed_dataset(dir_path=self.data_transformation_artifact.transformed_test_path, mmap_mode="r")
+            mismatches = np.count_nonzero(model.predict(x_test) != compiled_model.predict(x_test))
+            if mismatches > 0:
+                raise Exception(f"the compiled model differs from the model for {mismatches} rows of the test set")
+            return compiled_model
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    # the model bundle (refer "model_bundle.py") -- written into the 'model_pusher' directory and loaded back;
+    # it has to give the same labels as the model on the (transformed) test set, else it is not pushed at all
+    # returns False if the objects cannot be bundled
+    def write_bundle(self, transformer, model, target_encoder, schema, compiled_model) -> bool:
+        try:
+            import numpy as np
+            from sensor.model_bundle import ModelBundle, write_model_bundle
+            from sensor.utils import load_transformed_dataset
+            bundle_path = self.model_pusher_config.pusher_bundle_path
+            if not write_model_bundle(file_path=bundle_path, transformer=transformer, model=model,
+                                      target_encoder=target_encoder, schema=schema, compiled_model=compiled_model):
+                return False
+            bundle = ModelBundle.load(file_path=bundle_path)
+            x_test, _ = load_transformed_dataset(dir_path=self.data_transformation_artifact.transformed_test_path, mmap_mode="r")
+            mismatches = np.count_nonzero(model.predict(x_test) != bundle.model.predict(x_test))
+            if mismatches > 0:
+                os.remove(bundle_path)
+                raise Exception(f"the model of the bundle differs from the model for {mismatches} rows of the test set")
+            return True
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def initiate_model_pusher(self,)->ModelPusherArtifact:
+
         try:
 
             # let us load the transformer, model and target encoder files
@@ -43,25 +86,68 @@ def initiate_model_pusher(self,)->ModelPusherArtifact:
             transformer = load_object(file_path=self.data_transformation_artifact.transform_object_path)
             model = load_object(file_path=self.model_trainer_artifact.model_path)
             target_encoder = load_object(file_path=self.data_transformation_artifact.target_encoder_path)
+            # the schema which the transformer was fitted with -- the batch prediction reads its input with it
+            schema = SensorSchema.load(file_path=self.data_transformation_artifact.schema_file_path)
+            compiled_model = None
+            if self.model_pusher_config.compile_model:
+                logging.info(f"compiling the model")
+                compiled_model = self.compile_model(model)
 
             # let us save the objects into 'model_pusher' directory
             logging.info(f"saving the objects into 'model_pusher' directory")
             save_object(file_path=self.model_pusher_config.pusher_transformer_path, obj=transformer)
             save_object(file_path=self.model_pusher_config.pusher_model_path, obj=model)
             save_object(file_path=self.model_pusher_config.pusher_target_encoder_path, obj=target_encoder)
+            schema.save(file_path=self.model_pusher_config.pusher_schema_path)
+            # which rows of the feature store the model has seen -- for the next incremental training
+            training_state_path = self.model_trainer_artifact.training_state_path
+            if training_state_path is not None:
+                link_or_copy(training_state_path, self.model_pusher_config.pusher_training_state_path)
+            if compiled_model is not None:
+                compiled_model.save(dir_path=self.model_pusher_config.pusher_compiled_model_dir)
+            bundled = False
+            if self.model_pusher_config.write_bundle:
+                logging.info(f"writing the model bundle")
+                bundled = self.write_bundle(transformer, model, target_encoder, schema, compiled_model)
 
             # let us save the objects in 'saved_models' dir
-            # first we will get the location where we need to save them
-            # here, we will get the location only ; no folders are created
-            logging.info(f"saving the objects in 'saved_models' dir")
-            transformer_path=self.model_resolver.get_latest_save_transformer_path()
-            model_path=self.model_resolver.get_latest_save_model_path()
-            target_encoder_path=self.model_resolver.get_latest_save_target_encoder_path()
+            # the lock of the registry is held until the new version is registered (refer "model_registry.py") --
+            # so two pipelines which push at the same time never pick the same version
+            with self.model_resolver.registry.lock():
+                # first we will get the location where we need to save them
+                # here, we will get the location only ; no folders are created
+                # (a folder of the new version can only be the leftover of a push which did not finish -- it was
+                # never registered, so nobody reads it; it is removed, so none of its files is left behind)
+                logging.info(f"saving the objects in 'saved_models' dir")
+                save_dir_path=self.model_resolver.get_latest_save_dir_path()
+                if os.path.exists(save_dir_path):
+                    logging.info(f"removing the unregistered folder {save_dir_path} of a push which did not finish")
+                    shutil.rmtree(save_dir_path)
+                transformer_path=self.model_resolver.get_latest_save_transformer_path()
+                model_path=self.model_resolver.get_latest_save_model_path()
+                target_encoder_path=self.model_resolver.get_latest_save_target_encoder_path()
+                schema_path=self.model_resolver.get_latest_save_schema_path()
+                save_training_state_path=self.model_resolver.get_latest_save_training_state_path()
+                compiled_model_path=self.model_resolver.get_latest_save_compiled_model_path()
+                bundle_path=self.model_resolver.get_latest_save_bundle_path()
+
+                # let us save the objects
+                if bundled:
+                    link_or_copy(self.model_pusher_config.pusher_bundle_path, bundle_path)
+                save_object(file_path=transformer_path, obj=transformer)
+                save_object(file_path=model_path, obj=model)
+                save_object(file_path=target_encoder_path, obj=target_encoder)
+                schema.save(file_path=schema_path)
+                if training_state_path is not None:
+                    link_or_copy(training_state_path, save_training_state_path)
+                if compiled_model is not None:
+                    compiled_model.save(dir_path=compiled_model_path)
 
-            # let us save the objects
-            save_object(file_path=transformer_path, obj=transformer)
-            save_object(file_path=model_path, obj=model)
-            save_object(file_path=target_encoder_path, obj=target_encoder)
+                # the new version becomes the production model only now -- that all its files are written
+                # (the "CURRENT" pointer of the registry is swapped with a rename)
+                self.model_resolver.registry.register(version=int(os.path.basename(save_dir_path)),
+                    metrics={"f1_train_score": self.model_trainer_artifact.f1_train_score,
+                             "f1_test_score": self.model_trainer_artifact.f1_test_score})
 
             # let us prepare the model pusher artifact
             model_pusher_artifact = ModelPusherArtifact(pusher_model_dir=self.model_pusher_config.pusher_model_dir,
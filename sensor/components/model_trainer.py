@@ -7,9 +7,10 @@ from sensor.logger import logging
 from typing import Optional
 import os
 import sys
-from xgboost import XGBClassifier
 from sensor import utils
-from sklearn.metrics import f1_score
+from sensor.instrumentation import instrument
+# xgboost and sklearn are imported inside the functions which use them -- so that importing this
+# file stays cheap
 
 class ModelTrainer:
 
@@ -31,40 +32,127 @@ class ModelTrainer:
     # refer the file "APS_failure_prediction.ipynb" inside the "EDA and Preprocessing" folder
     # there it is clearly proved that for our dataset, "XGBosst Classifier" is the best model   
     # we will use "XGBoost Classifier" model to do the training    
-    def train_model(self,x,y):
+    # how it is trained (and how the F1 scores are found) depends on the training engine -- refer
+    # "training_engine.py"; x_test and y_test are needed for the test score
+    # sample_weight: the weight of every row (refer "rebalancing.py") -- None => all rows weigh the same
+    # x may have missing values (np.nan, or a CSR matrix without them) -- refer "missing_values.py";
+    # xgboost takes both as they are and learns where the missing values go at every split
+    # params: hyperparameters of xgboost (eg: found by the tuning) -- on top of "training_params"
+    # base_model: continue boosting this model for "rounds" rounds (the warm start -- refer "incremental.py")
+    def train_model(self,x,y,x_test,y_test,sample_weight=None,params=None,base_model=None,rounds=None):
         try:
-            xgb_clf =  XGBClassifier()
-            xgb_clf.fit(x,y)
-            return xgb_clf
+            from sensor.training_engine import get_training_engine
+            from sensor.missing_values import matrix_nbytes
+            engine = get_training_engine(engine=self.model_trainer_config.training_engine,
+                                         params={**self.model_trainer_config.training_params, **(params or {})},
+                                         n_jobs=self.model_trainer_config.training_n_jobs)
+            logging.info(f"training engine: {engine.engine}")
+            with instrument("model_trainer.fit", rows=x.shape[0], bytes=matrix_nbytes(x)):
+                training_result = engine.train(x=x,y=y,x_test=x_test,y_test=y_test,sample_weight=sample_weight,
+                                               base_model=base_model,rounds=rounds)
+            return training_result
         except Exception as e:
             raise SensorException(e, sys)   
 
 
+    # searches the hyperparameters on the transformed train set -- returns the best configuration
+    def tune(self) -> dict:
+        try:
+            from sensor.tuning import HyperparameterTuner
+            tuner = HyperparameterTuner(dataset_path=self.data_transformation_artifact.transformed_train_path,
+                                        sample_weight_path=self.data_transformation_artifact.sample_weight_path,
+                                        strategy=self.model_trainer_config.tuning_strategy,
+                                        max_workers=self.model_trainer_config.tuning_max_workers,
+                                        cache_dir=self.model_trainer_config.tuning_cache_dir,
+                                        **self.model_trainer_config.tuning_params)
+            with instrument("model_trainer.tune"):
+                tuning_result = tuner.tune()
+            return tuning_result.best_params
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    # incremental training (refer "incremental.py") -- the production model, if the data transformation kept
+    # its transformer and wrote the delta of the train set; None => full retrain
+    def get_base_model(self):
+        try:
+            from sensor.predictor import ModelResolver
+            base_model_dir = self.data_transformation_artifact.base_model_dir
+            if not self.model_trainer_config.warm_start or base_model_dir is None or self.data_transformation_artifact.delta_train_path is None:
+                return None
+            model_path = os.path.join(base_model_dir, ModelResolver().model_dir_name, config_entity.MODEL_FILE_NAME)
+            logging.info(f"warm start from the production model: {model_path}")
+            return utils.load_object(file_path=model_path)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    # the warm start -- "base_model" is boosted further on the delta of the train set
+    # returns the training result -- or None if the model is not better than "base_model" on the test set
+    # (the model evaluation would reject it -- so the model is trained fully instead)
+    def warm_start(self, base_model, x_test, y_test):
+        try:
+            from sklearn.metrics import f1_score
+            x_delta, y_delta = utils.load_transformed_dataset(dir_path=self.data_transformation_artifact.delta_train_path, mmap_mode="r")
+            sample_weight = None
+            if self.data_transformation_artifact.delta_sample_weight_path is not None:
+                sample_weight = utils.load_numpy_array_data(file_path=self.data_transformation_artifact.delta_sample_weight_path)
+            logging.info(f"warm start: {self.model_trainer_config.warm_start_rounds} more rounds on the delta {x_delta.shape}")
+            training_result = self.train_model(x=x_delta,y=y_delta,x_test=x_test,y_test=y_test,sample_weight=sample_weight,
+                                               base_model=base_model,rounds=self.model_trainer_config.warm_start_rounds)
+
+            # the transformer was kept -- so the production model scores the same test set (none of its rows
+            # was a train row of the production model: a row keeps its side of the split when the feature
+            # store grows -- refer "split_test_rows" in "data_ingestion.py")
+            base_f1_test_score = f1_score(y_true=y_test, y_pred=base_model.predict(x_test))
+            logging.info(f"warm start: test score {training_result.f1_test_score}, production model {base_f1_test_score}")
+            if training_result.f1_test_score <= base_f1_test_score:
+                logging.info(f"warm start: the model is not better than the production model -- full retrain")
+                return None
+            return training_result
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
     def initiate_model_trainer(self,)->artifact_entity.ModelTrainerArtifact:
         try:
-            # let us load the numpy arrays ie train array and test array
+            # let us load the input and target feature of both train and test set
+            # the features (float32) and the target are stored separately and memory mapped (refer
+            # "load_transformed_dataset" in "utils.py") -- so they are not read into memory up front and
+            # not copied: xgboost and the predictions use the pages of the files as they are
             logging.info(f"loading train and test array")
-            train_arr = utils.load_numpy_array_data(file_path=self.data_transformation_artifact.transformed_train_path)
-            test_arr = utils.load_numpy_array_data(file_path=self.data_transformation_artifact.transformed_test_path)
-
-            # let us split input and target feature from both train and test array
-            # we want each column except for the last column (because last column is the target feature)
-            logging.info(f"splitting input and target feature from both train and test array")
-            x_train,y_train = train_arr[:,:-1],train_arr[:,-1]
-            x_test,y_test = test_arr[:,:-1],test_arr[:,-1]
-
-            # let us train the model
-            logging.info(f"train the model")
-            model = self.train_model(x=x_train,y=y_train)
-
-            # let us now do the prediction and calculate f1 score wrt train and test
-            logging.info(f"calculating f1 train score")
-            yhat_train = model.predict(x_train)
-            f1_train_score  =f1_score(y_true=y_train, y_pred=yhat_train)
-
-            logging.info(f"calculating f1 test score")
-            yhat_test = model.predict(x_test)
-            f1_test_score  =f1_score(y_true=y_test, y_pred=yhat_test)
+            x_train,y_train = utils.load_transformed_dataset(dir_path=self.data_transformation_artifact.transformed_train_path, mmap_mode="r")
+            x_test,y_test = utils.load_transformed_dataset(dir_path=self.data_transformation_artifact.transformed_test_path, mmap_mode="r")
+
+            # the weights of the train rows -- if the data transformation weighted the rows instead of
+            # adding new rows of the "pos" class
+            sample_weight = None
+            if self.data_transformation_artifact.sample_weight_path is not None:
+                logging.info(f"loading the sample weights")
+                sample_weight = utils.load_numpy_array_data(file_path=self.data_transformation_artifact.sample_weight_path)
+
+            # incremental training -- the production model is boosted further on the new rows (refer
+            # "incremental.py"); if there is nothing to warm start from, or the model is not good enough,
+            # the model is trained fully below
+            training_result, best_params = None, None
+            base_model = self.get_base_model()
+            if base_model is not None:
+                training_result = self.warm_start(base_model=base_model, x_test=x_test, y_test=y_test)
+            warm_started = training_result is not None
+
+            if not warm_started:
+                # let us search the hyperparameters first -- if the tuning is switched on (refer "tuning.py")
+                if self.model_trainer_config.tuning_strategy != "none":
+                    best_params = self.tune()
+
+                # let us train the model
+                # and calculate f1 score wrt train and test -- the engine either predicts both sets once more,
+                # or reads the scores from the evaluation log of xgboost (refer "training_engine.py")
+                logging.info(f"train the model")
+                training_result = self.train_model(x=x_train,y=y_train,x_test=x_test,y_test=y_test,sample_weight=sample_weight,
+                                                   params=best_params)
+            model = training_result.model
+            f1_train_score = training_result.f1_train_score
+            f1_test_score = training_result.f1_test_score
             
             logging.info(f"train score:{f1_train_score} and test score {f1_test_score}")
 
@@ -101,10 +189,22 @@ class ModelTrainer:
             logging.info(f"saving mode object")
             utils.save_object(file_path=self.model_trainer_config.model_path, obj=model)
 
+            # which rows of the feature store the model has seen -- for the next incremental training
+            # (only known with the incremental ingestion)
+            training_state_path = None
+            if self.data_transformation_artifact.feature_store_rows is not None:
+                from sensor.incremental import write_training_state
+                training_state_path = self.model_trainer_config.training_state_path
+                write_training_state(file_path=training_state_path, state={
+                    "feature_store_rows": int(self.data_transformation_artifact.feature_store_rows),
+                    "warm_started": warm_started,
+                    "base_model_dir": self.data_transformation_artifact.base_model_dir if warm_started else None})
+
             # in the end, let us prepare artifact
             logging.info(f"prepare the artifact")
             model_trainer_artifact  = artifact_entity.ModelTrainerArtifact(model_path=self.model_trainer_config.model_path, 
-            f1_train_score=f1_train_score, f1_test_score=f1_test_score)
+            f1_train_score=f1_train_score, f1_test_score=f1_test_score, best_params=best_params,
+            training_state_path=training_state_path, warm_started=warm_started)
             logging.info(f"model trainer artifact: {model_trainer_artifact}")
             return model_trainer_artifact
         
@@ -8,19 +8,14 @@
 
 '''
 
-# Provide the mongodb localhost url to connect python to mongodb
-client = pymongo.MongoClient("mongodb://localhost:27017")
-
 # However, it is not a good practice to hardcode the URL in the source code -- so we will create a 
 # new file called as ".env" inside the main folder (ie inside the "Sensor Fault Detection" folder)
 # this ".env" file is an "environment file" -- and we can read the values from it, anywhere else too
 
 # Create a class called as "EnvironmentVariable" -- to read/access all the "environment variables"
-import pymongo
-import pandas as pd
-import json
-from dataclasses import dataclass
 import os
+import threading
+from dataclasses import dataclass
 
 # we will use "dataclasses" library 
 # we are defining a "mongodb" variable -- it is a URL, which is a type of string whose value is
@@ -28,18 +23,48 @@ import os
 @dataclass
 class EnvironmentVariable :
     mongo_db_url:str = os.getenv("MONGO_DB_URL")
+    # the maximum number of connections the (one) client keeps open and reuses
+    mongo_max_pool_size:int = int(os.getenv("MONGO_MAX_POOL_SIZE", "10"))
 
 
 env_var = EnvironmentVariable()  # we created an object/variable of the "EnvironmentVariable" class
 
-mongo_client = pymongo.MongoClient(env_var.mongo_db_url)  
+# Earlier, the "mongo_client" was created right here -- ie at import time. So, every file which imported
+# "sensor.utils" (even the batch prediction, which never talks to mongodb) paid for importing pymongo
+# and creating a client. Now the client is created only when it is used for the first time, and then
+# the same (pooled) client is reused -- one per process, because a MongoClient must not be shared
+# with a forked child process.
+_mongo_client = None
+_mongo_client_pid = None
+_mongo_client_lock = threading.Lock()
+
+def get_mongo_client():
+    global _mongo_client, _mongo_client_pid
+    if _mongo_client is None or _mongo_client_pid != os.getpid():
+        with _mongo_client_lock:
+            if _mongo_client is None or _mongo_client_pid != os.getpid():
+                import pymongo
+                # connect=False -- the connection itself is also opened only on the first query
+                _mongo_client = pymongo.MongoClient(env_var.mongo_db_url, maxPoolSize=env_var.mongo_max_pool_size, connect=False)
+                _mongo_client_pid = os.getpid()
+    return _mongo_client
 # we did all this so that -- next time if we want to call/use the "mongo_client" variable to make
 # connections, we need not write the entire code again and again
 # ie everytime you run the project, the connections can be done easily
 
 
+# "from sensor.config import mongo_client" still works -- the client is created at that moment
+def __getattr__(name):
+    if name == "mongo_client":
+        return get_mongo_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 TARGET_COLUMN = "class"
 
+# the strings which stand for a missing value in the sensor data (ie "na")
+NA_TOKENS = ("na",)
+
 TARGET_COLUMN_MAPPING ={
     "pos" : 1,
     "neg" : 0
@@ -0,0 +1,163 @@
+'''
+The data drift engine -- the two sample Kolmogorov-Smirnov test of every column of a dataset against
+the base dataset.
+
+Earlier, "data_drift" called "scipy.stats.ks_2samp" column after column (once for train, once for test),
+on the raw columns with NaN in them -- and every call sorted both the columns again.
+Now:
+    - the test is computed from the sorted, NaN-free values of the profiles (refer "profiling.py") --
+      the base dataset is sorted ONCE and used for both train and test
+    - the missing values are left out of the test explicitly; a column with no values on one side is
+      not tested (and logged)
+    - the columns are split into groups and tested in a pool of worker processes (or threads)
+    - method="approximate" compares quantile sketches (refer "sketch.py") instead of the sorted values --
+      for datasets which are too large to sort
+'''
+
+import os
+import sys
+import numpy as np
+from dataclasses import dataclass
+from typing import Optional
+from sensor.exception import SensorException
+from sensor.logger import logging
+from sensor.profiling import DatasetProfile
+from sensor.sketch import QuantileSketch, DEFAULT_SKETCH_K
+
+DRIFT_METHODS = ("exact", "approximate")
+# up to this sample size scipy computes the exact p-value (the same limit as "ks_2samp(method='auto')")
+MAX_EXACT_N = 10000
+# below this many values (base + current, all the columns) the pool costs more than it saves
+MIN_PARALLEL_VALUES = 2_000_000
+
+
+@dataclass
+class DriftResult:
+    column:str
+    statistic:float
+    pvalue:float
+    n_base:int
+    n_current:int
+
+
+def _asymptotic_pvalue(statistic:float, n_base:int, n_current:int) -> float:
+    from scipy.stats import kstwo
+    m, n = sorted([float(n_base), float(n_current)], reverse=True)
+    return float(np.clip(kstwo.sf(statistic, np.round(m * n / (m + n))), 0, 1))
+
+
+# the KS test of two columns whose values are already sorted and NaN free
+# the statistic is the same as "scipy.stats.ks_2samp" (and the p-value too) -- but nothing is sorted again
+def ks_2samp_sorted(base_sorted:np.ndarray, current_sorted:np.ndarray):
+    n_base, n_current = len(base_sorted), len(current_sorted)
+    if max(n_base, n_current) <= MAX_EXACT_N:
+        from scipy.stats import ks_2samp
+        result = ks_2samp(base_sorted, current_sorted)
+        return float(result.statistic), float(result.pvalue)
+    # both the arrays are sorted -- so a stable argsort (timsort) only merges the two runs, in linear time
+    values = np.concatenate([base_sorted, current_sorted])
+    order = np.argsort(values, kind="stable")
+    from_base = order < n_base
+    cdf_base = np.cumsum(from_base) / n_base
+    cdf_current = np.cumsum(~from_base) / n_current
+    # equal values -- the CDFs are compared only after the last of them
+    values = values[order]
+    last = np.append(values[1:] != values[:-1], True)
+    statistic = float(np.abs(cdf_base[last] - cdf_current[last]).max())
+    return statistic, _asymptotic_pvalue(statistic, n_base, n_current)
+
+
+# the KS test of two sketches -- the CDFs are compared at every value kept by either of the sketches
+# the statistic is reduced by the rank error of both the sketches -- ie a difference which could be
+# only the error of the sketches is not reported as drift
+def ks_2samp_sketch(base_sketch:QuantileSketch, current_sketch:QuantileSketch):
+    base_values, _ = base_sketch.weighted_values()
+    current_values, _ = current_sketch.weighted_values()
+    values = np.concatenate([base_values, current_values])
+    statistic = float(np.abs(base_sketch.cdf(values) - current_sketch.cdf(values)).max())
+    statistic = max(statistic - base_sketch.rank_error - current_sketch.rank_error, 0.0)
+    return statistic, _asymptotic_pvalue(statistic, base_sketch.n, current_sketch.n)
+
+
+# this runs inside a worker -- it tests one group of columns
+# tasks: list of (column, base, current) -- sorted arrays (exact) or sketches (approximate)
+def _test_columns(tasks:list, method:str) -> list:
+    test = ks_2samp_sorted if method == "exact" else ks_2samp_sketch
+    results = []
+    for column, base, current in tasks:
+        statistic, pvalue = test(base, current)
+        n_base, n_current = (len(base), len(current)) if method == "exact" else (base.n, current.n)
+        results.append(DriftResult(column=column, statistic=statistic, pvalue=pvalue, n_base=n_base, n_current=n_current))
+    return results
+
+
+class DriftDetector:
+
+    # base_profile: the profile of the base dataset -- prepared once, and used for every dataset
+    # method: "exact" (sorted values) or "approximate" (quantile sketches)
+    # max_workers: size of the pool (None => number of cpus, 1 => no pool)
+    # executor: "process" (default) or "thread"
+    def __init__(self, base_profile:DatasetProfile, method:str="exact", max_workers:Optional[int]=None,
+                 executor:str="process", sketch_k:int=DEFAULT_SKETCH_K,
+                 min_parallel_values:int=MIN_PARALLEL_VALUES):
+        try:
+            if method not in DRIFT_METHODS:
+                raise Exception(f"unknown drift method: {method}, available methods: {list(DRIFT_METHODS)}")
+            self.base_profile = base_profile
+            self.method = method
+            self.max_workers = max_workers or os.cpu_count() or 1
+            self.executor = executor
+            self.sketch_k = sketch_k
+            self.min_parallel_values = min_parallel_values
+            self._base_sketches = dict()
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    # the values of one column which go into the test -- sorted values or a sketch
+    def _column_data(self, profile:DatasetProfile, column:str, cache:Optional[dict]=None):
+        if self.method == "exact":
+            return profile.get_sorted_values(column)
+        if cache is not None and column in cache:
+            return cache[column]
+        sketch = profile.get_sketch(column, k=self.sketch_k)
+        if cache is not None:
+            cache[column] = sketch
+        return sketch
+
+    # returns a list of "DriftResult" -- one per tested column
+    # columns: the columns to test (None => every numeric column of the base profile)
+    def detect(self, current_profile:DatasetProfile, columns:Optional[list]=None) -> list:
+        try:
+            columns = self.base_profile.numeric_columns if columns is None else columns
+            base_numeric_columns = set(self.base_profile.numeric_columns)
+            current_numeric_columns = set(current_profile.numeric_columns)
+
+            tasks = []
+            for column in columns:
+                if column not in base_numeric_columns or column not in current_numeric_columns:
+                    continue
+                base_index, current_index = self.base_profile.numeric_index(column), current_profile.numeric_index(column)
+                if self.base_profile.n_valid[base_index] == 0 or current_profile.n_valid[current_index] == 0:
+                    logging.info(f"column {column} has no values in one of the datasets -- not tested for drift")
+                    continue
+                tasks.append((column, self._column_data(self.base_profile, column, cache=self._base_sketches),
+                              self._column_data(current_profile, column)))
+
+            n_values = sum(len(base) + len(current) for _, base, current in tasks) if self.method == "exact" else 0
+            if self.max_workers <= 1 or len(tasks) <= 1 or (self.method == "exact" and n_values < self.min_parallel_values):
+                return _test_columns(tasks, self.method)
+
+            # a few groups per worker -- so one slow group does not keep the other workers idle
+            from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+            n_groups = min(len(tasks), 4 * self.max_workers)
+            groups = [tasks[index::n_groups] for index in range(n_groups)]
+            pool_class = ProcessPoolExecutor if self.executor == "process" else ThreadPoolExecutor
+            logging.info(f"testing {len(tasks)} columns for drift with {self.max_workers} {self.executor} workers")
+            with pool_class(max_workers=self.max_workers) as pool:
+                group_results = list(pool.map(_test_columns, groups, [self.method] * n_groups))
+
+            # back into the order of the columns
+            results = {result.column: result for results_ in group_results for result in results_}
+            return [results[column] for column, _, _ in tasks]
+        except Exception as e:
+            raise SensorException(e, sys)
@@ -8,12 +8,18 @@ For each of these components(blocks), we will create one class
 # Three dots (...) is equal to = "pass" keyword
 
 from dataclasses import dataclass
+from typing import Optional
 
 @dataclass    
 class DataIngestionArtifact:
     feature_store_file_path:str
     train_file_path:str           # these 3 are the outputs that will be generated by this component 
     test_file_path:str
+    schema_file_path:str          # the "schema.yaml" derived from the data (refer "schema.py")
+    # incremental ingestion only (None otherwise) -- the row of the feature store of every train row,
+    # and the number of rows in the feature store (refer "incremental.py")
+    train_rows_file_path:Optional[str] = None
+    feature_store_rows:Optional[int] = None
 
 @dataclass
 class DataValidationArtifact:
@@ -25,12 +31,24 @@ class DataTransformationArtifact:
     transformed_train_path:str   # these 4 are the outputs that will be generated by this component
     transformed_test_path:str   # all the 4 will be just 'locations' - so, string datatype
     target_encoder_path:str
+    schema_file_path:str         # the schema which the transformer was fitted with
+    sample_weight_path:Optional[str] = None     # the weights of the train rows (None => all rows weigh the same)
+    # incremental training (refer "incremental.py") -- the production model whose transformer was kept
+    # (None => a new transformer was fitted), the delta of the train set (new rows + replay sample) and
+    # the weights of its rows (None => no delta, ie full retrain), the rows of the feature store
+    base_model_dir:Optional[str] = None
+    delta_train_path:Optional[str] = None
+    delta_sample_weight_path:Optional[str] = None
+    feature_store_rows:Optional[int] = None
 
 @dataclass
 class ModelTrainerArtifact:
     model_path:str 
     f1_train_score:float 
     f1_test_score:float
+    best_params:Optional[dict] = None      # the hyperparameters found by the tuning (None => no tuning)
+    training_state_path:Optional[str] = None   # which rows of the feature store the model has seen (refer "incremental.py")
+    warm_started:bool = False                  # True => the production model was boosted further on the delta
 
 @dataclass    
 class ModelEvaluationArtifact:
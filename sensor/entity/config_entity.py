@@ -19,6 +19,11 @@ TEST_FILE_NAME = "test.csv"
 TRANSFORMER_OBJECT_FILE_NAME = "transformer.pkl"
 TARGET_ENCODER_OBJECT_FILE_NAME = "target_encoder.pkl"
 MODEL_FILE_NAME = "model.pkl"
+SCHEMA_FILE_NAME = "schema.yaml"
+TRAIN_ROWS_FILE_NAME = "train_rows.npy"
+TRAINING_STATE_FILE_NAME = "training_state.yaml"
+COMPILED_MODEL_DIR_NAME = "compiled_model"
+MODEL_BUNDLE_FILE_NAME = "model.bundle"
 
 # also, there is one more input  -ie "TrainingPipelineConfig"
 # we will start with the "TrainingPipelineConfig" class
@@ -30,8 +35,9 @@ MODEL_FILE_NAME = "model.pkl"
 # ie each and everytime we run the "training pipeline", there should be a NEW FOLDER CREATED everytime
 # called as "artifacts" along with time stamp
 class TrainingPipelineConfig:
-    def __init__(self):
-        self.artifact_dir = os.path.join(os.getcwd(),"artifacts", f"{datetime.now().strftime('%m%d%Y__%H%M%S')}")
+    # artifact_dir: an existing artifacts folder -- eg: to resume a run which failed (None => a new folder)
+    def __init__(self, artifact_dir:str=None):
+        self.artifact_dir = artifact_dir or os.path.join(os.getcwd(),"artifacts", f"{datetime.now().strftime('%m%d%Y__%H%M%S')}")
         # os.getcwd() -- gives the current directory -- and then in  the current directory, we
         # will CREATE A NEW FOLDER called as "artifacts"
         # with time stamp WITHIN this order -f"{datetime.now().strftime('%m%d%Y__%H%M%S')}")
@@ -39,6 +45,31 @@ class TrainingPipelineConfig:
         # so overall, it will look something like this -- artifacts/(time stamp)
         # (time stamp) folder is inside "artifacts" folder
 
+        # the stages whose inputs and config did not change are restored from this cache (hard links)
+        # instead of being run again (refer "stage_cache.py" inside the "pipeline" folder)
+        self.use_stage_cache = True
+        self.stage_cache_dir = os.path.join(os.getcwd(), "stage_cache")
+
+        # the stages which do not depend on each other run at the same time (refer "dag.py" inside the
+        # "pipeline" folder) -- at most "max_parallel_stages" of them, and only as long as their
+        # estimated memory fits into "memory_limit_mb" (None => 80% of the memory available at the start)
+        self.max_parallel_stages = 2
+        self.memory_limit_mb = None
+
+        # every run writes "run_report.json" (time, cpu, memory, rows and bytes of every stage and step --
+        # refer "instrumentation.py") into its artifacts folder; "metrics.prom" too if "prometheus_textfile"
+        # the stages named in SENSOR_PROFILE_STAGES (eg: "data_transformation,model_trainer") are profiled
+        # with SENSOR_PROFILE_MODE -- "cprofile" (default) or "sampling"
+        self.prometheus_textfile = False
+        self.profile_stages = [stage for stage in os.getenv("SENSOR_PROFILE_STAGES", "").split(",") if stage]
+        self.profile_mode = os.getenv("SENSOR_PROFILE_MODE", "cprofile")
+
+        # incremental_training = True -- the transformer of the production model is kept and the production
+        # model is boosted further on the new rows only (plus a sample of the older rows), instead of
+        # training a new model on the whole history; every run falls back to the full retrain when that
+        # is not possible or not good enough (refer "incremental.py")
+        self.incremental_training = False
+
 class DataIngestionConfig:
 
     # we will create an object called as "training_pipeline_config" 
@@ -60,6 +91,13 @@ class DataIngestionConfig:
             # (time stamp) folder is inside "artifacts" folder and "dat_ingestion" folder is inside (time stamp) folder
             self.data_ingestion_dir = os.path.join(training_pipeline_config.artifact_dir, "data_ingestion")
 
+            # the file format of the datasets written by "data ingestion" -- "parquet", "arrow" or "csv"
+            # (refer the file "dataset_storage.py" inside the "utils" folder)
+            # the file extension is the same as the format name, eg: "train.parquet"
+            # dataset_compression = None => the default compression of the format
+            self.dataset_format = "parquet"
+            self.dataset_compression = None
+
             # when we will download the dataframe from mongodb, we have to store the dataframe somewhere
             # so, we have to prepare the location where we want to store the dataframe 
             # "feature_store" is a common name given for this -- so, we will also use the same name
@@ -67,15 +105,42 @@ class DataIngestionConfig:
             # ie for the training pipeline, the data is got from 'feature_store' and not directly from
             # the database (MongoDB)
             # the below code creates "sensor.csv" file inside "feature_store"
-            self.feature_store_file_path = os.path.join(self.data_ingestion_dir,"feature_store",FILE_NAME)
+            self.feature_store_file_path = os.path.join(self.data_ingestion_dir,"feature_store",FILE_NAME.replace(".csv",f".{self.dataset_format}"))
 
             # ALSO, IN DATA INGESTION, WE WILL SPLIT THE DATA INTO "TRAIN FILE" AND "TEST FILE"
             # in below, "dataset" is a common folder which contains both "train.csv" and "test.csv"
             # the below code creates "train.csv" file and "test.csv" file inside "dataset" folder
-            self.train_file_path = os.path.join(self.data_ingestion_dir,"dataset",TRAIN_FILE_NAME)
-            self.test_file_path = os.path.join(self.data_ingestion_dir,"dataset",TEST_FILE_NAME)
+            self.train_file_path = os.path.join(self.data_ingestion_dir,"dataset",TRAIN_FILE_NAME.replace(".csv",f".{self.dataset_format}"))
+            self.test_file_path = os.path.join(self.data_ingestion_dir,"dataset",TEST_FILE_NAME.replace(".csv",f".{self.dataset_format}"))
             self.test_size = 0.2
 
+            # the schema of the data (the dtype of every column and the "na" strings)
+            self.schema_file_path = os.path.join(self.data_ingestion_dir,"schema",SCHEMA_FILE_NAME)
+
+            # the row of the feature store which every train row came from (incremental ingestion only) --
+            # the incremental training picks the new rows of the train set with it (refer "incremental.py")
+            self.train_rows_file_path = os.path.join(self.data_ingestion_dir,"dataset",TRAIN_ROWS_FILE_NAME)
+
+            # streaming = True -- read the collection batch by batch (as typed float32 chunks)
+            # instead of loading every document into a python list first
+            # "batch_size" is the number of documents read from the cursor at a time
+            self.streaming = True
+            self.batch_size = 10000
+
+            # n_partitions > 1 -- split the collection into "_id" ranges and read them in parallel
+            # worker processes (one MongoClient per process); the rows come back in "_id" order
+            self.n_partitions = 1
+
+            # incremental = True -- keep ONE persistent feature store outside the "artifacts" folder
+            # (ie "feature_store/<database>/<collection>") and pull only the documents which were
+            # added after the last run (the "_id" high watermark)
+            self.incremental = True
+            self.feature_store_dir = os.path.join(os.getcwd(), "feature_store", self.database_name, self.collection_name)
+            # every pull reads again the documents of the last "watermark_overlap_seconds" before the watermark
+            # (by the time inside their ObjectId) and drops the ones the store already has -- the ObjectIds of
+            # different clients are only roughly in order (refer "feature_store.py")
+            self.watermark_overlap_seconds = 300
+
         except Exception as e:
             raise SensorException(e,sys)    
 
@@ -110,6 +175,19 @@ class DataValidationConfig:
             # we need the path where we have our base/old file (or dataframe)
             self.base_file_path = os.path.join("E:\E\DATA SCIENCE INEURON\Machine Learning Projects (Industry Grade Projects)\1) Sensor Fault Detection\aps_failure_training_set1.csv")
 
+            # data drift (refer "drift.py")
+            # "exact" -- KS test on the sorted values; "approximate" -- KS test on quantile sketches,
+            # for datasets which are too large to sort (the profiles are then built chunk by chunk)
+            self.drift_method:str = "exact"
+            self.drift_max_workers = None           # None => number of cpus
+            self.drift_sketch_k:int = 1000          # size of the quantile sketches (approximate method)
+            self.profile_chunk_size:int = 100000    # rows per chunk when the profiles are built chunk by chunk
+
+            # the profile of the base dataset is kept here (outside the "artifacts" folder), keyed by the
+            # content hash of the base file -- ie the base file is read and profiled only when it changes
+            # (refer "reference_profile.py"); None => profile the base file on every run
+            self.reference_profile_dir = os.path.join(os.getcwd(), "reference_profiles")
+
     except Exception as e:
         raise SensorException(e,sys)
     
@@ -125,13 +203,65 @@ class DataTransformationConfig:
             self.transform_object_path = os.path.join(self.data_transformation_dir,"transformer" , TRANSFORMER_OBJECT_FILE_NAME)
             
             # we will store the transformed train and test files
-            # ".replace("csv","npz")" -- so that we will get the files in ".npz" format ie np array format ; and not in ".csv" format
-            self.transformed_train_path = os.path.join(self.data_transformation_dir, "transformed" , TRAIN_FILE_NAME.replace("csv","npz"))
-            self.transformed_test_path = os.path.join(self.data_transformation_dir, "transformed" , TEST_FILE_NAME.replace("csv","npz"))
+            # ".replace(".csv","")" -- every set is a directory (float32 "features.npy" + "labels.npy", refer
+            # "save_transformed_dataset" in "utils.py") ; and not a ".csv" file
+            self.transformed_train_path = os.path.join(self.data_transformation_dir, "transformed" , TRAIN_FILE_NAME.replace(".csv",""))
+            self.transformed_test_path = os.path.join(self.data_transformation_dir, "transformed" , TEST_FILE_NAME.replace(".csv",""))
 
             # we will have to define the path to store the "target encoder"
             # we can use ".obj" or ".pkl" -- here we will use ".pkl"
-            self.label_encoder_path = os.path.join(self.data_transformation_dir, "target encoder" , TARGET_ENCODER_OBJECT_FILE_NAME)
+            self.target_encoder_path = os.path.join(self.data_transformation_dir, "target encoder" , TARGET_ENCODER_OBJECT_FILE_NAME)
+
+            # the schema which the transformer is fitted with -- it is saved along with the model
+            self.schema_file_path = os.path.join(self.data_transformation_dir, "schema" , SCHEMA_FILE_NAME)
+
+            # how the imbalance of "pos" and "neg" is handled (refer "rebalancing.py") -- "smote_tomek",
+            # "approximate_smote", "class_weight", "random_undersample" or "none"
+            # "rebalance_params" are the arguments of the strategy (eg: {"sampling_ratio": 0.5})
+            # rebalance_test = True -- the test set is resampled too (as it always was)
+            self.rebalance_strategy = "smote_tomek"
+            self.rebalance_params = dict()
+            self.rebalance_test = True
+            self.rebalance_n_jobs = None            # threads of "approximate_smote" (None => number of cpus)
+            # the weights of the train rows -- written only by the strategies which weight the rows
+            self.sample_weight_path = os.path.join(self.data_transformation_dir, "transformed", "sample_weight.npy")
+
+            # "exact" -- the transformer is fitted on the whole train set in memory
+            # "streaming" -- fitted chunk by chunk with quantile sketches, and the data is transformed chunk
+            # by chunk into memory mapped files, ie the train set does not have to fit into memory (refer
+            # "streaming_transformer.py"); the quantiles of the scaler are then within a rank error of
+            # 3.3 / transformer_sketch_k (0.08% for 4000)
+            self.transformer_fit_mode = "exact"
+            self.transformer_sketch_k = 4000
+            self.transformation_chunk_size = 100000
+
+            # "impute" -- the "na" values are filled with 0 before scaling (as before)
+            # "native" -- the "na" values stay missing (np.nan) and xgboost handles them itself; only the
+            # observed values are scaled, and a matrix with at least "sparse_threshold" missing values is
+            # kept as a CSR matrix of the observed values (refer "missing_values.py")
+            # (the native mode needs a rebalancing strategy which supports missing values -- eg "class_weight")
+            self.missing_value_mode = "impute"
+            self.sparse_threshold = 0.5
+
+            # incremental training (refer "incremental.py") -- the transformer and the target encoder of the
+            # production model ("base_model_dir", the latest folder of "saved_models") are kept if the schema
+            # did not change, and the "delta" of the train set is written next to the train set: the new rows
+            # of the feature store plus "replay_ratio" older rows per new row (at least "min_replay_rows")
+            # there is no delta (ie the model trainer retrains fully) when the new rows are more than
+            # "max_delta_fraction" of the train set, or when more than "max_drifted_columns_share" of the
+            # columns of the new rows drifted from the older rows
+            self.incremental = training_pipeline_config.incremental_training
+            self.base_model_dir = None
+            if self.incremental:
+                # imported here -- "predictor.py" imports this file
+                from sensor.predictor import ModelResolver
+                self.base_model_dir = ModelResolver().get_latest_dir_path()
+            self.replay_ratio = 1.0
+            self.min_replay_rows = 10000
+            self.max_delta_fraction = 0.5
+            self.max_drifted_columns_share = 0.2
+            self.delta_train_path = os.path.join(self.data_transformation_dir, "transformed", "delta")
+            self.delta_sample_weight_path = os.path.join(self.data_transformation_dir, "transformed", "delta_sample_weight.npy")
     
     except Exception as e:
         raise SensorException(e,sys)
@@ -158,6 +288,38 @@ class ModelTrainerConfig:
             # example - "overfitting threshold" = 10% (ie 0.1)
             self.overfitting_threshold = 0.1
 
+            # how the model is trained (refer "training_engine.py") -- "booster" ("xgboost.train" on a quantized
+            # matrix which is built batch by batch from the memory mapped train set, with early stopping against a
+            # validation split and the scores taken from the evaluation log) or "xgbclassifier" ("XGBClassifier()"
+            # with the library defaults, as before -- it reads the whole train set into memory, and its peak
+            # memory is about 1.5x the one of "booster")
+            # "training_params" are the arguments of the engine (eg: {"tree_method": "approx",
+            # "early_stopping_rounds": 20, "max_depth": 6})
+            self.training_engine = "booster"
+            self.training_params = dict()
+            self.training_n_jobs = None             # threads of xgboost (None => number of cpus)
+
+            # hyperparameter search before the training (refer "tuning.py") -- "none" (the defaults of xgboost,
+            # as before), "successive_halving" or "hyperband"; the best configuration is then trained by the
+            # training engine and recorded in the model trainer artifact
+            # "tuning_params" are the arguments of the search (eg: {"n_candidates": 27, "eta": 3,
+            # "min_budget": 1/9, "search_space": {"max_depth": ["int", 3, 8]}})
+            # the finished trials are kept in "tuning_cache_dir" (by the fingerprint of the data) -- so a
+            # repeated run on the same data resumes instead of starting again
+            self.tuning_strategy = "none"
+            self.tuning_params = dict()
+            self.tuning_max_workers = None          # worker processes, each pinned to its own cpus (None => number of cpus)
+            self.tuning_cache_dir = os.path.join(os.getcwd(), "tuning_cache")
+
+            # incremental training (refer "incremental.py") -- if the data transformation kept the transformer
+            # of the production model and wrote the delta of the train set, the production model is boosted
+            # "warm_start_rounds" more rounds on the delta (no tuning then); it is kept only if it is better
+            # than the production model on the test set -- else the model is trained fully, as before
+            # the model remembers which rows of the feature store it has seen in "training_state_path"
+            self.warm_start = training_pipeline_config.incremental_training
+            self.warm_start_rounds = 20
+            self.training_state_path = os.path.join(self.model_trainer_dir,"model",TRAINING_STATE_FILE_NAME)
+
     except Exception as e:
         raise SensorException(e,sys) 
            
@@ -173,6 +335,9 @@ class ModelEvaluationConfig:
             # will accept the (newly) trained model
             self.change_threshold = 0.01
 
+            # the artifact of "model evaluation" is written here (refer "stage_cache.py")
+            self.model_evaluation_dir = os.path.join(training_pipeline_config.artifact_dir , "model_evaluation")
+
     except Exception as e:
         raise SensorException(e,sys)        
 
@@ -200,6 +365,18 @@ class ModelPusherConfig:
             self.pusher_model_path = os.path.join(self.pusher_model_dir,MODEL_FILE_NAME)
             self.pusher_transformer_path = os.path.join(self.pusher_model_dir,TRANSFORMER_OBJECT_FILE_NAME)
             self.pusher_target_encoder_path = os.path.join(self.pusher_model_dir,TARGET_ENCODER_OBJECT_FILE_NAME)
+            self.pusher_schema_path = os.path.join(self.pusher_model_dir,SCHEMA_FILE_NAME)
+            self.pusher_training_state_path = os.path.join(self.pusher_model_dir,TRAINING_STATE_FILE_NAME)
+
+            # the model is also exported as a "compiled" model (refer "compiled_model.py") -- its trees as
+            # numpy arrays which are loaded memory mapped; it is checked against the model on the test set first
+            self.compile_model = True
+            self.pusher_compiled_model_dir = os.path.join(self.pusher_model_dir,COMPILED_MODEL_DIR_NAME)
+
+            # everything the prediction needs is also written into one file -- the model bundle (refer
+            # "model_bundle.py"); it is loaded memory mapped and checked with its checksums
+            self.write_bundle = True
+            self.pusher_bundle_path = os.path.join(self.pusher_model_dir,MODEL_BUNDLE_FILE_NAME)
 
     except Exception as e:
         raise SensorException (e,sys)
@@ -0,0 +1,243 @@
+'''
+Every run of the training pipeline used to pull the whole collection from MongoDB again and write a
+fresh "feature_store/sensor.csv" into the new (timestamped) "artifacts" folder.
+
+The task of the file "feature_store.py" is to keep ONE persistent feature store outside of the
+"artifacts" folder. It remembers up to which document it has already read the collection (the
+"high watermark" -- ie the largest "_id"), so every run only pulls the NEW documents and appends
+them as a new partition. The partitions are stored in a columnar format (parquet).
+
+A bson ObjectId is made by the client which inserts the document -- so the ids are only roughly in
+insertion order across clients and processes: a document which is inserted after a pull can still get
+a smaller "_id" than the watermark (and "_id > watermark" would skip it forever). So every pull reads
+again an "overlap window" below the watermark (the ObjectIds of the last "overlap_seconds" before it, by
+the time inside the ObjectId) and drops the documents which are already in the store -- the store keeps
+the "_id" of every row inside that window (the "recent ids", one small parquet file per append which the
+manifest points to, so they change together with the manifest). A document which arrives later than the
+overlap window is still missed -- the window has to be longer than the clock skew and the insert delay of
+the writers. An "_id" which is not an ObjectId is taken as assigned in order (no overlap window).
+'''
+
+import os
+import sys
+import shutil
+import yaml
+import pandas as pd
+from datetime import timedelta
+from typing import Optional
+from sensor.exception import SensorException
+from sensor.logger import logging
+
+MANIFEST_FILE_NAME = "manifest.yaml"
+PARTITION_DIR_NAME = "partitions"
+SPLIT_DIR_NAME = "split"
+
+
+class FeatureStore:
+
+    # store_dir: the folder where the partitions and the manifest are kept
+    # the manifest is a small ".yaml" file -- list of partitions, number of rows and the watermark
+    def __init__(self, store_dir:str):
+        try:
+            self.store_dir = store_dir
+            self.partition_dir = os.path.join(self.store_dir, PARTITION_DIR_NAME)
+            self.split_dir = os.path.join(self.store_dir, SPLIT_DIR_NAME)
+            self.manifest_path = os.path.join(self.store_dir, MANIFEST_FILE_NAME)
+            os.makedirs(self.partition_dir, exist_ok=True)
+            self.manifest = self._read_manifest()
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def _read_manifest(self) -> dict:
+        if not os.path.exists(self.manifest_path):
+            return {"partitions": [], "n_rows": 0, "watermark": None, "split": None, "recent_ids": None}
+        with open(self.manifest_path, "r") as file_obj:
+            return yaml.safe_load(file_obj)
+
+    # manifest: the manifest to write (None => the manifest of this object)
+    def _write_manifest(self, manifest:Optional[dict]=None):
+        # we write into a temporary file first and then rename it -- so that a crash in the middle
+        # of writing never leaves a half written manifest behind
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w") as file_obj:
+            yaml.safe_dump(self.manifest if manifest is None else manifest, file_obj)
+        os.replace(tmp_path, self.manifest_path)
+
+    # "_id" is normally a bson ObjectId -- which yaml cannot store as it is
+    # so, we store the type along with the value
+    @staticmethod
+    def _encode_id(value) -> Optional[dict]:
+        if value is None:
+            return None
+        if type(value).__name__ == "ObjectId":
+            return {"type": "objectid", "value": str(value)}
+        if hasattr(value, "item"):
+            # numpy scalar -> python scalar
+            value = value.item()
+        return {"type": "raw", "value": value}
+
+    @staticmethod
+    def _decode_id(encoded:Optional[dict]):
+        if encoded is None:
+            return None
+        if encoded["type"] == "objectid":
+            from bson import ObjectId
+            return ObjectId(encoded["value"])
+        return encoded["value"]
+
+    @property
+    def watermark(self):
+        # the largest "_id" which is already inside the feature store (None if the store is empty)
+        return self._decode_id(self.manifest["watermark"])
+
+    @property
+    def n_rows(self) -> int:
+        return self.manifest["n_rows"]
+
+    # version of the store -- it changes whenever a new partition is appended
+    @property
+    def version(self) -> str:
+        return f"{len(self.manifest['partitions'])}-{self.n_rows}"
+
+    # the "_id" to read the collection after -- the watermark minus the overlap window (refer the top of
+    # this file); None if the store is empty
+    def read_after_id(self, overlap_seconds:float):
+        watermark = self.watermark
+        # a store which was written before the recent ids were kept cannot drop the documents of the
+        # window which it already has -- so it reads after the watermark once more
+        if watermark is None or type(watermark).__name__ != "ObjectId" or "recent_ids" not in self.manifest:
+            return watermark
+        from bson import ObjectId
+        return ObjectId.from_datetime(watermark.generation_time - timedelta(seconds=overlap_seconds))
+
+    # the "_id" (as a string) of the rows of the store inside the overlap window
+    @property
+    def recent_ids(self) -> set:
+        file_name = self.manifest.get("recent_ids")
+        if file_name is None:
+            return set()
+        return set(pd.read_parquet(os.path.join(self.store_dir, file_name))["_id"])
+
+    # df: the rows which were read after "read_after_id" (with "_id") -- the rows which the store already
+    # has are dropped, and the others are appended (without "_id")
+    # returns the number of rows appended
+    # the files are written in the order in which they are needed -- the partition, then the recent ids, then the
+    # manifest which points to both (refer "_add_partition"); a crash before the manifest leaves the store as it
+    # was, and the next append writes the same file names again
+    def append_new_rows(self, df:pd.DataFrame, overlap_seconds:float) -> int:
+        try:
+            ids = df["_id"].astype(str)
+            recent_ids = self.recent_ids
+            is_new = ~ids.isin(recent_ids).to_numpy()
+            if not is_new.all():
+                logging.info(f"{int((~is_new).sum())} rows of the overlap window are already in the feature store")
+            new_df, new_ids = df[is_new].drop(columns="_id"), df["_id"][is_new]
+            if new_df.shape[0] == 0:
+                return 0
+            watermark = max(new_ids.tolist() + ([self.watermark] if self.watermark is not None else []))
+            partition_name = self._write_partition(new_df)
+
+            recent_ids_file_name = None
+            if type(watermark).__name__ == "ObjectId":
+                # the ids which stay inside the window of the new watermark (the first 4 bytes of an
+                # ObjectId are its time, in seconds)
+                window_start = int(watermark.generation_time.timestamp() - overlap_seconds)
+                ids = pd.Series(sorted(recent_ids | set(new_ids.astype(str))), dtype=object)
+                ids = ids[ids.map(lambda value: int(value[:8], 16)) >= window_start]
+                # (named after the new partition -- so it never overwrites the file of the current manifest)
+                recent_ids_file_name = f"recent-ids-{len(self.manifest['partitions']):05d}.parquet"
+                pd.DataFrame({"_id": ids}).to_parquet(os.path.join(self.store_dir, recent_ids_file_name), index=False)
+
+            old_file_name = self.manifest.get("recent_ids")
+            self._add_partition(partition_name, n_rows=int(new_df.shape[0]), watermark=watermark,
+                                recent_ids=recent_ids_file_name)
+            # the old recent ids are removed only once the new manifest no longer points to them
+            if old_file_name is not None and old_file_name != recent_ids_file_name:
+                os.remove(os.path.join(self.store_dir, old_file_name))
+            return int(new_df.shape[0])
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    # df: the new rows (without "_id")
+    # watermark: the largest "_id" among the new rows
+    def append(self, df:pd.DataFrame, watermark) -> Optional[str]:
+        try:
+            if df.shape[0] == 0:
+                return None
+            partition_name = self._write_partition(df)
+            self._add_partition(partition_name, n_rows=int(df.shape[0]), watermark=watermark)
+            return os.path.join(self.partition_dir, partition_name)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    # writes the rows as the next partition file and returns its name -- the manifest does not point to it yet
+    def _write_partition(self, df:pd.DataFrame) -> str:
+        partition_name = f"part-{len(self.manifest['partitions']):05d}.parquet"
+        df.to_parquet(os.path.join(self.partition_dir, partition_name), index=False)
+        return partition_name
+
+    # adds a written partition to the manifest -- "updates" are more entries of the manifest which change with
+    # it (eg: the file of the recent ids); the new manifest is written first and becomes the manifest of this
+    # object only after that, so if the write fails, the store is unchanged both on disk and in memory
+    def _add_partition(self, partition_name:str, n_rows:int, watermark, **updates):
+        manifest = dict(self.manifest, **updates)
+        manifest["partitions"] = self.manifest["partitions"] + [{"file": partition_name, "n_rows": n_rows}]
+        manifest["n_rows"] = self.manifest["n_rows"] + n_rows
+        manifest["watermark"] = self._encode_id(watermark)
+        self._write_manifest(manifest)
+        self.manifest = manifest
+        logging.info(f"appended {n_rows} rows to feature store as {partition_name}")
+
+    # reads all the partitions back as one dataframe (in the order they were appended)
+    # columns: if given, only these columns are read (parquet is columnar)
+    def read(self, columns:Optional[list]=None) -> pd.DataFrame:
+        try:
+            frames = [pd.read_parquet(os.path.join(self.partition_dir, partition["file"]), columns=columns)
+                      for partition in self.manifest["partitions"]]
+            if len(frames) == 0:
+                return pd.DataFrame()
+            return pd.concat(frames, ignore_index=True)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    # the train/test split which was built from the current version of the store
+    # key: anything else the split depends on (eg: test_size) -- if the store and the key did not
+    # change, the cached split files are returned, else None
+    def get_cached_split(self, key:str) -> Optional[dict]:
+        split = self.manifest.get("split")
+        if split is None or split["version"] != self.version or split["key"] != key:
+            return None
+        paths = {name: os.path.join(self.split_dir, file_name) for name, file_name in split["files"].items()}
+        if not all(os.path.exists(path) for path in paths.values()):
+            return None
+        return paths
+
+    # file_paths: {"train": path, "test": path} -- the files are copied into the store
+    def save_split(self, key:str, file_paths:dict):
+        try:
+            os.makedirs(self.split_dir, exist_ok=True)
+            files = dict()
+            for name, file_path in file_paths.items():
+                file_name = f"{name}{os.path.splitext(file_path)[1]}"
+                # the old split file may be hard linked into the artifact folder of an earlier run --
+                # "link_or_copy" removes it first, so that earlier artifact is never overwritten
+                link_or_copy(file_path, os.path.join(self.split_dir, file_name))
+                files[name] = file_name
+            self.manifest["split"] = {"version": self.version, "key": key, "files": files}
+            self._write_manifest()
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+# hard link the file if possible (costs nothing), else copy it
+def link_or_copy(src:str, dst:str):
+    try:
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        if os.path.exists(dst):
+            os.remove(dst)
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copyfile(src, dst)
+    except Exception as e:
+        raise SensorException(e, sys)
@@ -0,0 +1,107 @@
+'''
+Every run of the training pipeline fitted a new transformer and trained a new "XGBClassifier" from
+nothing on the whole history -- even when "saved_models/<n>" already had a good model and only a small
+delta of new sensor data had arrived since.
+
+The task of the file "incremental.py" is the incremental ("warm start") training mode:
+    - the data transformation keeps the transformer and the target encoder of the production model
+      (refer "ModelResolver" in "predictor.py") if the schema did not change -- so the features mean the
+      same to the old trees and to the new ones
+    - it then writes the "delta" of the train set: the rows which were added to the feature store after
+      the production model was trained (refer "feature_store.py"), plus a stratified "replay" sample of
+      the older rows -- so the new trees do not forget the old data
+    - the model trainer continues boosting the production model on the delta (a few new rounds), instead
+      of training all the rounds on all the rows (refer "training_engine.py")
+every run falls back to the full retrain (as before) when:
+    - there is no production model, or it has no training state (eg: it was saved before this mode), or
+      the schema or the missing value mode changed, or the ingestion is not incremental
+    - there are no new rows, or so many that the warm start would not save much
+    - the new rows drifted from the older rows (the KS test of every column, refer "drift.py") -- the
+      transformer is then fitted again too
+    - the warm started model is not better than the production model on the test set (ie the model
+      evaluation would reject it)
+
+The production model remembers up to which row of the feature store it was trained -- in the file
+"training_state.yaml" next to "model.pkl".
+'''
+
+import os
+import sys
+import yaml
+import numpy as np
+import pandas as pd
+from typing import Optional
+from sensor.exception import SensorException
+from sensor.logger import logging
+
+# below this p-value a column counts as drifted (the same as the data validation)
+DRIFT_PVALUE = 0.05
+
+
+# the training state of a model -- eg: {"feature_store_rows": 60000, "warm_started": False}
+# None => the model has no training state
+def read_training_state(file_path:Optional[str]) -> Optional[dict]:
+    try:
+        if file_path is None or not os.path.exists(file_path):
+            return None
+        with open(file_path, "r") as file_obj:
+            return yaml.safe_load(file_obj)
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def write_training_state(file_path:str, state:dict):
+    try:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, "w") as file_obj:
+            yaml.safe_dump(state, file_obj)
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+# the rows of the train set to train on -- (new rows, replay rows), both sorted positions in the train set
+# train_rows: the row of the feature store of every train row (refer "split_and_save" in "data_ingestion.py")
+# trained_rows: the number of rows of the feature store which the production model was trained on
+# replay: "replay_ratio" older rows per new row (at least "min_replay_rows"), with the same share of every class
+def select_delta_rows(train_rows:np.ndarray, y:np.ndarray, trained_rows:int, replay_ratio:float=1.0,
+                      min_replay_rows:int=10000, random_state:int=42) -> tuple:
+    try:
+        from sensor.tuning import subsample_rows
+        new_rows = np.flatnonzero(train_rows >= trained_rows)
+        old_rows = np.flatnonzero(train_rows < trained_rows)
+        n_replay = min(old_rows.shape[0], max(min_replay_rows, int(round(replay_ratio * new_rows.shape[0]))))
+        replay_rows = subsample_rows(old_rows, y, n_rows=n_replay, random_state=random_state) if n_replay > 0 else old_rows[:0]
+        return new_rows, replay_rows
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+# a transformed matrix as a dataframe -- a CSR matrix (refer "missing_values.py") gets its missing values back
+def _to_frame(x, columns:list) -> pd.DataFrame:
+    if hasattr(x, "indptr"):
+        coo = x.tocoo()
+        dense = np.full(x.shape, np.nan, dtype=np.float32)
+        dense[coo.row, coo.col] = coo.data
+        x = dense
+    return pd.DataFrame(np.asarray(x), columns=columns)
+
+
+# the share of the columns whose values in "x_current" drifted from those in "x_reference" -- both are
+# transformed with the same transformer, whose scaling keeps the order of the values (ie the KS test
+# gives the same result as on the raw values)
+# the test is the approximate one (quantile sketches) -- only the share is needed here, and the exact
+# p-values of scipy get very slow for the small samples of a strongly drifted delta
+# returns (share, names of the drifted columns)
+def drifted_columns_share(x_reference, x_current, columns:list, max_workers:Optional[int]=None) -> tuple:
+    try:
+        from sensor.drift import DriftDetector
+        from sensor.profiling import profile_dataframe
+        detector = DriftDetector(base_profile=profile_dataframe(_to_frame(x_reference, columns)), method="approximate",
+                                 max_workers=max_workers)
+        results = detector.detect(current_profile=profile_dataframe(_to_frame(x_current, columns)))
+        if len(results) == 0:
+            return 0.0, []
+        drifted = [result.column for result in results if result.pvalue <= DRIFT_PVALUE]
+        return len(drifted) / len(results), drifted
+    except Exception as e:
+        raise SensorException(e, sys)
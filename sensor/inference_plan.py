@@ -0,0 +1,132 @@
+'''
+At prediction time the transformer ("transformer.pkl" -- a sklearn Pipeline, refer
+"DataTransformation.get_data_transformer_object") was called as "transformer.transform(df[columns])":
+    - "df[columns]" copies the feature columns into a new dataframe
+    - every step (SimpleImputer, then RobustScaler) validates its input again, converts it into a new
+      array, and returns one more new array
+ie the whole matrix is copied and walked many times -- for two cheap elementwise operations.
+
+The task of the file "inference_plan.py" is the "inference plan" of a fitted transformer -- the steps
+compiled into one fused pass into one preallocated float32 buffer:
+    gather the columns from the dataframe -> fill the missing values -> "(x - center) / scale"
+every value is copied once, straight from its column of the dataframe into the buffer (no "df[columns]"
+and no intermediate array). The buffer is column major (Fortran order) -- so a column is one contiguous
+copy, and the columns are walked in blocks which fit into the cache of the cpu: every block of columns is
+gathered, then filled, centered and scaled in place while it is in the cache. (xgboost and the compiled
+model read a column major matrix as it is -- its strides are part of the array.)
+The result is always float32; for float32 columns (as the schema reads them, refer "schema.py") it is the
+same as the sklearn transform, bit for bit:
+    - the same arithmetic (the center and the scale keep their own dtype, so the same roundings happen)
+    - the same errors for the infinite values
+
+"compile_transformer" returns the inference plan of the transformers it knows (an optional
+"SimpleImputer", an optional "RobustScaler" and an optional "MissingToSparse" of the native missing value
+mode, refer "missing_values.py") -- and for any other transformer a plan which simply calls its
+"transform", as before.
+'''
+
+import sys
+import numpy as np
+import pandas as pd
+from typing import Optional
+from sensor.exception import SensorException
+
+
+class InferencePlan:
+
+    # columns: the input columns of the transformer, in order
+    # fill_values: the value of every column which its missing values are filled with (None => not filled)
+    # center, scale: of every column (None => not centered / not scaled)
+    # sparse_threshold: of the "MissingToSparse" step (None => the result stays dense)
+    # block_bytes: the size of a block of columns
+    def __init__(self, columns:list, fill_values:Optional[np.ndarray]=None, center:Optional[np.ndarray]=None,
+                 scale:Optional[np.ndarray]=None, sparse_threshold:Optional[float]=None, block_bytes:int=1 << 18):
+        self.columns = columns
+        self.fill_values = fill_values
+        self.center = center
+        self.scale = scale
+        self.sparse_threshold = sparse_threshold
+        self.block_bytes = block_bytes
+
+    def transform(self, df:pd.DataFrame):
+        try:
+            # a view of every column where pandas can -- every value is copied (and converted) once, into the buffer
+            values = [df[column].to_numpy(copy=False) for column in self.columns]
+            x = np.empty((len(df), len(self.columns)), dtype=np.float32, order="F")
+            block_columns = max(1, self.block_bytes // max(1, x.shape[0] * x.itemsize))
+            for start in range(0, x.shape[1], block_columns):
+                stop = min(start + block_columns, x.shape[1])
+                block = x[:, start:stop]
+                for j in range(start, stop):
+                    block[:, j - start] = values[j]
+                # sklearn accepts np.nan but not np.inf
+                if np.isinf(block).any():
+                    raise ValueError(f"the input has infinite values")
+                if self.fill_values is not None:
+                    np.copyto(block, self.fill_values[start:stop], where=np.isnan(block), casting="unsafe")
+                if self.center is not None:
+                    np.subtract(block, self.center[start:stop], out=block, casting="same_kind")
+                if self.scale is not None:
+                    np.divide(block, self.scale[start:stop], out=block, casting="same_kind")
+            return x if self.sparse_threshold is None else missing_to_sparse(x, self.sparse_threshold)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+# the conversion of the "MissingToSparse" step (refer "missing_values.py") -- a CSR matrix of the observed values
+# if the share of missing values is at least "sparse_threshold", else "x" as it is; it is kept here (and not in
+# "missing_values.py", which imports sklearn) so that a plan can be loaded without sklearn (refer "model_bundle.py")
+def missing_to_sparse(x, sparse_threshold:float):
+    x = np.asarray(x, dtype=np.float32)
+    observed = ~np.isnan(x)
+    if x.size == 0 or 1 - observed.mean() < sparse_threshold:
+        return x
+    from scipy import sparse
+    # "observed" is walked row by row -- so the column indices of every row come out sorted
+    indptr = np.zeros(x.shape[0] + 1, dtype=np.int64)
+    np.cumsum(observed.sum(axis=1), out=indptr[1:])
+    indices = np.nonzero(observed)[1].astype(np.int32)
+    return sparse.csr_matrix((x[observed], indices, indptr), shape=x.shape)
+
+
+# the plan of a transformer which is not compiled -- its "transform" on the columns, as before
+class TransformerPlan:
+
+    def __init__(self, transformer):
+        self.transformer = transformer
+        self.columns = list(transformer.feature_names_in_)
+
+    def transform(self, df:pd.DataFrame):
+        return self.transformer.transform(df[self.columns])
+
+
+# the inference plan of a fitted transformer (refer "DataTransformation.get_data_transformer_object")
+def compile_transformer(transformer):
+    try:
+        from sklearn.impute import SimpleImputer
+        from sklearn.preprocessing import RobustScaler
+        from sensor.missing_values import MissingToSparse
+        steps = [step for _, step in getattr(transformer, "steps", [])]
+        imputer = steps.pop(0) if len(steps) > 0 and type(steps[0]) is SimpleImputer else None
+        scaler = steps.pop(0) if len(steps) > 0 and type(steps[0]) is RobustScaler else None
+        sparse_step = steps.pop(0) if len(steps) > 0 and type(steps[0]) is MissingToSparse else None
+        if len(steps) > 0 or (imputer is None and scaler is None) or not hasattr(transformer, "feature_names_in_"):
+            return TransformerPlan(transformer)
+
+        fill_values = None
+        if imputer is not None:
+            # the imputer of the data transformation fills a constant -- a statistic of np.nan (a column
+            # without values, which the imputer drops) or an indicator column are not compiled
+            statistics = np.asarray(imputer.statistics_, dtype=np.float64)
+            missing_values = imputer.missing_values
+            if imputer.add_indicator or np.isnan(statistics).any() or not (isinstance(missing_values, float) and np.isnan(missing_values)):
+                return TransformerPlan(transformer)
+            fill_values = statistics
+        center = scale = None
+        if scaler is not None:
+            center = scaler.center_ if scaler.with_centering else None
+            scale = scaler.scale_ if scaler.with_scaling else None
+        return InferencePlan(columns=list(transformer.feature_names_in_), fill_values=fill_values, center=center,
+                             scale=scale, sparse_threshold=None if sparse_step is None else sparse_step.sparse_threshold)
+    except Exception as e:
+        raise SensorException(e, sys)
@@ -0,0 +1,259 @@
+'''
+The only signal of where the time goes in a run used to be the ">>>>" banners in the log file.
+
+The task of the file "instrumentation.py" is to measure the stages of the pipeline and the important
+steps inside them (SMOTETomek, the model fit, the drift tests, reading and writing the datasets):
+    with instrument("data_transformation.fit_resample") as measurement:
+        x, y = smt.fit_resample(x, y)
+        measurement.rows = x.shape[0]
+records
+    wall time, CPU time (of the whole process, ie all its threads), peak RSS (the highest memory use of
+    the process -- since the outermost running block started, refer "instrument"), rows and bytes processed
+All the measurements of a run are written into the artifacts folder as "run_report.json" (and, if
+asked for, as a Prometheus textfile "metrics.prom" for the node exporter).
+
+A stage can also be profiled -- "cprofile" (every function call, "<stage>.prof" + a text summary)
+or "sampling" (the stack of the main thread every few milliseconds, as "folded" stacks for a flame
+graph; much lower overhead) -- into "<artifacts>/profiles".
+'''
+
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+from typing import Optional
+from sensor.exception import SensorException
+from sensor.logger import logging
+
+RUN_REPORT_FILE_NAME = "run_report.json"
+PROMETHEUS_FILE_NAME = "metrics.prom"
+PROFILE_DIR_NAME = "profiles"
+PROFILE_MODES = ("cprofile", "sampling")
+
+_measurements = []      # the finished measurements of this process (guarded by "_lock")
+_lock = threading.Lock()
+_active_blocks = 0      # the blocks which are running in all the threads (guarded by "_lock")
+# the measurements which are running in a thread (nested blocks) -- every thread has its own stack, so the
+# blocks of the stages which run in a ThreadPoolExecutor get the right parents
+_local = threading.local()
+
+
+def _stack() -> list:
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+class Measurement:
+
+    def __init__(self, name:str):
+        self.name = name
+        stack = _stack()
+        self.parent = stack[-1].name if len(stack) > 0 else None
+        self.rows = None
+        self.bytes = None
+        self.extra = dict()
+
+    def to_dict(self) -> dict:
+        record = {"name": self.name, "parent": self.parent, "pid": os.getpid(), "start": self.start,
+                  "wall_time_s": round(self.wall_time, 6), "cpu_time_s": round(self.cpu_time, 6),
+                  "peak_rss_mb": round(self.peak_rss / (1 << 20), 2), "rows": self.rows, "bytes": self.bytes}
+        record.update(self.extra)
+        return record
+
+
+# the peak RSS (high water mark) of this process, in bytes
+# on linux the high water mark can be reset (/proc/self/clear_refs) -- elsewhere it is the peak of the
+# whole process so far
+def _read_peak_rss() -> int:
+    try:
+        with open("/proc/self/status", "r") as file_obj:
+            for line in file_obj:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on linux, bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return 0
+
+
+# NOTE: the high water mark belongs to the whole process -- resetting it would also lower the peak of every
+# block which is running (the enclosing blocks, and the blocks of the other threads); so it is reset only
+# when a block starts while no other block runs (refer "instrument")
+def _reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as file_obj:
+            file_obj.write("5")
+    except OSError:
+        pass
+
+
+# the peak RSS of a block is the high water mark of the process at its end -- which is reset when the
+# outermost block (of all the threads) starts; so the peak of an outermost block is its own peak, and the
+# peak of a nested (or concurrent) block is the peak of the process since the outermost block started
+@contextmanager
+def instrument(name:str, rows:Optional[int]=None, bytes:Optional[int]=None):
+    global _active_blocks
+    measurement = Measurement(name)
+    measurement.rows, measurement.bytes = rows, bytes
+    with _lock:
+        if _active_blocks == 0:
+            _reset_peak_rss()
+        _active_blocks += 1
+    stack = _stack()
+    stack.append(measurement)
+    measurement.start = time.time()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        yield measurement
+    finally:
+        measurement.wall_time = time.perf_counter() - wall_start
+        measurement.cpu_time = time.process_time() - cpu_start
+        measurement.peak_rss = _read_peak_rss()
+        stack.pop()
+        with _lock:
+            _active_blocks -= 1
+            _measurements.append(measurement.to_dict())
+
+
+# the measurements of this process -- and forget them (eg: to send them from a worker process)
+def drain_measurements() -> list:
+    with _lock:
+        measurements = list(_measurements)
+        _measurements.clear()
+    return measurements
+
+
+# measurements of another process (eg: a stage which ran in a worker process)
+def add_measurements(measurements:list):
+    with _lock:
+        _measurements.extend(measurements)
+
+
+def reset_measurements():
+    with _lock:
+        _measurements.clear()
+
+
+def file_size(file_path:str) -> Optional[int]:
+    return os.path.getsize(file_path) if os.path.isfile(file_path) else None
+
+
+def _prometheus_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def write_run_report(artifact_dir:str, prometheus:bool=False, measurements:Optional[list]=None) -> str:
+    try:
+        if measurements is None:
+            with _lock:
+                measurements = list(_measurements)
+        os.makedirs(artifact_dir, exist_ok=True)
+        report_file_path = os.path.join(artifact_dir, RUN_REPORT_FILE_NAME)
+        with open(report_file_path, "w") as file_obj:
+            json.dump({"artifact_dir": artifact_dir, "measurements": measurements}, file_obj, indent=1, default=str)
+
+        if prometheus:
+            metrics = [("sensor_step_wall_seconds", "wall time of the step", "wall_time_s"),
+                       ("sensor_step_cpu_seconds", "cpu time of the process while the step ran", "cpu_time_s"),
+                       ("sensor_step_peak_rss_megabytes", "peak resident memory while the step ran", "peak_rss_mb"),
+                       ("sensor_step_rows", "rows processed by the step", "rows"),
+                       ("sensor_step_bytes", "bytes processed by the step", "bytes")]
+            lines = []
+            for metric, help_text, key in metrics:
+                lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge"]
+                # "seq" keeps the series apart when the same step ran more than once (eg: io.load_parquet)
+                for seq, record in enumerate(measurements):
+                    if record.get(key) is None:
+                        continue
+                    labels = f'name="{_prometheus_label(record["name"])}",pid="{record["pid"]}",seq="{seq}"'
+                    lines.append(f"{metric}{{{labels}}} {record[key]}")
+            # written into a temporary file and renamed -- the textfile collector never sees half a file
+            prometheus_file_path = os.path.join(artifact_dir, PROMETHEUS_FILE_NAME)
+            with open(f"{prometheus_file_path}.tmp", "w") as file_obj:
+                file_obj.write("\n".join(lines) + "\n")
+            os.replace(f"{prometheus_file_path}.tmp", prometheus_file_path)
+        return report_file_path
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+# samples the stack of one thread every "interval" seconds -- the counts of the "folded" stacks
+# ("module:function;module:function;...") can be drawn as a flame graph
+class StackSampler:
+
+    def __init__(self, interval:float=0.005):
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.counts = dict()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if len(stack) > 0:
+                folded = ";".join(reversed(stack))
+                self.counts[folded] = self.counts.get(folded, 0) + 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, file_path:str):
+        with open(file_path, "w") as file_obj:
+            for folded, count in sorted(self.counts.items(), key=lambda item: -item[1]):
+                file_obj.write(f"{folded} {count}\n")
+
+
+# profiles the block -- mode: "cprofile" or "sampling" (None => not profiled)
+@contextmanager
+def profile_block(name:str, profile_dir:str, mode:Optional[str]="cprofile"):
+    if mode is None:
+        yield
+        return
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"unknown profile mode: {mode}, available modes: {list(PROFILE_MODES)}")
+    os.makedirs(profile_dir, exist_ok=True)
+    if mode == "cprofile":
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(os.path.join(profile_dir, f"{name}.prof"))
+            with open(os.path.join(profile_dir, f"{name}.txt"), "w") as file_obj:
+                pstats.Stats(profiler, stream=file_obj).sort_stats("cumulative").print_stats(40)
+            logging.info(f"profile of {name} written into {profile_dir}")
+    else:
+        sampler = StackSampler()
+        sampler.start()
+        try:
+            yield
+        finally:
+            sampler.stop()
+            sampler.write(os.path.join(profile_dir, f"{name}.folded"))
+            logging.info(f"profile of {name} written into {profile_dir}")
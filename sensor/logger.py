@@ -33,7 +33,8 @@ LOG_FILE_PATH = os.path.join(LOG_FILE_DIR,LOG_FILE_NAME)
 # and then, specify "how will the log message be displayed" (ie format)
 # and then, "log level" (we have 6 levels in logging - notset, debug, info, warning, error, critical)
 logging.basicConfig(
-    filename= LOG_FILE_NAME,
+    # the log file goes into the "logs" folder (it used to be written into the current folder)
+    filename= LOG_FILE_PATH,
     format= "[%(asctime)s] %(lineno)d %(name)s - %(levelname)s - %(message)s",
     level= logging.INFO,
 )
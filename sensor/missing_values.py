@@ -0,0 +1,65 @@
+'''
+The APS data is very sparse -- many values of the histogram columns are "na". The transformer used to
+fill every "na" with a dense 0 ("SimpleImputer(strategy='constant', fill_value=0)") -- so xgboost could
+not tell a missing value from a real 0, and it could not use its own handling of missing values (at
+every split, the missing values go to the side which was learned for them).
+
+So, the data transformation has a "missing value mode" (refer "DataTransformationConfig"):
+    impute  -- the "na" values are filled with 0 and then scaled (as before, the default)
+    native  -- the "na" values stay np.nan: the scaler is fitted on and applied to the observed values
+               only ("RobustScaler" ignores np.nan), and xgboost gets np.nan as "missing"
+
+In the native mode, if the share of missing values of a matrix is at least "sparse_threshold", it is
+stored as a scipy CSR matrix of the OBSERVED values only (refer "MissingToSparse") -- a missing value is
+simply an absent entry (which xgboost also reads as missing), and a real 0 is kept as an entry.
+'''
+
+import sys
+import numpy as np
+# sklearn is imported at the top here -- the estimator below has to be an sklearn estimator; so this file
+# is imported inside the functions which use it (importing sklearn takes about a second)
+from sklearn.base import BaseEstimator, TransformerMixin
+from sensor.exception import SensorException
+
+MISSING_VALUE_MODES = ("impute", "native")
+
+# a CSR entry costs a value (float32) and a column index (int32) -- ie twice a dense value, so CSR
+# pays off only if at least half of the values are missing
+DEFAULT_SPARSE_THRESHOLD = 0.5
+
+
+# the last step of the transformer in the native mode -- so that the saved transformer does the same
+# at prediction time (refer "batch_prediction.py" and "model_evaluation.py")
+class MissingToSparse(TransformerMixin, BaseEstimator):
+
+    def __init__(self, sparse_threshold:float=DEFAULT_SPARSE_THRESHOLD):
+        self.sparse_threshold = sparse_threshold
+
+    # nothing to learn -- the decision is taken for every matrix which is transformed
+    def fit(self, x, y=None):
+        self.n_features_in_ = x.shape[1]
+        return self
+
+    def transform(self, x):
+        try:
+            # the conversion itself lives in "inference_plan.py" -- which does not import sklearn
+            from sensor.inference_plan import missing_to_sparse
+            return missing_to_sparse(x, self.sparse_threshold)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+# the transformer without the "MissingToSparse" step -- ie it always returns a dense array (with np.nan
+# for the missing values in the native mode); used where the rows are written into a dense memory
+# mapped file anyway (refer "streaming_transformer.py")
+def dense_steps(pipeline):
+    if isinstance(pipeline.steps[-1][1], MissingToSparse):
+        return pipeline[:-1]
+    return pipeline
+
+
+# the number of bytes of a dense array or of a scipy sparse matrix
+def matrix_nbytes(x) -> int:
+    if hasattr(x, "indptr"):
+        return x.data.nbytes + x.indices.nbytes + x.indptr.nbytes
+    return x.nbytes
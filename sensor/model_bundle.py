@@ -0,0 +1,217 @@
+'''
+A deployed model used to be three dill pickles in three folders ("transformer/transformer.pkl",
+"model/model.pkl", "target_encoder/target_encoder.pkl" -- refer "ModelResolver" in "predictor.py"):
+    - every path was resolved on its own, and every file was unpickled on its own (unpickling a Pipeline,
+      an XGBClassifier and a LabelEncoder imports sklearn and xgboost, and copies the whole model)
+    - the three files were written one after the other -- a reader could see a half pushed model, or mix
+      the files of two versions
+
+The task of the file "model_bundle.py" is the "model bundle" -- everything the prediction needs in ONE
+versioned file ("model.bundle", next to the three pickles):
+    - a header: the magic bytes, the format version, the length and the sha256 checksum of the manifest
+    - the manifest (json): the input columns, the label mapping (the classes of the target encoder), the
+      schema (refer "schema.py"), the metadata of the model, and the offset, length and sha256 checksum of
+      every section below
+    - the sections (every one aligned to 64 bytes):
+        the preprocessing plan -- the fill values, the center and the scale (refer "inference_plan.py"),
+                                  every one in its own dtype (so the same roundings happen)
+        the model              -- the booster in the native binary format of xgboost ("ubj")
+        the compiled model     -- the arrays of the compiled model (refer "compiled_model.py"), if the
+                                  model was compiled
+The file is written into a temporary file and then renamed -- so a reader sees the whole bundle or none.
+
+"ModelBundle.load" maps the file into memory (mmap) and checks the checksums: the arrays are views of the
+mapped file (nothing is copied or unpickled), and neither sklearn nor xgboost is imported -- xgboost is
+imported only when "model" is used for the first time (the compiled model of a small input file does
+without it). (refer "benchmarks/bench_model_bundle.py")
+
+Only a transformer which compiles into an "InferencePlan" and a model of xgboost can be bundled; for the
+others "write_model_bundle" returns False, and the prediction keeps using the three pickles.
+'''
+
+import os
+import sys
+import json
+import mmap
+import struct
+import hashlib
+import numpy as np
+from datetime import datetime
+from typing import Optional
+from sensor.exception import SensorException
+from sensor.logger import logging
+
+BUNDLE_MAGIC = b"SENSORBD"
+BUNDLE_FORMAT_VERSION = 1
+# magic (8 bytes), format version (uint32), unused (uint32), length of the manifest (uint64), sha256 of the manifest
+BUNDLE_HEADER = struct.Struct("<8sIIQ32s")
+BUNDLE_ALIGNMENT = 64
+PLAN_ARRAYS = ("fill_values", "center", "scale")
+
+
+# the target encoder without sklearn -- "transform" and "inverse_transform" of a fitted "LabelEncoder"
+# (its classes are sorted, so a label is found with a binary search)
+class LabelMapping:
+
+    def __init__(self, classes:np.ndarray):
+        self.classes_ = classes
+
+    def transform(self, y) -> np.ndarray:
+        y = np.asarray(y)
+        index = np.searchsorted(self.classes_, y)
+        unknown = (index >= len(self.classes_)) | (self.classes_[np.minimum(index, len(self.classes_) - 1)] != y)
+        if unknown.any():
+            raise ValueError(f"y contains previously unseen labels: {np.unique(y[unknown]).tolist()}")
+        return index
+
+    def inverse_transform(self, y) -> np.ndarray:
+        return self.classes_[np.asarray(y)]
+
+
+class ModelBundle:
+
+    # manifest: the manifest of the file; buffer: the mapped file (the sections are read from it)
+    def __init__(self, manifest:dict, buffer):
+        try:
+            from sensor.schema import SensorSchema
+            from sensor.inference_plan import InferencePlan
+            self.manifest = manifest
+            self.buffer = buffer
+            plan = manifest["plan"]
+            self.plan = InferencePlan(columns=plan["columns"], sparse_threshold=plan["sparse_threshold"],
+                                      **{name: self._array(name) for name in PLAN_ARRAYS if name in manifest["sections"]})
+            labels = manifest["labels"]
+            self.target_encoder = LabelMapping(np.array(labels["classes"], dtype=labels["dtype"]))
+            self.schema = SensorSchema(**manifest["schema"])
+            self.compiled_model = None
+            if manifest["compiled_model"] is not None:
+                from sensor.compiled_model import CompiledTreeEnsemble, COMPILED_MODEL_ARRAYS
+                self.compiled_model = CompiledTreeEnsemble(**{name: self._array(f"compiled_model/{name}") for name in COMPILED_MODEL_ARRAYS},
+                                                           **manifest["compiled_model"])
+            self._model = None
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    # a section as an array -- a view of the mapped file
+    def _array(self, name:str) -> np.ndarray:
+        section = self.manifest["sections"][name]
+        return np.frombuffer(self.buffer, dtype=section["dtype"], count=int(np.prod(section["shape"])),
+                             offset=section["offset"]).reshape(section["shape"])
+
+    # the model -- the booster is built from its section when it is used for the first time
+    @property
+    def model(self):
+        try:
+            if self._model is None:
+                import xgboost as xgb
+                from sensor.training_engine import BoosterClassifier
+                section = self.manifest["sections"]["booster"]
+                booster = xgb.Booster()
+                booster.load_model(bytearray(memoryview(self.buffer)[section["offset"]:section["offset"] + section["length"]]))
+                n_rounds = self.manifest["model"]["n_rounds"]
+                self._model = BoosterClassifier(booster, best_iteration=None if n_rounds is None else n_rounds - 1)
+            return self._model
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    # verify: check the sha256 checksums of the manifest and of every section
+    @classmethod
+    def load(cls, file_path:str, verify:bool=True) -> "ModelBundle":
+        try:
+            with open(file_path, "rb") as file_obj:
+                # the mapping stays valid after the file is closed
+                buffer = mmap.mmap(file_obj.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, _, manifest_length, manifest_sha256 = BUNDLE_HEADER.unpack_from(buffer, 0)
+            if magic != BUNDLE_MAGIC:
+                raise Exception(f"{file_path} is not a model bundle")
+            if version != BUNDLE_FORMAT_VERSION:
+                raise Exception(f"{file_path} is a model bundle of format version {version} (expected {BUNDLE_FORMAT_VERSION})")
+            manifest_bytes = buffer[BUNDLE_HEADER.size:BUNDLE_HEADER.size + manifest_length]
+            if verify:
+                if hashlib.sha256(manifest_bytes).digest() != manifest_sha256:
+                    raise Exception(f"the manifest of {file_path} is corrupt (checksum mismatch)")
+            manifest = json.loads(manifest_bytes)
+            if verify:
+                view = memoryview(buffer)
+                for name, section in manifest["sections"].items():
+                    if hashlib.sha256(view[section["offset"]:section["offset"] + section["length"]]).hexdigest() != section["sha256"]:
+                        raise Exception(f"the section {name} of {file_path} is corrupt (checksum mismatch)")
+                view.release()
+            return cls(manifest=manifest, buffer=buffer)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+# writes the bundle of a pushed model into "file_path" -- False (and nothing written) if it cannot be bundled
+# transformer, model, target_encoder, schema: the objects which are pushed; compiled_model: None => not compiled
+def write_model_bundle(file_path:str, transformer, model, target_encoder, schema, compiled_model=None) -> bool:
+    try:
+        from sensor.inference_plan import InferencePlan, compile_transformer
+        from sensor.compiled_model import COMPILED_MODEL_ARRAYS, get_model_booster
+        plan = compile_transformer(transformer)
+        if not isinstance(plan, InferencePlan):
+            logging.info(f"cannot bundle a transformer of type {type(transformer).__name__}")
+            return False
+        booster, n_rounds = get_model_booster(model)
+        if booster is None:
+            logging.info(f"cannot bundle a model of type {type(model).__name__}")
+            return False
+
+        # the sections -- name -> bytes (and the dtype and shape of an array)
+        sections = {}
+        def add_array(name, array):
+            array = np.ascontiguousarray(array)
+            sections[name] = (array.tobytes(), {"dtype": array.dtype.str, "shape": list(array.shape)})
+        for name in PLAN_ARRAYS:
+            if getattr(plan, name) is not None:
+                add_array(name, getattr(plan, name))
+        sections["booster"] = (bytes(booster.save_raw(raw_format="ubj")), {})
+        compiled_model_meta = None
+        if compiled_model is not None:
+            for name, dtype in COMPILED_MODEL_ARRAYS.items():
+                add_array(f"compiled_model/{name}", np.asarray(getattr(compiled_model, name), dtype=dtype))
+            compiled_model_meta = {"base_margin": float(compiled_model.base_margin), "n_features": int(compiled_model.n_features),
+                                   "max_depth": int(compiled_model.max_depth)}
+
+        # the offsets of the sections depend on the length of the manifest, which contains them -- so the
+        # offsets are counted from the (aligned) end of the manifest, and the manifest is padded to a
+        # fixed length after the offsets are known
+        manifest = {"format_version": BUNDLE_FORMAT_VERSION,
+                    "created_at": datetime.now().isoformat(),
+                    "plan": {"columns": list(plan.columns), "sparse_threshold": plan.sparse_threshold},
+                    "model": {"format": "xgboost-ubj", "n_rounds": n_rounds},
+                    "labels": {"classes": np.asarray(target_encoder.classes_).tolist(),
+                               "dtype": np.asarray(target_encoder.classes_).dtype.str},
+                    "schema": schema.to_dict(),
+                    "compiled_model": compiled_model_meta,
+                    "sections": {}}
+        relative_offset = 0
+        for name, (data, meta) in sections.items():
+            manifest["sections"][name] = {"offset": relative_offset, "length": len(data),
+                                          "sha256": hashlib.sha256(data).hexdigest(), **meta}
+            relative_offset += -(-len(data) // BUNDLE_ALIGNMENT) * BUNDLE_ALIGNMENT
+        # the largest offset has at most 20 digits -- so the manifest is sized with 20 digits for every offset
+        manifest_length = len(json.dumps(manifest).encode()) + 20 * len(sections)
+        data_start = -(-(BUNDLE_HEADER.size + manifest_length) // BUNDLE_ALIGNMENT) * BUNDLE_ALIGNMENT
+        for section in manifest["sections"].values():
+            section["offset"] += data_start
+        manifest_bytes = json.dumps(manifest).encode()
+        manifest_bytes += b" " * (data_start - BUNDLE_HEADER.size - len(manifest_bytes))
+
+        # we write into a temporary file first and then rename it -- so that a reader never sees a half
+        # written bundle
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, "wb") as file_obj:
+            file_obj.write(BUNDLE_HEADER.pack(BUNDLE_MAGIC, BUNDLE_FORMAT_VERSION, 0, len(manifest_bytes),
+                                              hashlib.sha256(manifest_bytes).digest()))
+            file_obj.write(manifest_bytes)
+            for name, (data, _) in sections.items():
+                file_obj.write(data)
+                file_obj.write(b"\0" * (-len(data) % BUNDLE_ALIGNMENT))
+            file_obj.flush()
+            os.fsync(file_obj.fileno())
+        os.replace(tmp_path, file_path)
+        return True
+    except Exception as e:
+        raise SensorException(e, sys)
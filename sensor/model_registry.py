@@ -0,0 +1,189 @@
+'''
+The "saved_models" folder (refer "ModelResolver" in "predictor.py") used to be just its version folders
+("saved_models/0", "saved_models/1", ...) -- and the production model was the largest of them:
+    - every lookup listed the whole folder and converted every name into an int (and crashed on any other
+      name), and the path of every saved file did it again
+    - the new version was visible to the batch prediction as soon as its folder was created -- ie before
+      its files were written
+    - two pipelines which pushed at the same time could pick the same new version
+
+The task of the file "model_registry.py" is the "registry index" of the "saved_models" folder:
+    registry.yaml  -- the index: every version with its time, its metrics and the sha256 of its files
+    CURRENT        -- the pointer to the production version (one line -- the number of its folder); it is
+                      replaced with a rename once the new version is complete, so a reader sees the old
+                      version or the new one, never a half pushed one
+    registry.lock  -- the file lock of the pushes -- one push at a time picks the next version, writes it
+                      and registers it
+
+Both files are written into a temporary file and renamed (like the manifest of "feature_store.py"). The
+files are read through a cache which is checked with one "os.stat" (inode, mtime, size) -- so looking up
+the production model reads no folder and no file once it is cached, however many versions there are.
+
+A "saved_models" folder without the index (pushed before the index existed) still works: its largest
+(integer) folder is the production model, and the first push adds the older folders to the index.
+'''
+
+import os
+import sys
+import yaml
+import hashlib
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional
+from sensor.exception import SensorException
+from sensor.logger import logging
+
+REGISTRY_INDEX_FILE_NAME = "registry.yaml"
+CURRENT_FILE_NAME = "CURRENT"
+REGISTRY_LOCK_FILE_NAME = "registry.lock"
+
+# file path -> ((inode, mtime, size), parsed content) -- shared by all the registries of the process
+_file_cache = {}
+
+
+# the parsed content of a file -- parsed again only if the file was changed (or replaced) since it was cached;
+# None if the file does not exist
+def _read_cached(file_path:str, parse):
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        _file_cache.pop(file_path, None)
+        return None
+    key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    cached = _file_cache.get(file_path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    with open(file_path, "r") as file_obj:
+        content = parse(file_obj.read())
+    _file_cache[file_path] = (key, content)
+    return content
+
+
+# we write into a temporary file first and then rename it -- so that a reader never sees a half written file
+def _write_atomic(file_path:str, text:str):
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as file_obj:
+        file_obj.write(text)
+        file_obj.flush()
+        os.fsync(file_obj.fileno())
+    os.replace(tmp_path, file_path)
+
+
+def _file_sha256(file_path:str) -> str:
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as file_obj:
+        for chunk in iter(lambda: file_obj.read(1 << 20), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+# an exclusive lock on the file "lock_path" -- "with file_lock(path): ..." waits until no other process holds it
+@contextmanager
+def file_lock(lock_path:str):
+    os.makedirs(os.path.dirname(lock_path) or ".", exist_ok=True)
+    with open(lock_path, "a") as file_obj:
+        try:
+            import fcntl
+            lock, unlock = (lambda: fcntl.flock(file_obj.fileno(), fcntl.LOCK_EX),
+                            lambda: fcntl.flock(file_obj.fileno(), fcntl.LOCK_UN))
+        except ImportError:
+            # windows -- the first byte of the file is locked (msvcrt retries for 10 seconds, then raises)
+            import msvcrt
+            lock, unlock = (lambda: msvcrt.locking(file_obj.fileno(), msvcrt.LK_LOCK, 1),
+                            lambda: msvcrt.locking(file_obj.fileno(), msvcrt.LK_UNLCK, 1))
+        lock()
+        try:
+            yield
+        finally:
+            unlock()
+
+
+class ModelRegistry:
+
+    # registry_dir: the "saved_models" folder
+    def __init__(self, registry_dir:str):
+        self.registry_dir = registry_dir
+        self.index_path = os.path.join(registry_dir, REGISTRY_INDEX_FILE_NAME)
+        self.current_path = os.path.join(registry_dir, CURRENT_FILE_NAME)
+        self.lock_path = os.path.join(registry_dir, REGISTRY_LOCK_FILE_NAME)
+
+    # the version folders on disk -- the integer names only (the other files and folders are ignored)
+    def scan_versions(self) -> list:
+        try:
+            return sorted(int(name) for name in os.listdir(self.registry_dir)
+                          if name.isdigit() and os.path.isdir(os.path.join(self.registry_dir, name)))
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    # the index -- {"versions": [{"version", "created_at", "metrics", "files"}, ...]}; None => no index yet
+    def read_index(self) -> Optional[dict]:
+        try:
+            return _read_cached(self.index_path, yaml.safe_load)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    # the production version -- None => no model
+    def current_version(self) -> Optional[int]:
+        try:
+            current = _read_cached(self.current_path, lambda text: int(text.strip()))
+            if current is not None:
+                return current
+            # a registry without the pointer -- pushed before the index existed: the largest folder
+            versions = self.scan_versions()
+            return max(versions) if len(versions) > 0 else None
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    # the version of the next push -- one more than the largest registered version; a folder of this version
+    # can exist only as the leftover of a push which did not finish (it was never registered)
+    def next_version(self) -> int:
+        try:
+            index = self.read_index()
+            versions = [entry["version"] for entry in index["versions"]] if index is not None else self.scan_versions()
+            return max(versions) + 1 if len(versions) > 0 else 0
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    # the file lock of the pushes -- "with registry.lock(): ..." waits until no other process holds it
+    @contextmanager
+    def lock(self):
+        logging.info(f"waiting for the lock of the model registry: {self.lock_path}")
+        with file_lock(self.lock_path):
+            yield self
+
+    # adds the version (its folder is complete) to the index and makes it the production version
+    # it has to be called with the lock held; metrics: eg {"f1_test_score": 0.97}
+    def register(self, version:int, metrics:Optional[dict]=None):
+        try:
+            version_dir = os.path.join(self.registry_dir, f"{version}")
+            files = {}
+            for dir_path, dir_names, file_names in os.walk(version_dir):
+                dir_names.sort()
+                for file_name in sorted(file_names):
+                    file_path = os.path.join(dir_path, file_name)
+                    files[os.path.relpath(file_path, version_dir).replace(os.sep, "/")] = _file_sha256(file_path)
+            index = self.read_index()
+            if index is None:
+                # the folders which were pushed before the index existed
+                entries = [{"version": old_version, "created_at": None, "metrics": None, "files": None}
+                           for old_version in self.scan_versions() if old_version != version]
+            else:
+                entries = [entry for entry in index["versions"] if entry["version"] != version]
+            entries.append({"version": version, "created_at": datetime.now().isoformat(),
+                            "metrics": None if metrics is None else {name: float(value) for name, value in metrics.items()},
+                            "files": files})
+            _write_atomic(self.index_path, yaml.safe_dump({"versions": entries}, sort_keys=False))
+            self.set_current(version)
+            logging.info(f"registered version {version} of the model registry {self.registry_dir}")
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    # swaps the production version (eg back to an older one) -- a registered version only
+    def set_current(self, version:int):
+        try:
+            index = self.read_index()
+            if index is None or version not in [entry["version"] for entry in index["versions"]]:
+                raise Exception(f"version {version} is not registered in {self.index_path}")
+            _write_atomic(self.current_path, f"{version}\n")
+        except Exception as e:
+            raise SensorException(e, sys)
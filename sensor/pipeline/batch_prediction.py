@@ -3,7 +3,9 @@ from sensor.exception import SensorException
 from sensor.logger import logging
 from sensor.predictor import ModelResolver
 import pandas as pd
-from sensor.utils import load_object
+from sensor.utils import load_object, load_dataframe
+from sensor.schema import SensorSchema
+from sensor.inference_plan import compile_transformer
 import os
 import sys
 from datetime import datetime
@@ -11,6 +13,9 @@ import numpy as np
 
 
 PREDICTION_DIR="prediction"
+# up to so many rows, the compiled model (refer "compiled_model.py") predicts instead of "model.pkl" -- for the
+# small files, where the call of xgboost itself is most of the time (refer "benchmarks/bench_compiled_model.py")
+COMPILED_MODEL_MAX_ROWS=256
 
 # to do the prediction, we need to have our input file on which we will do the prediction
 def start_batch_prediction(input_file_path):
@@ -28,41 +33,84 @@ def start_batch_prediction(input_file_path):
         # ie we have saved them in "saved_models" folder  
         model_resolver = ModelResolver(model_registry="saved_models")
 
+        # if the model was pushed with a bundle (refer "model_bundle.py"), everything comes from that one
+        # memory mapped file -- the schema, the inference plan, the model and the label mapping; else from
+        # the separate files (the three pickles)
+        bundle_path = model_resolver.get_latest_bundle_path()
+        bundle = None
+        if bundle_path is not None:
+            from sensor.model_bundle import ModelBundle
+            logging.info(f"loading model bundle: {bundle_path}")
+            bundle = ModelBundle.load(file_path=bundle_path)
+
         logging.info(f"reading file :{input_file_path}")
-        df = pd.read_csv(input_file_path)
-        df.replace({"na":np.NAN},inplace=True)
+        # the input file can be ".csv", ".parquet" or ".arrow" (refer "dataset_storage.py")
+        # the output file is always ".csv" -- that is our export format
+        # if the model was saved with its schema, the file is parsed with it in one pass
+        # (float32 columns, "na" as np.nan) -- else we fall back to replacing the "na" strings
+        schema_path = model_resolver.get_latest_schema_path()
+        if bundle is not None:
+            df = bundle.schema.read(file_path=input_file_path)
+        elif schema_path is not None:
+            df = SensorSchema.load(file_path=schema_path).read(file_path=input_file_path)
+        else:
+            df = load_dataframe(file_path=input_file_path)
+            df.replace({"na":np.nan},inplace=True)
         
         # (Here, do data validation if required) -- moving on.....
 
 
         logging.info(f"loading transformer to transform dataset")
-        transformer = load_object(file_path=model_resolver.get_latest_transformer_path())
-        # this part, we have written in the file "model_evaluation.py" inside the "components" folder
-        input_feature_names =  list(transformer.feature_names_in_)
         # we want the 'input array'
-        input_arr = transformer.transform(df[input_feature_names])
+        # the steps of the transformer are compiled into one fused pass over the input columns of "df"
+        # (refer "inference_plan.py") -- the same result as "transformer.transform(df[input_feature_names])"
+        # (a transformer of the "native" missing value mode keeps the missing values as np.nan, or returns
+        # a CSR matrix of the observed values -- refer "missing_values.py"; the model takes both as they are)
+        if bundle is not None:
+            plan = bundle.plan
+        else:
+            plan = compile_transformer(load_object(file_path=model_resolver.get_latest_transformer_path()))
+        input_arr = plan.transform(df)
 
-        logging.info(f"loading model to make prediction")
-        model = load_object(file_path=model_resolver.get_latest_model_path())
+        # a small file is predicted with the compiled model, if the model was pushed with one -- its arrays
+        # are memory mapped, not unpickled; it gives the same labels as the model
+        compiled_model_path = model_resolver.get_latest_compiled_model_path()
+        if bundle is not None and bundle.compiled_model is not None and input_arr.shape[0] <= COMPILED_MODEL_MAX_ROWS:
+            logging.info(f"using compiled model of the bundle to make prediction")
+            model = bundle.compiled_model
+        elif bundle is not None:
+            logging.info(f"using model of the bundle to make prediction")
+            model = bundle.model
+        elif compiled_model_path is not None and input_arr.shape[0] <= COMPILED_MODEL_MAX_ROWS:
+            from sensor.compiled_model import CompiledTreeEnsemble
+            logging.info(f"loading compiled model to make prediction")
+            model = CompiledTreeEnsemble.load(dir_path=compiled_model_path)
+        else:
+            logging.info(f"loading model to make prediction")
+            model = load_object(file_path=model_resolver.get_latest_model_path())
         prediction = model.predict(input_arr)
         
         logging.info(f"target encoder to convert predicted column into categorical")
-        target_encoder = load_object(file_path=model_resolver.get_latest_target_encoder_path())
+        if bundle is not None:
+            target_encoder = bundle.target_encoder
+        else:
+            target_encoder = load_object(file_path=model_resolver.get_latest_target_encoder_path())
 
         cat_prediction = target_encoder.inverse_transform(prediction)
 
         # we will now update/fill in the -- "prediction" column (which was blank in the input df file)
         # and "cat_pred" column (which was blank in the input df file)
         # so, now our output file will have all the columns from the input file + filled columns of "prediction" and "cat_pred"
-        df["prediction"]=prediction
-        df["cat_pred"]=cat_prediction
+        # (both the columns at once -- "assign" builds the new dataframe one time, instead of once per column)
+        df = df.assign(prediction=prediction, cat_pred=cat_prediction)
 
         # prediction file name will be named like this
         # suppose input file name is "sensor1.csv", then
         # after prediciton, the output file name will be "sensor1_{timestamp}.csv"
         # ie "filename_{timestamp}.csv"
         # and this output file, we will save in the "prediction" folder
-        prediction_file_name = os.path.basename(input_file_path).replace(".csv",f"{datetime.now().strftime('%m%d%Y__%H%M%S')}.csv")
+        input_file_name = os.path.splitext(os.path.basename(input_file_path))[0]
+        prediction_file_name = f"{input_file_name}{datetime.now().strftime('%m%d%Y__%H%M%S')}.csv"
         prediction_file_path = os.path.join(PREDICTION_DIR,prediction_file_name)
 
         # since our original input file was of ".csv", we will convert the output file
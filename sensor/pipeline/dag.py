@@ -0,0 +1,196 @@
+'''
+The training pipeline used to be a strictly sequential script -- but "data transformation" only needs the
+artifact of "data ingestion", ie it does not have to wait for "data validation" (which is dominated by
+the drift tests).
+
+The task of the file "dag.py" is to run the pipeline as a small DAG (directed acyclic graph) of stages:
+    - every stage names the stages it depends on -- a stage starts as soon as all of them finished
+    - the ready stage on the longest remaining path (the critical path) runs in this process, the
+      other ready stages run at the same time in worker processes
+    - a stage is started only if its estimated memory (its input size times "memory_factor") fits into
+      the memory limit together with the stages which are already running
+    - the "timeline" of the run -- which stage ran when, where, and how long -- is written as json
+'''
+
+import os
+import sys
+import json
+import time
+import traceback
+import dataclasses
+from dataclasses import dataclass
+from typing import Callable, Optional
+from sensor.exception import SensorException
+from sensor.logger import logging
+from sensor import instrumentation
+
+TIMELINE_FILE_NAME = "timeline.json"
+
+
+@dataclass
+class Stage:
+    name:str
+    # run(training_pipeline_config, artifacts, resume_from) -> artifact
+    # "artifacts" is a dict: stage name -> artifact, of the stages in "depends_on"
+    run:Callable
+    depends_on:tuple = ()
+    # estimated peak memory = memory_factor * size of the input files (of the upstream artifacts)
+    memory_factor:float = 2.0
+
+
+# total size (in bytes) of the files of some artifacts -- the input size of a stage
+def artifacts_size(artifacts:list) -> int:
+    size = 0
+    for artifact in artifacts:
+        for value in dataclasses.asdict(artifact).values():
+            if isinstance(value, str) and os.path.isfile(value):
+                size += os.path.getsize(value)
+            elif isinstance(value, str) and os.path.isdir(value):
+                for root, _, file_names in os.walk(value):
+                    size += sum(os.path.getsize(os.path.join(root, file_name)) for file_name in file_names)
+    return size
+
+
+# the default memory limit -- 80% of the memory which is available now ("psutil" is optional)
+def default_memory_limit_mb() -> Optional[float]:
+    try:
+        import psutil
+        return 0.8 * psutil.virtual_memory().available / (1 << 20)
+    except ImportError:
+        return None
+
+
+# this runs inside a worker process -- the exception is returned as text (SensorException cannot be
+# pickled back to the parent process)
+# the measurements of the stage (refer "instrumentation.py") are sent back too
+def _run_stage_in_worker(stage:Stage, training_pipeline_config, artifacts:dict, resume_from):
+    # a forked worker starts with a copy of the measurements of the parent -- they are not its own
+    instrumentation.reset_measurements()
+    start = time.time()
+    try:
+        artifact, error = stage.run(training_pipeline_config, artifacts, resume_from), None
+    except Exception as e:
+        artifact, error = None, f"{e}\n{traceback.format_exc()}"
+    return {"artifact": artifact, "error": error, "start": start, "end": time.time(), "pid": os.getpid(),
+            "measurements": instrumentation.drain_measurements()}
+
+
+class DagScheduler:
+
+    # max_parallel_stages: how many stages may run at the same time (1 => one after the other)
+    # memory_limit_mb: None => no limit
+    def __init__(self, stages:list, max_parallel_stages:int=2, memory_limit_mb:Optional[float]=None):
+        try:
+            self.stages = {stage.name: stage for stage in stages}
+            for stage in stages:
+                for dependency in stage.depends_on:
+                    if dependency not in self.stages:
+                        raise Exception(f"stage {stage.name} depends on an unknown stage: {dependency}")
+            self.max_parallel_stages = max(1, max_parallel_stages)
+            self.memory_limit_mb = memory_limit_mb
+            self.priority = {name: self._longest_path(name, set()) for name in self.stages}
+            self.timeline = []
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    # number of stages on the longest path from this stage to the end of the pipeline
+    def _longest_path(self, name:str, visiting:set) -> int:
+        if name in visiting:
+            raise Exception(f"the pipeline has a cycle through stage {name}")
+        dependents = [stage.name for stage in self.stages.values() if name in stage.depends_on]
+        return 1 + max([self._longest_path(dependent, visiting | {name}) for dependent in dependents], default=0)
+
+    def _memory_mb(self, stage:Stage, artifacts:dict) -> float:
+        return stage.memory_factor * artifacts_size([artifacts[name] for name in stage.depends_on]) / (1 << 20)
+
+    def _record(self, stage:Stage, mode:str, memory_mb:float, result:dict, run_start:float):
+        self.timeline.append({"stage": stage.name, "mode": mode, "pid": result["pid"],
+                              "start": round(result["start"] - run_start, 3), "end": round(result["end"] - run_start, 3),
+                              "duration": round(result["end"] - result["start"], 3),
+                              "estimated_memory_mb": round(memory_mb, 1), "status": "failed" if result["error"] else "finished"})
+        logging.info(f"stage {stage.name} {self.timeline[-1]['status']} ({mode}) in {self.timeline[-1]['duration']}s")
+
+    # runs all the stages -- returns a dict: stage name -> artifact
+    def run(self, training_pipeline_config, resume_from:Optional[str]=None) -> dict:
+        from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+        run_start = time.time()
+        artifacts, errors = dict(), []
+        pending = sorted(self.stages, key=lambda name: -self.priority[name])
+        running = dict()        # future -> (stage, estimated memory)
+        pool = ProcessPoolExecutor(max_workers=self.max_parallel_stages - 1) if self.max_parallel_stages > 1 else None
+
+        def collect(futures):
+            for future in futures:
+                stage, memory_mb = running.pop(future)
+                result = future.result()
+                instrumentation.add_measurements(result["measurements"])
+                self._record(stage, "process", memory_mb, result, run_start)
+                if result["error"] is not None:
+                    errors.append(f"stage {stage.name} failed: {result['error']}")
+                else:
+                    artifacts[stage.name] = result["artifact"]
+
+        try:
+            while (pending or running) and not errors:
+                ready = [name for name in pending if all(dependency in artifacts for dependency in self.stages[name].depends_on)]
+                running_memory_mb = sum(memory_mb for _, memory_mb in running.values())
+                inline = None
+                for name in ready:
+                    stage = self.stages[name]
+                    stage_artifacts = {dependency: artifacts[dependency] for dependency in stage.depends_on}
+                    memory_mb = self._memory_mb(stage, artifacts)
+                    nothing_running = len(running) == 0 and inline is None
+                    if self.memory_limit_mb is not None and running_memory_mb + memory_mb > self.memory_limit_mb and not nothing_running:
+                        logging.info(f"stage {name} waits for memory ({memory_mb:.0f} MB estimated)")
+                        continue
+                    if inline is None:
+                        # the stage on the critical path runs right here
+                        inline = (stage, stage_artifacts, memory_mb)
+                    elif pool is not None and len(running) < self.max_parallel_stages - 1:
+                        running[pool.submit(_run_stage_in_worker, stage, training_pipeline_config, stage_artifacts, resume_from)] = (stage, memory_mb)
+                    else:
+                        continue
+                    pending.remove(name)
+                    running_memory_mb += memory_mb
+
+                if inline is not None:
+                    stage, stage_artifacts, memory_mb = inline
+                    start = time.time()
+                    try:
+                        artifact, error = stage.run(training_pipeline_config, stage_artifacts, resume_from), None
+                    except Exception as e:
+                        artifact, error = None, str(e)
+                    self._record(stage, "inline", memory_mb, {"error": error, "start": start, "end": time.time(), "pid": os.getpid()}, run_start)
+                    if error is not None:
+                        errors.append(f"stage {stage.name} failed: {error}")
+                    else:
+                        artifacts[stage.name] = artifact
+                    collect([future for future in list(running) if future.done()])
+                elif running:
+                    finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                    collect(finished)
+                elif pending:
+                    raise Exception(f"stages {pending} can never run -- their dependencies did not finish")
+
+            # a failure -- the stages which are running are allowed to finish (so their files are complete)
+            if running:
+                collect(wait(list(running))[0])
+            if errors:
+                raise Exception("\n".join(errors))
+            return artifacts
+        except Exception as e:
+            raise SensorException(e, sys)
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=True)
+            self.write_timeline(training_pipeline_config.artifact_dir, run_start)
+
+    def write_timeline(self, artifact_dir:str, run_start:float):
+        try:
+            os.makedirs(artifact_dir, exist_ok=True)
+            with open(os.path.join(artifact_dir, TIMELINE_FILE_NAME), "w") as file_obj:
+                json.dump({"started_at": run_start, "wall_time": round(time.time() - run_start, 3),
+                           "max_parallel_stages": self.max_parallel_stages, "memory_limit_mb": self.memory_limit_mb,
+                           "stages": sorted(self.timeline, key=lambda entry: entry["start"])}, file_obj, indent=1)
+        except Exception as e:
+            raise SensorException(e, sys)
@@ -0,0 +1,194 @@
+'''
+Every run of the training pipeline gets a new "artifacts/<timestamp>" folder -- and every stage was run
+again from scratch, even when its inputs and its config were exactly the same as in the last run.
+
+The task of the file "stage_cache.py" is:
+    (1) a content addressed cache of the stages -- the "fingerprint" of a stage is a hash of
+            - its config (the output paths inside the artifacts folder are left out),
+            - the source code of its component,
+            - the CONTENT of the files of the upstream artifacts (eg: train.parquet, transformer.pkl)
+        on a hit, the files of the stage are restored (hard links) from "stage_cache/<stage>/<fingerprint>"
+        and the stage is not run at all
+    (2) resuming -- every stage writes its artifact as "artifact.json" into its own folder, so a later
+        run can load the artifacts of the earlier stages from an existing artifacts folder and start
+        from any stage (eg: after a failure in "model evaluation")
+'''
+
+import os
+import sys
+import json
+import shutil
+import hashlib
+import inspect
+import dataclasses
+from typing import Optional
+from sensor.entity import artifact_entity
+from sensor.exception import SensorException
+from sensor.logger import logging
+from sensor.feature_store import link_or_copy
+from sensor.utils.utils import FileHashIndex
+
+STAGE_ARTIFACT_FILE_NAME = "artifact.json"
+FILE_HASH_INDEX_FILE_NAME = "file_hashes.json"
+# bump this when the layout of the cache changes -- every old entry is then a miss
+STAGE_CACHE_VERSION = 1
+
+# config attributes which do not change the output of a stage (caches, number of workers)
+NON_FINGERPRINT_CONFIG_KEYS = {"reference_profile_dir", "drift_max_workers", "rebalance_n_jobs", "training_n_jobs",
+                               "tuning_max_workers", "tuning_cache_dir"}
+
+
+def _is_inside(path:str, directory:str) -> bool:
+    path, directory = os.path.abspath(path), os.path.abspath(directory)
+    return path == directory or path.startswith(directory + os.sep)
+
+
+# the artifact as json -- the paths inside the artifacts folder are written relative to it, so the
+# same artifact can be used from another artifacts folder (eg: restored from the cache)
+def artifact_to_dict(artifact, artifact_dir:str) -> dict:
+    fields = dict()
+    for name, value in dataclasses.asdict(artifact).items():
+        if isinstance(value, str) and _is_inside(value, artifact_dir):
+            fields[name] = {"path": os.path.relpath(value, artifact_dir)}
+        else:
+            fields[name] = {"value": value}
+    return {"class": type(artifact).__name__, "fields": fields}
+
+
+def artifact_from_dict(data:dict, artifact_dir:str):
+    artifact_class = getattr(artifact_entity, data["class"])
+    fields = {name: (os.path.join(artifact_dir, field["path"]) if "path" in field else field["value"])
+              for name, field in data["fields"].items()}
+    return artifact_class(**fields)
+
+
+def write_stage_artifact(stage_dir:str, artifact, artifact_dir:str):
+    try:
+        os.makedirs(stage_dir, exist_ok=True)
+        with open(os.path.join(stage_dir, STAGE_ARTIFACT_FILE_NAME), "w") as file_obj:
+            json.dump(artifact_to_dict(artifact, artifact_dir), file_obj, indent=1)
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+# the artifact which a stage wrote into "stage_dir" -- None if the stage did not finish there
+def read_stage_artifact(stage_dir:str, artifact_dir:str):
+    try:
+        file_path = os.path.join(stage_dir, STAGE_ARTIFACT_FILE_NAME)
+        if not os.path.exists(file_path):
+            return None
+        with open(file_path, "r") as file_obj:
+            return artifact_from_dict(json.load(file_obj), artifact_dir)
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+class StageCache:
+
+    def __init__(self, cache_dir:str):
+        self.cache_dir = cache_dir
+        self.index_file_path = os.path.join(cache_dir, FILE_HASH_INDEX_FILE_NAME)
+
+    # a file -> its hash, a folder -> the hashes of all its files, anything else -> itself
+    # hash_index: the file hash index of the fingerprint pass (refer "FileHashIndex")
+    def _value_fingerprint(self, value, hash_index:FileHashIndex):
+        if isinstance(value, str) and os.path.isfile(value):
+            return {"sha256": hash_index.sha256(value)}
+        if isinstance(value, str) and os.path.isdir(value):
+            files = dict()
+            for root, _, file_names in os.walk(value):
+                for file_name in file_names:
+                    file_path = os.path.join(root, file_name)
+                    files[os.path.relpath(file_path, value)] = hash_index.sha256(file_path)
+            return {"files": dict(sorted(files.items()))}
+        return value
+
+    # config: the config object of the stage; component_class: eg: DataTransformation
+    # upstream_artifacts: the artifacts which the stage reads
+    def fingerprint(self, stage_name:str, config, component_class, upstream_artifacts:list, artifact_dir:str) -> str:
+        try:
+            # the index of the file hashes is read once and written once for the whole fingerprint
+            with FileHashIndex(self.index_file_path) as hash_index:
+                config_values = dict()
+                for name, value in sorted(vars(config).items()):
+                    if name in NON_FINGERPRINT_CONFIG_KEYS:
+                        continue
+                    # the outputs of the stage -- they do not change what the stage computes
+                    if isinstance(value, str) and _is_inside(value, artifact_dir):
+                        continue
+                    config_values[name] = self._value_fingerprint(value, hash_index)
+
+                inputs = []
+                for artifact in upstream_artifacts:
+                    inputs.append({"class": type(artifact).__name__,
+                                   "fields": {name: self._value_fingerprint(value, hash_index)
+                                              for name, value in dataclasses.asdict(artifact).items()}})
+
+                source_file_path = inspect.getsourcefile(component_class)
+                content = {"version": STAGE_CACHE_VERSION, "stage": stage_name, "config": config_values,
+                           "source": hash_index.sha256(source_file_path), "inputs": inputs}
+            return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()[:32]
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def _entry_dir(self, stage_name:str, fingerprint:str) -> str:
+        return os.path.join(self.cache_dir, stage_name, fingerprint)
+
+    # on a hit -- the files of the stage are linked into "stage_dir" and its artifact is returned
+    def restore(self, stage_name:str, fingerprint:str, stage_dir:str, artifact_dir:str):
+        try:
+            entry_dir = self._entry_dir(stage_name, fingerprint)
+            entry_artifact = os.path.join(entry_dir, STAGE_ARTIFACT_FILE_NAME)
+            if not os.path.exists(entry_artifact):
+                return None
+            files_dir = os.path.join(entry_dir, "files")
+            for root, _, file_names in os.walk(files_dir):
+                for file_name in file_names:
+                    file_path = os.path.join(root, file_name)
+                    link_or_copy(file_path, os.path.join(stage_dir, os.path.relpath(file_path, files_dir)))
+            with open(entry_artifact, "r") as file_obj:
+                artifact = artifact_from_dict(json.load(file_obj), artifact_dir)
+            logging.info(f"stage {stage_name} restored from the cache: {entry_dir}")
+            return artifact
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    # the files of the stage are linked into the cache (no copy) -- and the entry is renamed into place
+    # only when it is complete
+    def store(self, stage_name:str, fingerprint:str, stage_dir:str, artifact, artifact_dir:str):
+        try:
+            entry_dir = self._entry_dir(stage_name, fingerprint)
+            if os.path.exists(entry_dir):
+                return
+            tmp_dir = f"{entry_dir}.{os.getpid()}.tmp"
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            for root, _, file_names in os.walk(stage_dir):
+                for file_name in file_names:
+                    if file_name == STAGE_ARTIFACT_FILE_NAME:
+                        continue
+                    file_path = os.path.join(root, file_name)
+                    link_or_copy(file_path, os.path.join(tmp_dir, "files", os.path.relpath(file_path, stage_dir)))
+            os.makedirs(tmp_dir, exist_ok=True)
+            with open(os.path.join(tmp_dir, STAGE_ARTIFACT_FILE_NAME), "w") as file_obj:
+                json.dump(artifact_to_dict(artifact, artifact_dir), file_obj, indent=1)
+            try:
+                os.replace(tmp_dir, entry_dir)
+            except OSError:
+                # another run stored the same stage in the meantime
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+            logging.info(f"stage {stage_name} stored in the cache: {entry_dir}")
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+# the artifacts folder of the last run -- eg: to resume it
+def get_latest_artifact_dir(artifacts_root:Optional[str]=None) -> Optional[str]:
+    try:
+        artifacts_root = artifacts_root or os.path.join(os.getcwd(), "artifacts")
+        if not os.path.isdir(artifacts_root):
+            return None
+        dirs = [os.path.join(artifacts_root, name) for name in os.listdir(artifacts_root)]
+        dirs = [path for path in dirs if os.path.isdir(path)]
+        return max(dirs, key=os.path.getmtime) if len(dirs) > 0 else None
+    except Exception as e:
+        raise SensorException(e, sys)
@@ -1,4 +1,4 @@
-# For each and every component from the training pipeline, we will write the code 
+# For each and every component from the training pipeline, we will write the code
 # to (test/) see whether that part is running successfully or not
 
 from sensor.logger import logging
@@ -6,6 +6,8 @@ from sensor.exception import SensorException
 from sensor.utils import get_collection_as_dataframe
 import os
 import sys
+import shutil
+from typing import Optional
 from sensor.entity import config_entity
 from sensor.components.data_ingestion import DataIngestion
 from sensor.components.data_validation import DataValidation
@@ -13,51 +15,161 @@ from sensor.components.data_transformation import DataTransformation
 from sensor.components.model_trainer import ModelTrainer
 from sensor.components.model_evaluation import ModelEvaluation
 from sensor.components.model_pusher import ModelPusher
+from sensor.pipeline.stage_cache import StageCache, read_stage_artifact, write_stage_artifact, get_latest_artifact_dir
+from sensor.pipeline.dag import Stage, DagScheduler, default_memory_limit_mb
+from sensor.instrumentation import instrument, profile_block, write_run_report, reset_measurements, PROFILE_DIR_NAME
 
+# the stages of the training pipeline -- in order
+STAGES = ("data_ingestion", "data_validation", "data_transformation", "model_trainer", "model_evaluation", "model_pusher")
 
-def start_training_pipeline():
+# only these stages are cached -- "data ingestion" always runs (it is the stage which finds out whether
+# there is new data, and it is incremental anyway), "model evaluation" and "model pusher" depend on the
+# "saved_models" folder, which changes outside of the artifacts
+CACHED_STAGES = ("data_validation", "data_transformation", "model_trainer")
+
+
+# runs one stage -- or loads its artifact (resume), or restores it from the stage cache
+# run: a function which runs the stage and returns its artifact
+def run_stage(stage_name:str, stage_dir:str, config, component_class, upstream_artifacts:list, run,
+              training_pipeline_config:config_entity.TrainingPipelineConfig, resume_from:Optional[str]=None):
     try:
-        training_pipeline_config = config_entity.TrainingPipelineConfig()
-
-        # data ingestion
-        data_ingestion_config  = config_entity.DataIngestionConfig(training_pipeline_config=training_pipeline_config)
-        print(data_ingestion_config.to_dict())
-        data_ingestion = DataIngestion(data_ingestion_config=data_ingestion_config)
-        data_ingestion_artifact = data_ingestion.initiate_data_ingestion()
-        
-        # data validation
-        data_validation_config = config_entity.DataValidationConfig(training_pipeline_config=training_pipeline_config)
-        data_validation = DataValidation(data_validation_config=data_validation_config,
-                        data_ingestion_artifact=data_ingestion_artifact)
-
-        data_validation_artifact = data_validation.initiate_data_validation()
-
-        # data transformation
-        data_transformation_config = config_entity.DataTransformationConfig(training_pipeline_config=training_pipeline_config)
-        data_transformation = DataTransformation(data_transformation_config=data_transformation_config, 
-        data_ingestion_artifact=data_ingestion_artifact)
-        data_transformation_artifact = data_transformation.initiate_data_transformation()
-        
-        # model trainer
-        model_trainer_config = config_entity.ModelTrainerConfig(training_pipeline_config=training_pipeline_config)
-        model_trainer = ModelTrainer(model_trainer_config=model_trainer_config, data_transformation_artifact=data_transformation_artifact)
-        model_trainer_artifact = model_trainer.initiate_model_trainer()
-
-        # model evaluation
-        model_eval_config = config_entity.ModelEvaluationConfig(training_pipeline_config=training_pipeline_config)
-        model_eval  = ModelEvaluation(model_eval_config=model_eval_config,
-        data_ingestion_artifact=data_ingestion_artifact,
-        data_transformation_artifact=data_transformation_artifact,
-        model_trainer_artifact=model_trainer_artifact)
-        model_eval_artifact = model_eval.initiate_model_evaluation()
-
-        # model pusher
-        model_pusher_config = config_entity.ModelPusherConfig(training_pipeline_config)
-        
-        model_pusher = ModelPusher(model_pusher_config=model_pusher_config, 
-                data_transformation_artifact=data_transformation_artifact,
-                model_trainer_artifact=model_trainer_artifact)
-
-        model_pusher_artifact = model_pusher.initiate_model_pusher()
+        artifact_dir = training_pipeline_config.artifact_dir
+        # "source" in the run report: "resume", "cache" or "run"
+        with instrument(f"stage.{stage_name}") as measurement:
+
+            # resuming -- the stages before "resume_from" already finished in this artifacts folder
+            if resume_from is not None and STAGES.index(stage_name) < STAGES.index(resume_from):
+                artifact = read_stage_artifact(stage_dir=stage_dir, artifact_dir=artifact_dir)
+                if artifact is None:
+                    raise Exception(f"cannot resume from {resume_from}: stage {stage_name} did not finish in {artifact_dir}")
+                logging.info(f"stage {stage_name} loaded from {stage_dir}")
+                measurement.extra["source"] = "resume"
+                return artifact
+
+            # the stage runs (again) in this folder -- the old files may be hard links into the cache, so
+            # they are removed first and never written over
+            shutil.rmtree(stage_dir, ignore_errors=True)
+
+            stage_cache, fingerprint = None, None
+            if training_pipeline_config.use_stage_cache and stage_name in CACHED_STAGES:
+                stage_cache = StageCache(cache_dir=training_pipeline_config.stage_cache_dir)
+                fingerprint = stage_cache.fingerprint(stage_name=stage_name, config=config, component_class=component_class,
+                                                      upstream_artifacts=upstream_artifacts, artifact_dir=artifact_dir)
+                artifact = stage_cache.restore(stage_name=stage_name, fingerprint=fingerprint, stage_dir=stage_dir, artifact_dir=artifact_dir)
+                if artifact is not None:
+                    write_stage_artifact(stage_dir=stage_dir, artifact=artifact, artifact_dir=artifact_dir)
+                    measurement.extra["source"] = "cache"
+                    return artifact
+
+            measurement.extra["source"] = "run"
+            profile_mode = training_pipeline_config.profile_mode if stage_name in training_pipeline_config.profile_stages else None
+            with profile_block(stage_name, os.path.join(artifact_dir, PROFILE_DIR_NAME), mode=profile_mode):
+                artifact = run()
+            if stage_cache is not None:
+                stage_cache.store(stage_name=stage_name, fingerprint=fingerprint, stage_dir=stage_dir, artifact=artifact, artifact_dir=artifact_dir)
+            write_stage_artifact(stage_dir=stage_dir, artifact=artifact, artifact_dir=artifact_dir)
+            return artifact
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+# the stages of the pipeline -- every function below builds the config and the component of one stage
+# and runs it (through "run_stage"); "artifacts" has the artifacts of the stages it depends on
+# (they are module level functions -- so they can be sent to a worker process)
+
+def data_ingestion_stage(training_pipeline_config, artifacts:dict, resume_from:Optional[str]=None):
+    data_ingestion_config  = config_entity.DataIngestionConfig(training_pipeline_config=training_pipeline_config)
+    print(data_ingestion_config.to_dict())
+    data_ingestion = DataIngestion(data_ingestion_config=data_ingestion_config)
+    return run_stage("data_ingestion", data_ingestion_config.data_ingestion_dir, data_ingestion_config,
+                     DataIngestion, [], data_ingestion.initiate_data_ingestion,
+                     training_pipeline_config=training_pipeline_config, resume_from=resume_from)
+
+
+def data_validation_stage(training_pipeline_config, artifacts:dict, resume_from:Optional[str]=None):
+    data_validation_config = config_entity.DataValidationConfig(training_pipeline_config=training_pipeline_config)
+    data_validation = DataValidation(data_validation_config=data_validation_config,
+                    data_ingestion_artifact=artifacts["data_ingestion"])
+    return run_stage("data_validation", data_validation_config.data_validation_dir, data_validation_config,
+                     DataValidation, [artifacts["data_ingestion"]], data_validation.initiate_data_validation,
+                     training_pipeline_config=training_pipeline_config, resume_from=resume_from)
+
+
+def data_transformation_stage(training_pipeline_config, artifacts:dict, resume_from:Optional[str]=None):
+    data_transformation_config = config_entity.DataTransformationConfig(training_pipeline_config=training_pipeline_config)
+    data_transformation = DataTransformation(data_transformation_config=data_transformation_config,
+    data_ingestion_artifact=artifacts["data_ingestion"])
+    return run_stage("data_transformation", data_transformation_config.data_transformation_dir, data_transformation_config,
+                     DataTransformation, [artifacts["data_ingestion"]], data_transformation.initiate_data_transformation,
+                     training_pipeline_config=training_pipeline_config, resume_from=resume_from)
+
+
+def model_trainer_stage(training_pipeline_config, artifacts:dict, resume_from:Optional[str]=None):
+    model_trainer_config = config_entity.ModelTrainerConfig(training_pipeline_config=training_pipeline_config)
+    model_trainer = ModelTrainer(model_trainer_config=model_trainer_config, data_transformation_artifact=artifacts["data_transformation"])
+    return run_stage("model_trainer", model_trainer_config.model_trainer_dir, model_trainer_config,
+                     ModelTrainer, [artifacts["data_transformation"]], model_trainer.initiate_model_trainer,
+                     training_pipeline_config=training_pipeline_config, resume_from=resume_from)
+
+
+def model_evaluation_stage(training_pipeline_config, artifacts:dict, resume_from:Optional[str]=None):
+    model_eval_config = config_entity.ModelEvaluationConfig(training_pipeline_config=training_pipeline_config)
+    model_eval  = ModelEvaluation(model_eval_config=model_eval_config,
+    data_ingestion_artifact=artifacts["data_ingestion"],
+    data_transformation_artifact=artifacts["data_transformation"],
+    model_trainer_artifact=artifacts["model_trainer"])
+    return run_stage("model_evaluation", model_eval_config.model_evaluation_dir, model_eval_config,
+                     ModelEvaluation, [], model_eval.initiate_model_evaluation,
+                     training_pipeline_config=training_pipeline_config, resume_from=resume_from)
+
+
+def model_pusher_stage(training_pipeline_config, artifacts:dict, resume_from:Optional[str]=None):
+    model_pusher_config = config_entity.ModelPusherConfig(training_pipeline_config)
+    model_pusher = ModelPusher(model_pusher_config=model_pusher_config,
+            data_transformation_artifact=artifacts["data_transformation"],
+            model_trainer_artifact=artifacts["model_trainer"])
+    return run_stage("model_pusher", model_pusher_config.model_pusher_dir, model_pusher_config,
+                     ModelPusher, [], model_pusher.initiate_model_pusher,
+                     training_pipeline_config=training_pipeline_config, resume_from=resume_from)
+
+
+# the training pipeline as a DAG (refer "dag.py")
+# "data validation" does not block anything except the push -- ie the critical path is
+# ingestion -> transformation -> training -> evaluation -> push, and validation runs next to it
+# (a model is still never pushed when the validation failed)
+PIPELINE_DAG = [
+    Stage("data_ingestion", data_ingestion_stage, depends_on=(), memory_factor=0.0),
+    Stage("data_validation", data_validation_stage, depends_on=("data_ingestion",), memory_factor=3.0),
+    Stage("data_transformation", data_transformation_stage, depends_on=("data_ingestion",), memory_factor=6.0),
+    Stage("model_trainer", model_trainer_stage, depends_on=("data_transformation",), memory_factor=3.0),
+    Stage("model_evaluation", model_evaluation_stage, depends_on=("data_ingestion", "data_transformation", "model_trainer"), memory_factor=3.0),
+    Stage("model_pusher", model_pusher_stage, depends_on=("data_transformation", "model_trainer", "model_evaluation", "data_validation"), memory_factor=1.0),
+]
+
+
+# resume_from: start from this stage (one of "STAGES") -- the earlier stages are loaded from "artifact_dir"
+# artifact_dir: the artifacts folder to resume (None => a new folder; with "resume_from" => the latest one)
+def start_training_pipeline(resume_from:Optional[str]=None, artifact_dir:Optional[str]=None):
+    try:
+        if resume_from is not None:
+            if resume_from not in STAGES:
+                raise Exception(f"unknown stage: {resume_from}, available stages: {list(STAGES)}")
+            artifact_dir = artifact_dir or get_latest_artifact_dir()
+            if artifact_dir is None:
+                raise Exception(f"cannot resume from {resume_from}: there is no artifacts folder")
+            logging.info(f"resuming the training pipeline from {resume_from} in {artifact_dir}")
+        training_pipeline_config = config_entity.TrainingPipelineConfig(artifact_dir=artifact_dir)
+
+        memory_limit_mb = training_pipeline_config.memory_limit_mb
+        scheduler = DagScheduler(stages=PIPELINE_DAG, max_parallel_stages=training_pipeline_config.max_parallel_stages,
+                                 memory_limit_mb=default_memory_limit_mb() if memory_limit_mb is None else memory_limit_mb)
+        # the run report is written even when a stage failed -- that is when it is needed most
+        reset_measurements()
+        try:
+            return scheduler.run(training_pipeline_config=training_pipeline_config, resume_from=resume_from)
+        finally:
+            report_file_path = write_run_report(artifact_dir=training_pipeline_config.artifact_dir,
+                                                prometheus=training_pipeline_config.prometheus_textfile)
+            logging.info(f"run report: {report_file_path}")
     except Exception as e:
         raise SensorException(e, sys)
@@ -23,7 +23,8 @@ their locations and then we can load those files during PREDICTION also -- ie in
 '''
 
 import os
-from sensor.entity.config_entity import TRANSFORMER_OBJECT_FILE_NAME,MODEL_FILE_NAME,TARGET_ENCODER_OBJECT_FILE_NAME
+from sensor.entity.config_entity import TRANSFORMER_OBJECT_FILE_NAME,MODEL_FILE_NAME,TARGET_ENCODER_OBJECT_FILE_NAME,SCHEMA_FILE_NAME,TRAINING_STATE_FILE_NAME,COMPILED_MODEL_DIR_NAME,MODEL_BUNDLE_FILE_NAME
+from sensor.model_registry import ModelRegistry
 from glob import glob
 from typing import Optional
 import sys
@@ -36,29 +37,30 @@ class ModelResolver:
     def __init__(self,model_registry:str = "saved_models",
                 transformer_dir_name="transformer",
                 target_encoder_dir_name = "target_encoder",
-                model_dir_name = "model"):
+                model_dir_name = "model",
+                schema_dir_name = "schema"):
 
         self.model_registry=model_registry
         os.makedirs(self.model_registry,exist_ok=True)
         self.transformer_dir_name = transformer_dir_name
         self.target_encoder_dir_name=target_encoder_dir_name
         self.model_dir_name=model_dir_name
+        self.schema_dir_name=schema_dir_name
+        # the index of the "saved_models" folder and the pointer to the production version (refer "model_registry.py")
+        self.registry = ModelRegistry(self.model_registry)
 
 
     # using this, we will pick the LATEST FOLDER (ie model)
+    # the latest model is the production version of the registry -- the "CURRENT" pointer, which is read
+    # through a cache (so this does not list the "saved_models" folder); a folder without the pointer
+    # (pushed before the registry index existed) falls back to its largest folder
     def get_latest_dir_path(self)->Optional[str]:
 
         try:
-            # first, we will get all the folders' or dirs' names
-            # then we will convert this to a list -- to get it in terms of strings
-            # then we will convert these strings to int using 'map' function
-            # then we will select the 'max' in this -- to get the LATEST
-            dir_names = os.listdir(self.model_registry)
-            if len(dir_names)==0:
+            latest_version = self.registry.current_version()
+            if latest_version is None:
                 return None
-            dir_names = list(map(int,dir_names))
-            latest_dir_name = max(dir_names)
-            return os.path.join(self.model_registry,f"{latest_dir_name}")
+            return os.path.join(self.model_registry,f"{latest_version}")
         except Exception as e:
             raise e
            
@@ -90,6 +92,57 @@ class ModelResolver:
             raise e
 
 
+    # the schema is optional -- the models which were saved before the schema was introduced do
+    # not have it, so we return None for them (instead of raising)
+    def get_latest_schema_path(self)->Optional[str]:
+        try:
+            latest_dir = self.get_latest_dir_path()
+            if latest_dir is None:
+                raise Exception(f"schema is not available")
+            schema_path = os.path.join(latest_dir,self.schema_dir_name,SCHEMA_FILE_NAME)
+            return schema_path if os.path.exists(schema_path) else None
+        except Exception as e:
+            raise e
+
+    # the training state is optional too -- it is kept next to the model (which rows of the feature store
+    # the model has seen, refer "incremental.py"); the older models do not have it
+    def get_latest_training_state_path(self)->Optional[str]:
+        try:
+            latest_dir = self.get_latest_dir_path()
+            if latest_dir is None:
+                raise Exception(f"training state is not available")
+            training_state_path = os.path.join(latest_dir,self.model_dir_name,TRAINING_STATE_FILE_NAME)
+            return training_state_path if os.path.exists(training_state_path) else None
+        except Exception as e:
+            raise e
+
+
+    # the compiled model is optional too -- a directory next to "model.pkl" (refer "compiled_model.py"); the
+    # older models, and the models which cannot be compiled, do not have it
+    def get_latest_compiled_model_path(self)->Optional[str]:
+        try:
+            latest_dir = self.get_latest_dir_path()
+            if latest_dir is None:
+                raise Exception(f"compiled model is not available")
+            compiled_model_path = os.path.join(latest_dir,self.model_dir_name,COMPILED_MODEL_DIR_NAME)
+            return compiled_model_path if os.path.exists(compiled_model_path) else None
+        except Exception as e:
+            raise e
+
+
+    # the model bundle is optional too -- one file in the folder of the model (refer "model_bundle.py"); the
+    # older models, and the models which cannot be bundled, do not have it
+    def get_latest_bundle_path(self)->Optional[str]:
+        try:
+            latest_dir = self.get_latest_dir_path()
+            if latest_dir is None:
+                raise Exception(f"model bundle is not available")
+            bundle_path = os.path.join(latest_dir,MODEL_BUNDLE_FILE_NAME)
+            return bundle_path if os.path.exists(bundle_path) else None
+        except Exception as e:
+            raise e
+
+
     # now, we will define the location where we want to save these files also --- on-by-one for each file
     # ie where we want to save the new files
     # suppose the latest files are saved in "saved_models/1" -- where "1" is the folder name which contains latest files
@@ -99,13 +152,11 @@ class ModelResolver:
     # it should create the first folder as "0" ie "saved_models/0"
 
 
+    # the next version of the registry -- one more than the largest registered version (the model pusher
+    # takes the lock of the registry first, so that two pushes never pick the same version)
     def get_latest_save_dir_path(self)->str:
         try:
-            latest_dir = self.get_latest_dir_path()
-            if latest_dir==None:
-                return os.path.join(self.model_registry,f"{0}")
-            latest_dir_num = int(os.path.basename(self.get_latest_dir_path()))
-            return os.path.join(self.model_registry,f"{latest_dir_num+1}")
+            return os.path.join(self.model_registry,f"{self.registry.next_version()}")
         except Exception as e:
             raise e
 
@@ -128,4 +179,32 @@ class ModelResolver:
             latest_dir = self.get_latest_save_dir_path()
             return os.path.join(latest_dir,self.target_encoder_dir_name,TARGET_ENCODER_OBJECT_FILE_NAME)
         except Exception as e:
-            raise e    
\ No newline at end of file
+            raise e
+
+    def get_latest_save_schema_path(self):
+        try:
+            latest_dir = self.get_latest_save_dir_path()
+            return os.path.join(latest_dir,self.schema_dir_name,SCHEMA_FILE_NAME)
+        except Exception as e:
+            raise e
+
+    def get_latest_save_training_state_path(self):
+        try:
+            latest_dir = self.get_latest_save_dir_path()
+            return os.path.join(latest_dir,self.model_dir_name,TRAINING_STATE_FILE_NAME)
+        except Exception as e:
+            raise e
+
+    def get_latest_save_compiled_model_path(self):
+        try:
+            latest_dir = self.get_latest_save_dir_path()
+            return os.path.join(latest_dir,self.model_dir_name,COMPILED_MODEL_DIR_NAME)
+        except Exception as e:
+            raise e
+
+    def get_latest_save_bundle_path(self):
+        try:
+            latest_dir = self.get_latest_save_dir_path()
+            return os.path.join(latest_dir,MODEL_BUNDLE_FILE_NAME)
+        except Exception as e:
+            raise e
@@ -0,0 +1,316 @@
+'''
+Earlier, every check in "data validation" went over the data on its own -- the null values were
+counted twice, the required columns were searched with "in" on a list, and the drift test sorted each
+column again -- and all of that for the base, train and test dataframe.
+
+The task of the file "profiling.py" is to compute ALL the per-column statistics of a dataset in ONE
+pass, and every validation check then only reads from that "profile":
+    null count / null fraction, min, max, mean, variance, quantiles, histogram
+    and the sorted (non-null) values of every column -- which the drift test needs anyway
+
+Two ways to build a profile:
+    profile_dataframe(df)       -- the dataframe is in memory: one vectorized sort of all the columns
+    ProfileBuilder().update(..) -- chunk by chunk (streaming): counts, min, max, mean and variance are
+                                   exact; the quantiles, histograms and sorted values come from a
+                                   uniform random sample of "sample_size" rows
+                                   (and, with "sketch_k", a quantile sketch of every column -- "sketch.py")
+'''
+
+import os
+import sys
+import json
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+from typing import Optional
+from sensor.exception import SensorException
+from sensor.sketch import QuantileSketch, DEFAULT_SKETCH_K
+
+DEFAULT_QUANTILE_LEVELS = (0.0, 0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99, 1.0)
+DEFAULT_HISTOGRAM_BINS = 20
+PROFILE_FILE_NAME = "profile.json"
+PROFILE_ARRAYS_FILE_NAME = "arrays.npz"
+SORTED_VALUES_FILE_NAME = "sorted_values.npy"
+PROFILE_ARRAYS = ("null_count", "n_valid", "minimum", "maximum", "mean", "variance", "quantile_levels",
+                  "quantiles", "histogram_edges", "histogram_counts")
+
+
+@dataclass
+class DatasetProfile:
+    n_rows:int
+    columns:list                        # all the columns (numeric and non-numeric)
+    null_count:np.ndarray               # per column (all the columns)
+    numeric_columns:list                # the columns below are only for the numeric columns
+    n_valid:np.ndarray                  # number of non-null values
+    minimum:np.ndarray
+    maximum:np.ndarray
+    mean:np.ndarray
+    variance:np.ndarray
+    quantile_levels:np.ndarray
+    quantiles:np.ndarray                # shape: (len(quantile_levels), len(numeric_columns))
+    histogram_edges:np.ndarray          # shape: (len(numeric_columns), bins + 1)
+    histogram_counts:np.ndarray         # shape: (len(numeric_columns), bins)
+    sorted_values:Optional[np.ndarray] = None   # shape: (rows, len(numeric_columns)), NaN at the end
+    is_sample:bool = False              # True if the sorted values / quantiles come from a sample
+    sketches:Optional[dict] = None      # column -> QuantileSketch (only if built with "sketch_k")
+
+    @property
+    def null_fraction(self) -> pd.Series:
+        return pd.Series(self.null_count / max(self.n_rows, 1), index=self.columns)
+
+    def numeric_index(self, column:str) -> int:
+        if not hasattr(self, "_numeric_index"):
+            self._numeric_index = {name: index for index, name in enumerate(self.numeric_columns)}
+        return self._numeric_index[column]
+
+    # the sorted non-null values of one column (a view -- nothing is copied)
+    def get_sorted_values(self, column:str) -> np.ndarray:
+        index = self.numeric_index(column)
+        return self.sorted_values[:self.n_valid[index], index]
+
+    # the quantile sketch of one column (refer "sketch.py") -- if the profile was not built with
+    # sketches, the sketch is made from the sorted values
+    def get_sketch(self, column:str, k:int=DEFAULT_SKETCH_K) -> QuantileSketch:
+        if self.sketches is not None and column in self.sketches:
+            return self.sketches[column]
+        return QuantileSketch.from_sorted(self.get_sorted_values(column), k=k)
+
+    # a profile is saved as a folder:
+    #   profile.json       -- the column names, number of rows and the sketches
+    #   arrays.npz         -- the per-column statistics
+    #   sorted_values.npy  -- the sorted values (if any) -- loaded with mmap, ie only the pages used are read
+    def save(self, profile_dir:str):
+        try:
+            os.makedirs(profile_dir, exist_ok=True)
+            meta = {"n_rows": int(self.n_rows), "columns": list(self.columns), "numeric_columns": list(self.numeric_columns),
+                    "is_sample": bool(self.is_sample), "has_sorted_values": self.sorted_values is not None,
+                    "sketches": None if self.sketches is None else {column: sketch.to_dict() for column, sketch in self.sketches.items()}}
+            with open(os.path.join(profile_dir, PROFILE_FILE_NAME), "w") as file_obj:
+                json.dump(meta, file_obj)
+            np.savez(os.path.join(profile_dir, PROFILE_ARRAYS_FILE_NAME), **{name: getattr(self, name) for name in PROFILE_ARRAYS})
+            if self.sorted_values is not None:
+                np.save(os.path.join(profile_dir, SORTED_VALUES_FILE_NAME), np.ascontiguousarray(self.sorted_values))
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    @classmethod
+    def load(cls, profile_dir:str, mmap_mode:Optional[str]="r"):
+        try:
+            with open(os.path.join(profile_dir, PROFILE_FILE_NAME), "r") as file_obj:
+                meta = json.load(file_obj)
+            with np.load(os.path.join(profile_dir, PROFILE_ARRAYS_FILE_NAME)) as arrays:
+                arrays = {name: arrays[name] for name in PROFILE_ARRAYS}
+            sorted_values = None
+            if meta["has_sorted_values"]:
+                sorted_values = np.load(os.path.join(profile_dir, SORTED_VALUES_FILE_NAME), mmap_mode=mmap_mode)
+            sketches = meta["sketches"]
+            if sketches is not None:
+                sketches = {column: QuantileSketch.from_dict(sketch) for column, sketch in sketches.items()}
+            return cls(n_rows=meta["n_rows"], columns=meta["columns"], numeric_columns=meta["numeric_columns"],
+                       sorted_values=sorted_values, is_sample=meta["is_sample"], sketches=sketches, **arrays)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def to_dict(self) -> dict:
+        # a small summary (no arrays of values) -- eg: for the validation report
+        report = dict()
+        for column, null_count in zip(self.columns, self.null_count):
+            report[column] = {"null_fraction": float(null_count / max(self.n_rows, 1))}
+        for index, column in enumerate(self.numeric_columns):
+            report[column].update({"min": float(self.minimum[index]), "max": float(self.maximum[index]),
+                                   "mean": float(self.mean[index]), "variance": float(self.variance[index])})
+        return report
+
+
+def _numeric_columns(df:pd.DataFrame) -> list:
+    return [column for column in df.columns if pd.api.types.is_numeric_dtype(df[column])]
+
+
+# quantiles of every column from its sorted values (linear interpolation, same as np.quantile)
+def _quantiles_from_sorted(sorted_arr:np.ndarray, n_valid:np.ndarray, quantile_levels:np.ndarray) -> np.ndarray:
+    n_columns = sorted_arr.shape[1]
+    quantiles = np.full((len(quantile_levels), n_columns), np.nan)
+    has_values = n_valid > 0
+    if not has_values.any() or sorted_arr.shape[0] == 0:
+        return quantiles
+    columns = np.arange(n_columns)
+    position = np.outer(quantile_levels, np.maximum(n_valid - 1, 0))
+    lower = np.floor(position).astype(np.int64)
+    upper = np.minimum(lower + 1, np.maximum(n_valid - 1, 0))
+    weight = position - lower
+    lower_values = sorted_arr[lower, columns].astype(np.float64)
+    upper_values = sorted_arr[upper, columns].astype(np.float64)
+    quantiles[:, has_values] = (lower_values + weight * (upper_values - lower_values))[:, has_values]
+    return quantiles
+
+
+# histogram of every column from its sorted values -- "bins" equal width bins between min and max
+def _histograms_from_sorted(sorted_arr:np.ndarray, n_valid:np.ndarray, minimum:np.ndarray,
+                            maximum:np.ndarray, bins:int):
+    n_columns = sorted_arr.shape[1]
+    edges = np.full((n_columns, bins + 1), np.nan)
+    counts = np.zeros((n_columns, bins), dtype=np.int64)
+    for index in range(n_columns):
+        if n_valid[index] == 0:
+            continue
+        column_edges = np.linspace(minimum[index], maximum[index], bins + 1)
+        # the values are already sorted -- so the counts are just the positions of the edges
+        positions = np.searchsorted(sorted_arr[:n_valid[index], index], column_edges[1:-1], side="left")
+        positions = np.concatenate([[0], positions, [n_valid[index]]])
+        edges[index] = column_edges
+        counts[index] = np.diff(positions)
+    return edges, counts
+
+
+def _profile_from_sorted(n_rows:int, columns:list, null_count:np.ndarray, numeric_columns:list,
+                         sorted_arr:np.ndarray, mean:np.ndarray, variance:np.ndarray,
+                         quantile_levels, bins:int, keep_sorted:bool, is_sample:bool,
+                         minimum=None, maximum=None, n_valid=None) -> DatasetProfile:
+    sample_valid = (~np.isnan(sorted_arr)).sum(axis=0)
+    if n_valid is None:
+        n_valid = sample_valid
+    columns_index = np.arange(sorted_arr.shape[1])
+    if minimum is None:
+        minimum = np.where(sample_valid > 0, sorted_arr[0, :] if sorted_arr.shape[0] > 0 else np.nan, np.nan).astype(np.float64)
+    if maximum is None:
+        last = np.maximum(sample_valid - 1, 0)
+        maximum = np.where(sample_valid > 0, sorted_arr[last, columns_index] if sorted_arr.shape[0] > 0 else np.nan, np.nan).astype(np.float64)
+    quantile_levels = np.asarray(quantile_levels, dtype=np.float64)
+    quantiles = _quantiles_from_sorted(sorted_arr, sample_valid, quantile_levels)
+    edges, counts = _histograms_from_sorted(sorted_arr, sample_valid, minimum, maximum, bins)
+    profile = DatasetProfile(n_rows=n_rows, columns=columns, null_count=null_count,
+                             numeric_columns=numeric_columns, n_valid=np.asarray(sample_valid if keep_sorted else n_valid),
+                             minimum=minimum, maximum=maximum, mean=mean, variance=variance,
+                             quantile_levels=quantile_levels, quantiles=quantiles,
+                             histogram_edges=edges, histogram_counts=counts,
+                             sorted_values=sorted_arr if keep_sorted else None, is_sample=is_sample)
+    return profile
+
+
+# one vectorized pass over the whole dataframe
+# keep_sorted: keep the sorted values of every column (needed by the drift test)
+def profile_dataframe(df:pd.DataFrame, quantile_levels=DEFAULT_QUANTILE_LEVELS, bins:int=DEFAULT_HISTOGRAM_BINS,
+                      keep_sorted:bool=True) -> DatasetProfile:
+    try:
+        columns = list(df.columns)
+        numeric_columns = _numeric_columns(df)
+        null_count = df.isnull().sum().to_numpy()
+
+        # float32 columns (the schema dtype) stay float32 -- the sorted copy below is as big as the data
+        dtype = np.float32 if all(df[column].dtype == np.float32 for column in numeric_columns) else np.float64
+        arr = df[numeric_columns].to_numpy(dtype=dtype)
+        # float64 accumulators -- the data itself stays float32
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.nanmean(arr, axis=0, dtype=np.float64) if arr.shape[0] > 0 else np.full(arr.shape[1], np.nan)
+            variance = np.nanvar(arr, axis=0, dtype=np.float64) if arr.shape[0] > 0 else np.full(arr.shape[1], np.nan)
+        # np.sort puts NaN at the end of every column -- so the first "n_valid" values are the data
+        # (a sorted copy -- "arr" may be a view of the dataframe itself)
+        sorted_arr = np.sort(arr, axis=0)
+        return _profile_from_sorted(n_rows=df.shape[0], columns=columns, null_count=null_count,
+                                    numeric_columns=numeric_columns, sorted_arr=sorted_arr, mean=mean, variance=variance,
+                                    quantile_levels=quantile_levels, bins=bins, keep_sorted=keep_sorted, is_sample=False)
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+# streaming profile -- for datasets which do not fit in memory
+class ProfileBuilder:
+
+    # sample_size: number of rows kept (uniformly at random) for the quantiles / histograms / drift
+    # sketch_k: if given, a quantile sketch of every column is built too (eg: for the approximate drift)
+    def __init__(self, sample_size:int=100000, quantile_levels=DEFAULT_QUANTILE_LEVELS,
+                 bins:int=DEFAULT_HISTOGRAM_BINS, random_state:int=42, sketch_k:Optional[int]=None):
+        self.sample_size = sample_size
+        self.sketch_k = sketch_k
+        self.sketches = None
+        self.quantile_levels = quantile_levels
+        self.bins = bins
+        self.random = np.random.default_rng(random_state)
+        self.columns = None
+        self.numeric_columns = None
+        self.n_rows = 0
+        self.null_count = None
+        self.n_valid = None
+        self.minimum = None
+        self.maximum = None
+        self.mean = None
+        self.m2 = None                  # sum of squared differences from the mean (Chan et al.)
+        self.sample = None
+        self.sample_keys = None
+
+    def update(self, df:pd.DataFrame):
+        try:
+            if self.columns is None:
+                self.columns = list(df.columns)
+                self.numeric_columns = _numeric_columns(df)
+                k = len(self.numeric_columns)
+                self.null_count = np.zeros(len(self.columns), dtype=np.int64)
+                self.n_valid = np.zeros(k, dtype=np.int64)
+                self.minimum = np.full(k, np.inf)
+                self.maximum = np.full(k, -np.inf)
+                self.mean = np.zeros(k)
+                self.m2 = np.zeros(k)
+                self.sample = np.empty((0, k), dtype=np.float32)
+                self.sample_keys = np.empty(0)
+                if self.sketch_k is not None:
+                    self.sketches = {column: QuantileSketch(k=self.sketch_k, random_state=index)
+                                     for index, column in enumerate(self.numeric_columns)}
+
+            self.n_rows += df.shape[0]
+            self.null_count += df[self.columns].isnull().sum().to_numpy()
+            arr = df[self.numeric_columns].to_numpy(dtype=np.float32)
+
+            # exact moments -- merge the moments of this chunk into the running ones
+            valid = ~np.isnan(arr)
+            chunk_n = valid.sum(axis=0)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                chunk_mean = np.where(chunk_n > 0, np.nansum(arr, axis=0, dtype=np.float64) / np.maximum(chunk_n, 1), 0.0)
+                chunk_m2 = np.nansum((arr - chunk_mean) ** 2, axis=0, dtype=np.float64)
+                total_n = self.n_valid + chunk_n
+                delta = chunk_mean - self.mean
+                self.mean = np.where(total_n > 0, self.mean + delta * chunk_n / np.maximum(total_n, 1), 0.0)
+                self.m2 = self.m2 + chunk_m2 + delta ** 2 * self.n_valid * chunk_n / np.maximum(total_n, 1)
+                self.minimum = np.fmin(self.minimum, np.nanmin(np.where(valid, arr, np.inf), axis=0))
+                self.maximum = np.fmax(self.maximum, np.nanmax(np.where(valid, arr, -np.inf), axis=0))
+            self.n_valid = total_n
+
+            # uniform row sample -- every row gets a random key, and we keep the smallest keys
+            keys = self.random.random(arr.shape[0])
+            sample = np.concatenate([self.sample, arr])
+            sample_keys = np.concatenate([self.sample_keys, keys])
+            if sample.shape[0] > self.sample_size:
+                keep = np.argpartition(sample_keys, self.sample_size)[:self.sample_size]
+                sample, sample_keys = sample[keep], sample_keys[keep]
+            self.sample, self.sample_keys = sample, sample_keys
+
+            if self.sketches is not None:
+                for index, column in enumerate(self.numeric_columns):
+                    self.sketches[column].update(arr[:, index])
+            return self
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def finalize(self) -> DatasetProfile:
+        try:
+            sorted_arr = np.sort(self.sample, axis=0)
+            has_values = self.n_valid > 0
+            profile = _profile_from_sorted(n_rows=self.n_rows, columns=self.columns, null_count=self.null_count,
+                                        numeric_columns=self.numeric_columns, sorted_arr=sorted_arr,
+                                        mean=np.where(has_values, self.mean, np.nan),
+                                        variance=np.where(has_values, self.m2 / np.maximum(self.n_valid, 1), np.nan),
+                                        quantile_levels=self.quantile_levels, bins=self.bins, keep_sorted=True,
+                                        is_sample=self.sample.shape[0] < self.n_rows,
+                                        minimum=np.where(has_values, self.minimum, np.nan),
+                                        maximum=np.where(has_values, self.maximum, np.nan))
+            profile.sketches = self.sketches
+            return profile
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+# profile of a dataset which is given as chunks (eg: "iter_collection_chunks" or a chunked csv reader)
+def profile_chunks(chunks, sample_size:int=100000, **kwargs) -> DatasetProfile:
+    builder = ProfileBuilder(sample_size=sample_size, **kwargs)
+    for chunk in chunks:
+        builder.update(chunk)
+    return builder.finalize()
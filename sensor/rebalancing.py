@@ -0,0 +1,229 @@
+'''
+In our dataset there is a lot of imbalance -- "pos" is very less than "neg" (about 1.7%). The data
+transformation used to balance it with "SMOTETomek" -- but the Tomek links part does an exact nearest
+neighbour search over ALL the rows in 170 dimensions, which is by far the slowest step of the
+pipeline on large data.
+
+So, in this file we keep the "rebalancing strategies" -- one class per strategy (like the storage
+layer in "dataset_storage.py"). Every strategy has "fit_resample(x, y) -> (x, y, sample_weight)":
+    smote_tomek         -- imblearn's SMOTETomek, exactly as before (the default)
+    approximate_smote   -- SMOTE + Tomek links with an APPROXIMATE nearest neighbour search: the rows
+                           are projected onto a few random directions (which keeps the distances
+                           roughly the same), searched with a KD-tree there, and the candidates are
+                           ranked again with their real distance; the search runs in chunks on
+                           several threads
+    class_weight        -- no new rows at all: the rows of the small class get a larger weight
+                           (n_neg / n_pos, ie xgboost's "scale_pos_weight") -- ie "sample_weight"
+    random_undersample  -- keeps all the rows of the small class and a random part of the large class
+    none                -- nothing
+'''
+
+import sys
+import numpy as np
+from abc import ABC, abstractmethod
+from typing import Optional
+from sensor.exception import SensorException
+from sensor.logger import logging
+
+
+def _class_counts(y:np.ndarray):
+    classes, counts = np.unique(y, return_counts=True)
+    return classes, counts, classes[np.argmax(counts)]
+
+
+class Rebalancer(ABC):
+    strategy = None
+    # True => the strategy takes "n_jobs" (number of threads)
+    parallel = False
+    # True => x may have missing values (np.nan, or absent entries of a scipy CSR matrix) -- refer
+    # "missing_values.py"; the strategies which measure distances between rows need all the values
+    supports_missing = False
+
+    # returns (x, y, sample_weight) -- sample_weight is None if every row counts the same
+    @abstractmethod
+    def fit_resample(self, x:np.ndarray, y:np.ndarray) -> tuple:
+        pass
+
+
+class NoRebalancer(Rebalancer):
+    strategy = "none"
+    supports_missing = True
+
+    def fit_resample(self, x:np.ndarray, y:np.ndarray) -> tuple:
+        return x, y, None
+
+
+class SMOTETomekRebalancer(Rebalancer):
+    strategy = "smote_tomek"
+
+    def __init__(self, random_state:int=42):
+        self.random_state = random_state
+
+    def fit_resample(self, x:np.ndarray, y:np.ndarray) -> tuple:
+        from imblearn.combine import SMOTETomek
+        x, y = SMOTETomek(random_state=self.random_state).fit_resample(x, y)
+        return x, y, None
+
+
+class ClassWeightRebalancer(Rebalancer):
+    strategy = "class_weight"
+    supports_missing = True
+
+    # sampling_ratio: the total weight of every small class = sampling_ratio * the total weight of
+    # the large class (1.0 => balanced)
+    def __init__(self, sampling_ratio:float=1.0):
+        self.sampling_ratio = sampling_ratio
+
+    def fit_resample(self, x:np.ndarray, y:np.ndarray) -> tuple:
+        classes, counts, majority = _class_counts(y)
+        sample_weight = np.ones(y.shape[0], dtype=np.float32)
+        for label, count in zip(classes, counts):
+            if label != majority:
+                sample_weight[y == label] = self.sampling_ratio * counts.max() / count
+        return x, y, sample_weight
+
+
+class RandomUnderSampler(Rebalancer):
+    strategy = "random_undersample"
+    supports_missing = True
+
+    # sampling_ratio: the size of the largest small class / the size of the large class after sampling
+    def __init__(self, sampling_ratio:float=1.0, random_state:int=42):
+        self.sampling_ratio = sampling_ratio
+        self.random_state = random_state
+
+    def fit_resample(self, x:np.ndarray, y:np.ndarray) -> tuple:
+        classes, counts, majority = _class_counts(y)
+        majority_index = np.flatnonzero(y == majority)
+        n_keep = min(majority_index.shape[0], int(np.ceil(counts[classes != majority].max() / self.sampling_ratio)))
+        random = np.random.default_rng(self.random_state)
+        keep = np.sort(np.concatenate([np.flatnonzero(y != majority),
+                                       random.choice(majority_index, size=n_keep, replace=False)]))
+        return x[keep], y[keep], None
+
+
+# approximate nearest neighbours -- a KD-tree on a random projection of the rows (a KD-tree does not
+# work in 170 dimensions, it does in 16), and the "candidates" best of every query ranked again by
+# their real distance
+class ProjectedNeighbors:
+
+    def __init__(self, data:np.ndarray, n_components:int=16, random_state:int=42):
+        from sklearn.neighbors import KDTree
+        self.data = data
+        self.projection = None
+        if n_components is not None and data.shape[1] > n_components:
+            random = np.random.default_rng(random_state)
+            self.projection = (random.standard_normal((data.shape[1], n_components)) / np.sqrt(n_components)).astype(data.dtype)
+        self.tree = KDTree(self.project(data))
+
+    def project(self, x:np.ndarray) -> np.ndarray:
+        return x if self.projection is None else x @ self.projection
+
+    def _query_chunk(self, x:np.ndarray, k:int, candidates:int, self_index:Optional[np.ndarray]) -> np.ndarray:
+        n_candidates = min(self.data.shape[0], k * candidates + (self_index is not None))
+        _, candidate_index = self.tree.query(self.project(x), k=n_candidates)
+        distance = ((self.data[candidate_index] - x[:, None, :]) ** 2).sum(axis=2)
+        if self_index is not None:
+            # a row is not its own neighbour
+            distance[candidate_index == self_index[:, None]] = np.inf
+        order = np.argsort(distance, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(candidate_index, order, axis=1)
+
+    # the index (into "data") of the k nearest neighbours of every row of x
+    # self_index: the index of the rows of x in "data" (if they are rows of "data")
+    def query(self, x:np.ndarray, k:int, candidates:int=4, self_index:Optional[np.ndarray]=None,
+              chunk_size:int=2000, n_jobs:Optional[int]=None) -> np.ndarray:
+        from concurrent.futures import ThreadPoolExecutor
+        starts = range(0, x.shape[0], chunk_size)
+        run = lambda start: self._query_chunk(x[start:start + chunk_size], k, candidates,
+                                              None if self_index is None else self_index[start:start + chunk_size])
+        # the KD-tree search and the numpy maths release the GIL -- ie threads are enough
+        with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+            chunks = list(pool.map(run, starts))
+        return np.concatenate(chunks) if len(chunks) > 0 else np.empty((0, k), dtype=np.intp)
+
+
+class ApproximateSMOTERebalancer(Rebalancer):
+    strategy = "approximate_smote"
+    parallel = True
+
+    # k_neighbors: the new rows of a class are drawn between a row and one of its k nearest neighbours
+    # sampling_ratio: the size of every small class after sampling / the size of the large class
+    # tomek: remove the rows of the large class which form a Tomek link (mutual nearest neighbours
+    #        of different classes) -- before the new rows are drawn, so only the real rows are searched
+    # n_components: dimensions of the random projection; candidates: neighbours ranked again per neighbour
+    def __init__(self, k_neighbors:int=5, sampling_ratio:float=1.0, tomek:bool=True, n_components:int=16,
+                 candidates:int=4, chunk_size:int=2000, n_jobs:Optional[int]=None, random_state:int=42):
+        self.k_neighbors = k_neighbors
+        self.sampling_ratio = sampling_ratio
+        self.tomek = tomek
+        self.n_components = n_components
+        self.candidates = candidates
+        self.chunk_size = chunk_size
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+
+    def _query(self, neighbors:ProjectedNeighbors, x:np.ndarray, k:int, self_index:np.ndarray) -> np.ndarray:
+        return neighbors.query(x, k=k, candidates=self.candidates, self_index=self_index,
+                               chunk_size=self.chunk_size, n_jobs=self.n_jobs)
+
+    # the rows of the large class which are in a Tomek link with a row of a small class
+    def tomek_links(self, x:np.ndarray, y:np.ndarray, majority) -> np.ndarray:
+        neighbors = ProjectedNeighbors(x, n_components=self.n_components, random_state=self.random_state)
+        minority_index = np.flatnonzero(y != majority)
+        nearest = np.full(y.shape[0], -1, dtype=np.intp)
+        nearest[minority_index] = self._query(neighbors, x[minority_index], 1, minority_index)[:, 0]
+        # a link needs the nearest neighbour of a small class row to be a large class row ...
+        candidate_index = np.unique(nearest[minority_index])
+        candidate_index = candidate_index[y[candidate_index] == majority]
+        # ... whose own nearest neighbour is that small class row again
+        candidate_nearest = self._query(neighbors, x[candidate_index], 1, candidate_index)[:, 0]
+        is_link = (y[candidate_nearest] != majority) & (nearest[candidate_nearest] == candidate_index)
+        return candidate_index[is_link]
+
+    def fit_resample(self, x:np.ndarray, y:np.ndarray) -> tuple:
+        random = np.random.default_rng(self.random_state)
+        classes, counts, majority = _class_counts(y)
+        if self.tomek:
+            links = self.tomek_links(x, y, majority)
+            logging.info(f"removing {links.shape[0]} rows of class {majority} in tomek links")
+            keep = np.ones(y.shape[0], dtype=bool)
+            keep[links] = False
+            x, y = x[keep], y[keep]
+            classes, counts, majority = _class_counts(y)
+
+        new_x, new_y = [x], [y]
+        for label, count in zip(classes, counts):
+            n_new = int(self.sampling_ratio * counts.max()) - count
+            if label == majority or n_new <= 0 or count < 2:
+                continue
+            class_x = x[y == label]
+            k = min(self.k_neighbors, count - 1)
+            neighbors = ProjectedNeighbors(class_x, n_components=self.n_components, random_state=self.random_state)
+            nearest = self._query(neighbors, class_x, k, np.arange(count))
+            # a new row = a row + a random part of the way to one of its neighbours
+            base = random.integers(0, count, n_new)
+            neighbour = nearest[base, random.integers(0, k, n_new)]
+            gap = random.random((n_new, 1)).astype(class_x.dtype)
+            new_x.append(class_x[base] + gap * (class_x[neighbour] - class_x[base]))
+            new_y.append(np.full(n_new, label, dtype=y.dtype))
+        return np.concatenate(new_x), np.concatenate(new_y), None
+
+
+REBALANCERS = {rebalancer.strategy: rebalancer for rebalancer in
+               [SMOTETomekRebalancer, ApproximateSMOTERebalancer, ClassWeightRebalancer, RandomUnderSampler, NoRebalancer]}
+
+
+# strategy: one of "REBALANCERS"; params: the arguments of that strategy
+# n_jobs: number of threads (only for the strategies which can use them)
+def get_rebalancer(strategy:str, params:Optional[dict]=None, n_jobs:Optional[int]=None) -> Rebalancer:
+    try:
+        if strategy not in REBALANCERS:
+            raise Exception(f"unknown rebalancing strategy: {strategy}, available strategies: {list(REBALANCERS)}")
+        rebalancer_class = REBALANCERS[strategy]
+        params = dict(params or {})
+        if rebalancer_class.parallel and n_jobs is not None:
+            params["n_jobs"] = n_jobs
+        return rebalancer_class(**params)
+    except Exception as e:
+        raise SensorException(e, sys)
@@ -0,0 +1,68 @@
+'''
+The base dataset of "data validation" (DataValidationConfig.base_file_path) never changes -- but it
+was read (a large csv) and profiled again on every run of the pipeline.
+
+The task of the file "reference_profile.py" is to keep the profile of the base dataset (refer
+"profiling.py") in a cache folder, keyed by the CONTENT hash of the base file (and the profile
+settings). The next runs load only that compact profile -- and when the base file changes, its hash
+changes and the profile is built again automatically.
+
+    <cache_dir>/index.json   -- (size, modification time, sha256) of the files seen so far -- so an
+                                unchanged file does not even have to be hashed again
+    <cache_dir>/<key>/       -- one saved profile (key = hash of the content hash + the settings)
+'''
+
+import os
+import sys
+import json
+import shutil
+import hashlib
+from typing import Callable
+from sensor.exception import SensorException
+from sensor.logger import logging
+from sensor.profiling import DatasetProfile, PROFILE_FILE_NAME
+from sensor.utils.utils import cached_file_sha256
+
+REFERENCE_INDEX_FILE_NAME = "index.json"
+
+
+class ReferenceProfileCache:
+
+    def __init__(self, cache_dir:str):
+        self.cache_dir = cache_dir
+        self.index_file_path = os.path.join(cache_dir, REFERENCE_INDEX_FILE_NAME)
+
+    # the sha256 of the file -- taken from the index if the size and the modification time of the file
+    # are the same as when it was hashed
+    def file_hash(self, file_path:str) -> str:
+        return cached_file_sha256(file_path=file_path, index_file_path=self.index_file_path)
+
+    # settings: everything else the profile depends on (eg: the schema, the drift method) -- a
+    # different setting gives a different key, ie a different profile
+    def profile_key(self, file_path:str, settings:dict) -> str:
+        content = json.dumps({"sha256": self.file_hash(file_path), "settings": settings}, sort_keys=True, default=str)
+        return hashlib.sha256(content.encode()).hexdigest()[:32]
+
+    # the cached profile of the file -- or "build_profile()" (which reads and profiles the file),
+    # which is then saved for the next runs
+    def get_profile(self, file_path:str, build_profile:Callable[[], DatasetProfile], settings:dict) -> DatasetProfile:
+        try:
+            profile_dir = os.path.join(self.cache_dir, self.profile_key(file_path, settings))
+            if os.path.exists(os.path.join(profile_dir, PROFILE_FILE_NAME)):
+                logging.info(f"loading the reference profile of {file_path} from {profile_dir}")
+                return DatasetProfile.load(profile_dir)
+
+            logging.info(f"building the reference profile of {file_path}")
+            profile = build_profile()
+            # saved into a temporary folder first, then renamed -- ie a half written profile is never used
+            tmp_dir = f"{profile_dir}.{os.getpid()}.tmp"
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            profile.save(tmp_dir)
+            try:
+                os.replace(tmp_dir, profile_dir)
+            except OSError:
+                # another run saved the same profile in the meantime
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+            return profile
+        except Exception as e:
+            raise SensorException(e, sys)
@@ -0,0 +1,156 @@
+'''
+Earlier, every component read the csv files as "object" (string) columns because of the "na" values,
+then did "df.replace("na", np.NAN)" and then converted the columns to float one by one
+(refer "convert_columns_float" in the "utils.py" file) -- ie several full copies of the dataframe.
+
+The task of the file "schema.py" is to describe the sensor data ONCE -- the columns, the dtype of
+each column (float32 by default) and the strings which stand for a missing value ("na").
+The schema is derived from the training data (in "data ingestion"), and saved along with the model
+(in "model pusher") -- so that every reader, including the batch prediction, can parse the data
+straight into numeric columns in a single pass.
+'''
+
+import os
+import sys
+import yaml
+import pandas as pd
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
+from sensor.config import TARGET_COLUMN, NA_TOKENS
+from sensor.exception import SensorException
+from sensor.logger import logging
+from sensor.instrumentation import instrument, file_size
+from sensor.utils.dataset_storage import get_storage_for_path, read_dataframe_columns, iter_dataframe_chunks
+
+SCHEMA_FILE_NAME = "schema.yaml"
+DEFAULT_DTYPE = "float32"
+
+
+@dataclass
+class SensorSchema:
+    columns:dict                              # column name -> dtype (eg: "aa_000" -> "float32")
+    target_column:str = TARGET_COLUMN
+    na_values:list = field(default_factory=lambda: list(NA_TOKENS))
+
+    # every column except the target column is a sensor reading -- so it gets "dtype"
+    @classmethod
+    def from_dataframe(cls, df:pd.DataFrame, target_column:str=TARGET_COLUMN, dtype:str=DEFAULT_DTYPE):
+        try:
+            columns = {column: ("str" if column == target_column else dtype) for column in df.columns}
+            return cls(columns=columns, target_column=target_column)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    @property
+    def feature_columns(self) -> list:
+        return [column for column in self.columns if column != self.target_column]
+
+    def to_dict(self) -> dict:
+        return {"columns": dict(self.columns), "target_column": self.target_column, "na_values": list(self.na_values)}
+
+    def save(self, file_path:str):
+        try:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, "w") as file_obj:
+                # sort_keys=False -- so that the column order of the data is kept
+                yaml.safe_dump(self.to_dict(), file_obj, sort_keys=False)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    @classmethod
+    def load(cls, file_path:str):
+        try:
+            with open(file_path, "r") as file_obj:
+                return cls(**yaml.safe_load(file_obj))
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    # the arguments for "pd.read_csv" -- the dtype of every (known) column and the "na" strings
+    # present_columns: the columns which are in the file -- only these can be given a dtype
+    def read_csv_kwargs(self, present_columns:list) -> dict:
+        dtype = {column: self.columns[column] for column in present_columns if column in self.columns}
+        # an empty field is missing too (keep_default_na=False switches off all the other defaults)
+        return {"dtype": dtype, "na_values": list(self.na_values) + [""], "keep_default_na": False}
+
+    # a csv file parsed straight into the schema dtypes -- in chunks of "chunk_size" rows (None => the whole
+    # file as one dataframe); "read" and "iter_read" both read csv files through it
+    # some unexpected string in a numeric column makes the typed parse fail (ValueError) -- then the rest of
+    # the file (from the first row which was not returned yet) is read without the dtypes, and "apply"
+    # coerces the columns (the unexpected strings become NaN)
+    def _iter_csv(self, file_path:str, columns:Optional[list]=None, chunk_size:Optional[int]=None) -> Iterator[pd.DataFrame]:
+        storage = get_storage_for_path(file_path)
+        present_columns = read_dataframe_columns(file_path) if columns is None else columns
+        n_rows = 0
+        try:
+            kwargs = self.read_csv_kwargs(present_columns)
+            if chunk_size is None:
+                yield storage.load(file_path, columns=columns, **kwargs)
+                return
+            for chunk in storage.iter_chunks(file_path, chunk_size=chunk_size, columns=columns, **kwargs):
+                n_rows += chunk.shape[0]
+                yield chunk
+        except ValueError:
+            logging.info(f"could not parse {file_path} with the schema dtypes after {n_rows} rows, coercing the columns")
+            # the rows which were returned already are skipped (line 0 is the header)
+            kwargs = {"na_values": list(self.na_values) + [""], "keep_default_na": False,
+                      "skiprows": None if n_rows == 0 else (lambda line: 0 < line <= n_rows)}
+            if chunk_size is None:
+                yield storage.load(file_path, columns=columns, **kwargs)
+                return
+            for chunk in storage.iter_chunks(file_path, chunk_size=chunk_size, columns=columns, **kwargs):
+                yield chunk
+
+    # reads a dataset file (csv, parquet or arrow) straight into the schema dtypes
+    # columns: column projection -- only these columns are read
+    def read(self, file_path:str, columns:Optional[list]=None) -> pd.DataFrame:
+        try:
+            storage = get_storage_for_path(file_path)
+            with instrument(f"io.load_{storage.file_format}", bytes=file_size(file_path)) as measurement:
+                if storage.file_format != "csv":
+                    # the binary formats are typed already -- "apply" only casts a column if needed
+                    df = storage.load(file_path, columns=columns)
+                else:
+                    # (without a chunk size -- exactly one dataframe)
+                    df = next(self._iter_csv(file_path, columns=columns))
+                measurement.rows = df.shape[0]
+            return self.apply(df)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    # the same as "read" -- but chunk by chunk (at most "chunk_size" rows at a time), ie a file which
+    # does not fit into memory can be read too
+    def iter_read(self, file_path:str, chunk_size:int, columns:Optional[list]=None) -> Iterator[pd.DataFrame]:
+        try:
+            if get_storage_for_path(file_path).file_format == "csv":
+                chunks = self._iter_csv(file_path, columns=columns, chunk_size=chunk_size)
+            else:
+                chunks = iter_dataframe_chunks(file_path, chunk_size=chunk_size, columns=columns)
+            for chunk in chunks:
+                yield self.apply(chunk)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    # converts the columns of a dataframe (which is already in memory) to the schema dtypes
+    # the dataframe which is returned is built once from all its columns -- ie one block per dtype. The
+    # readers give one block per column (and replacing the columns one by one would split the blocks too);
+    # every column added to such a "fragmented" dataframe later (eg: the prediction columns) is slow, and
+    # pandas warns about it (PerformanceWarning)
+    def apply(self, df:pd.DataFrame) -> pd.DataFrame:
+        try:
+            columns = dict()
+            for column in df.columns:
+                values = df[column]
+                dtype = self.columns.get(column)
+                if dtype is not None and column != self.target_column and values.dtype != dtype:
+                    if not pd.api.types.is_numeric_dtype(values):
+                        # the "na" strings (and anything else which is not a number) become NaN
+                        values = pd.to_numeric(values, errors="coerce")
+                    values = values.astype(dtype)
+                columns[column] = values
+            return pd.DataFrame(columns, index=df.index)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    # True if both the schemas have the same columns (in the same order) with the same dtypes
+    def is_compatible(self, other) -> bool:
+        return list(self.columns.items()) == list(other.columns.items()) and self.target_column == other.target_column
@@ -0,0 +1,108 @@
+'''
+The transformer of the data transformation (SimpleImputer + RobustScaler, refer
+"DataTransformation.get_data_transformer_object") was always fitted on the whole train set in memory --
+RobustScaler needs the exact median and the exact quartiles of every column, ie all the values at once.
+
+The task of the file "streaming_transformer.py" is to fit the SAME transformer chunk by chunk:
+    - every chunk is imputed (the imputer fills a constant -- so it needs no statistics) and the
+      values of every column go into a quantile sketch (refer "sketch.py")
+    - the center (median) and the scale (75% quantile - 25% quantile) of the scaler are taken from
+      the sketches -- the result is an ordinary fitted sklearn Pipeline (saved as "transformer.pkl",
+      used exactly like before)
+    - the transformed rows are written chunk by chunk into memory mapped ".npy" files
+
+Error bound: every quantile of the scaler is a real value of the column whose rank is within
++- rank_error (= 3.3 / k, eg: 0.08% of the rows for k=4000) of the exact quantile (with 99% confidence).
+'''
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+from typing import Iterable, Iterator
+from sensor.exception import SensorException
+from sensor.logger import logging
+from sensor.sketch import QuantileSketch
+
+
+# pipeline: the (not fitted) transformer -- ie a Pipeline(imputer, scaler), or a Pipeline(scaler, MissingToSparse)
+#           in the native missing value mode
+# chunks: dataframes with the feature columns and the target column
+# returns (fitted pipeline, fitted label encoder, number of rows)
+def fit_transformer_streaming(pipeline, chunks:Iterable[pd.DataFrame], target_column:str, sketch_k:int=4000,
+                              random_state:int=42) -> tuple:
+    try:
+        from sklearn.preprocessing import LabelEncoder
+        from sensor.missing_values import dense_steps
+        # the imputer is not there in the "native" missing value mode (refer "missing_values.py") -- then
+        # the missing values stay np.nan, and the sketches simply skip them
+        steps = [step for _, step in dense_steps(pipeline).steps]
+        imputer, scaler = (steps[0] if len(steps) == 2 else None), steps[-1]
+        if len(steps) > 2 or (imputer is not None and getattr(imputer, "strategy", None) != "constant") or type(scaler).__name__ != "RobustScaler":
+            raise Exception(f"streaming fit supports only a (constant SimpleImputer +) RobustScaler, not: {pipeline}")
+
+        sketches, labels, n_rows = None, set(), 0
+        for chunk in chunks:
+            x = chunk.drop(columns=target_column)
+            if sketches is None:
+                # fitted on the first chunk -- this sets everything except the scaler statistics
+                # (feature names, number of features, the constant of the imputer)
+                pipeline.fit(x)
+                sketches = [QuantileSketch(k=sketch_k, random_state=random_state + index) for index in range(x.shape[1])]
+            imputed = x.to_numpy() if imputer is None else imputer.transform(x)
+            for index, sketch in enumerate(sketches):
+                sketch.update(imputed[:, index])
+            labels.update(pd.unique(chunk[target_column]))
+            n_rows += chunk.shape[0]
+        if sketches is None:
+            raise Exception("no rows to fit the transformer with")
+
+        # the same statistics as "RobustScaler.fit" -- from the sketches
+        low, high = scaler.quantile_range
+        quantiles = np.array([sketch.quantile([low / 100, 0.5, high / 100]) for sketch in sketches])
+        scaler.center_ = quantiles[:, 1] if scaler.with_centering else None
+        if scaler.with_scaling:
+            scale = quantiles[:, 2] - quantiles[:, 0]
+            # a constant column is not scaled (the same as sklearn does)
+            scale[scale < 10 * np.finfo(scale.dtype).eps] = 1.0
+            scaler.scale_ = scale
+        else:
+            scaler.scale_ = None
+        logging.info(f"transformer fitted on {n_rows} rows in chunks, quantile rank error <= {sketches[0].rank_error:.5f}")
+
+        label_encoder = LabelEncoder().fit(np.array(sorted(labels)))
+        return pipeline, label_encoder, n_rows
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+# transforms the chunks into the directory "dir_path" -- the same (dense) layout as "save_transformed_dataset" (refer
+# "utils.py"): the features (float32) in "features.npy" and the encoded target in "labels.npy"
+# returns (features, labels), memory mapped (ie they are not in memory as a whole)
+def transform_chunks_to_dataset(pipeline, label_encoder, chunks:Iterator[pd.DataFrame], n_rows:int, dir_path:str,
+                                target_column:str) -> tuple:
+    try:
+        from sensor.utils import TRANSFORMED_FEATURES_FILE_NAME, TRANSFORMED_LABELS_FILE_NAME, TRANSFORMED_FEATURES_DTYPE
+        from sensor.missing_values import dense_steps
+        os.makedirs(dir_path, exist_ok=True)
+        n_features = len(pipeline.feature_names_in_)
+        # the rows go into a dense file -- so the features stay dense (np.nan for the missing values of
+        # the native mode) even if the transformer would return a CSR matrix
+        dense = dense_steps(pipeline)
+        features = np.lib.format.open_memmap(os.path.join(dir_path, TRANSFORMED_FEATURES_FILE_NAME), mode="w+",
+                                             dtype=TRANSFORMED_FEATURES_DTYPE, shape=(n_rows, n_features))
+        labels = np.lib.format.open_memmap(os.path.join(dir_path, TRANSFORMED_LABELS_FILE_NAME), mode="w+",
+                                           dtype=np.int64, shape=(n_rows,))
+        row = 0
+        for chunk in chunks:
+            end = row + chunk.shape[0]
+            features[row:end] = dense.transform(chunk[list(pipeline.feature_names_in_)])
+            labels[row:end] = label_encoder.transform(chunk[target_column])
+            row = end
+        if row != n_rows:
+            raise Exception(f"expected {n_rows} rows, got {row} rows")
+        features.flush()
+        labels.flush()
+        return features, labels
+    except Exception as e:
+        raise SensorException(e, sys)
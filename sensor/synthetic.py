@@ -0,0 +1,170 @@
+'''
+The real APS data (the Scania "aps_failure_training_set1.csv") is private -- so there was no way to
+measure a change to this project at any other scale than "whatever file is on the laptop".
+
+The task of the file "synthetic.py" is to generate data which looks like the APS data:
+    - a "class" column ("pos"/"neg") with about 1.7% "pos" rows (1000 of the 60000 rows)
+    - 170 numeric sensor columns with APS like names ("aa_000", "ab_000", ...) -- among them the 7
+      histogram groups ("ag_000" ... "ag_009", "ay_000" ... "ay_009", ...) with 10 bins each, whose
+      bins are the counts of ONE total split over the bins
+    - integer, heavily skewed values (log-normal) -- the "pos" rows have larger values in some of the
+      columns, ie the model can learn something
+    - "na" for the missing values -- most columns miss a few percent, a few of them miss most of their
+      values (as in the real data), a histogram group is missing as a whole
+The same (n_rows, seed) always gives the same data -- whatever the chunk size it is written with: the
+rows are drawn in fixed blocks of BLOCK_ROWS rows, every block from its own random generator (keyed by
+the seed and the index of the block), and a chunk is cut out of the blocks it overlaps.
+
+example:
+    python -m sensor.synthetic --rows 600000 --out aps_600k.csv
+'''
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+from typing import Iterator
+from sensor.config import TARGET_COLUMN
+from sensor.exception import SensorException
+from sensor.logger import logging
+
+N_SENSOR_COLUMNS = 170
+HISTOGRAM_GROUPS = ("ag", "ay", "az", "ba", "cn", "cs", "ee")
+HISTOGRAM_BINS = 10
+POSITIVE_FRACTION = 1000 / 60000
+NA_TOKEN = "na"
+# the rows are generated in blocks of this many rows (refer the top of this file) -- changing it changes
+# the data of every seed
+BLOCK_ROWS = 4096
+
+
+# the 170 sensor columns -- two letter codes "aa", "ab", ... (no "w", like the APS data); a histogram
+# group gets 10 columns "<code>_000" ... "<code>_009", every other code one column "<code>_000"
+def sensor_columns(n_columns:int=N_SENSOR_COLUMNS) -> list:
+    letters = [letter for letter in "abcdefghijklmnopqrstuvxyz"]
+    columns = []
+    for first in letters:
+        for second in letters:
+            code = f"{first}{second}"
+            bins = HISTOGRAM_BINS if code in HISTOGRAM_GROUPS else 1
+            columns += [f"{code}_{index:03d}" for index in range(bins)]
+            if len(columns) >= n_columns:
+                return columns[:n_columns]
+    return columns
+
+
+# the parameters of every column -- they depend only on the seed (not on the chunk), so every chunk
+# of the same dataset has the same columns
+def _column_parameters(columns:list, seed:int) -> dict:
+    random = np.random.default_rng(seed)
+    n_columns = len(columns)
+    # most columns miss 0-5% of their values, one in ten misses 20-80% (like "br_000", "cr_000")
+    missing_rate = random.uniform(0.0, 0.05, n_columns)
+    sparse = random.random(n_columns) < 0.1
+    missing_rate[sparse] = random.uniform(0.2, 0.8, sparse.sum())
+    return {"scale": random.uniform(2.0, 12.0, n_columns),          # log of the typical value
+            "sigma": random.uniform(0.8, 2.5, n_columns),           # skew
+            "zero_rate": random.uniform(0.0, 0.4, n_columns),       # many sensors read 0 most of the time
+            "missing_rate": missing_rate,
+            # the "pos" rows have (much) larger values in one third of the columns
+            "effect": np.where(random.random(n_columns) < 0.35, random.uniform(1.0, 3.0, n_columns), 0.0)}
+
+
+# one block of BLOCK_ROWS rows -- its random numbers are drawn from a generator keyed by (seed, block index)
+# only; returns (the values, is_positive)
+def _make_block(parameters:dict, columns:list, seed:int, block_index:int, positive_fraction:float) -> tuple:
+    random = np.random.default_rng([seed, block_index])
+    n_rows = BLOCK_ROWS
+    is_positive = random.random(n_rows) < positive_fraction
+
+    data = np.empty((n_rows, len(columns)), dtype=np.float64)
+    groups = dict()
+    for index, column in enumerate(columns):
+        code = column[:2]
+        if code in HISTOGRAM_GROUPS:
+            groups.setdefault(code, []).append(index)
+            continue
+        log_value = random.normal(parameters["scale"][index], parameters["sigma"][index], n_rows)
+        log_value += is_positive * parameters["effect"][index]
+        values = np.floor(np.exp(log_value))
+        values[random.random(n_rows) < parameters["zero_rate"][index]] = 0.0
+        data[:, index] = values
+
+    # a histogram group -- one total (eg: the operating time) split over the 10 bins, the "pos"
+    # rows spend more of their time in the upper bins
+    for code, indices in groups.items():
+        first = indices[0]
+        total = np.exp(random.normal(parameters["scale"][first] + 2.0, parameters["sigma"][first], n_rows))
+        total *= np.exp(is_positive * parameters["effect"][first])
+        alpha = np.linspace(2.0, 0.2, len(indices))
+        shares = random.gamma(np.broadcast_to(alpha, (n_rows, len(indices))))
+        shares[is_positive] = shares[is_positive][:, ::-1]
+        shares /= shares.sum(axis=1, keepdims=True)
+        data[:, indices] = np.floor(total[:, None] * shares)
+
+    # missing values -- column by column; a histogram group is missing as a whole
+    missing = random.random(data.shape) < parameters["missing_rate"]
+    for code, indices in groups.items():
+        missing[:, indices] = missing[:, [indices[0]]]
+    data[missing] = np.nan
+    return data, is_positive
+
+
+# start_row: the rows "start_row" ... "start_row + n_rows - 1" of the dataset "seed" -- ie a chunk of it
+def make_aps_dataframe(n_rows:int, seed:int=0, n_columns:int=N_SENSOR_COLUMNS,
+                       positive_fraction:float=POSITIVE_FRACTION, start_row:int=0) -> pd.DataFrame:
+    try:
+        columns = sensor_columns(n_columns)
+        parameters = _column_parameters(columns, seed)
+        data = np.empty((n_rows, len(columns)), dtype=np.float64)
+        is_positive = np.empty(n_rows, dtype=bool)
+        # the blocks which overlap the rows -- and the part of every block which is inside them
+        for block_index in range(start_row // BLOCK_ROWS, -(-(start_row + n_rows) // BLOCK_ROWS)):
+            block_start = block_index * BLOCK_ROWS
+            first, last = max(start_row, block_start), min(start_row + n_rows, block_start + BLOCK_ROWS)
+            block_data, block_is_positive = _make_block(parameters, columns, seed, block_index, positive_fraction)
+            data[first - start_row:last - start_row] = block_data[first - block_start:last - block_start]
+            is_positive[first - start_row:last - start_row] = block_is_positive[first - block_start:last - block_start]
+
+        df = pd.DataFrame(data, columns=columns)
+        df.insert(0, TARGET_COLUMN, np.where(is_positive, "pos", "neg"))
+        return df
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+# the dataset in chunks of "chunk_size" rows -- ie a dataset of any size in bounded memory
+def iter_aps_chunks(n_rows:int, seed:int=0, chunk_size:int=100000, **kwargs) -> Iterator[pd.DataFrame]:
+    for start in range(0, n_rows, chunk_size):
+        yield make_aps_dataframe(min(chunk_size, n_rows - start), seed=seed, start_row=start, **kwargs)
+
+
+# writes the dataset as csv -- exactly like the APS file: integers, "na" for the missing values
+def write_aps_csv(file_path:str, n_rows:int, seed:int=0, chunk_size:int=100000, **kwargs) -> str:
+    try:
+        dir_path = os.path.dirname(file_path)
+        if dir_path:
+            os.makedirs(dir_path, exist_ok=True)
+        # written into a temporary file first -- a half written file is never mistaken for a dataset
+        tmp_file_path = f"{file_path}.tmp"
+        for index, chunk in enumerate(iter_aps_chunks(n_rows, seed=seed, chunk_size=chunk_size, **kwargs)):
+            # nullable integers -- several times faster to format than floats with a "float_format"
+            value_columns = chunk.columns.drop(TARGET_COLUMN)
+            chunk[value_columns] = chunk[value_columns].astype("Int64")
+            chunk.to_csv(tmp_file_path, mode="w" if index == 0 else "a", header=index == 0, index=False, na_rep=NA_TOKEN)
+        os.replace(tmp_file_path, file_path)
+        logging.info(f"synthetic APS dataset with {n_rows} rows written into {file_path}")
+        return file_path
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="generate a synthetic APS like dataset (csv)")
+    parser.add_argument("--rows", type=int, default=60000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-size", type=int, default=100000)
+    parser.add_argument("--out", default="aps_synthetic.csv")
+    args = parser.parse_args()
+    print(write_aps_csv(args.out, n_rows=args.rows, seed=args.seed, chunk_size=args.chunk_size))
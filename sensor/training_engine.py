@@ -0,0 +1,288 @@
+'''
+The model trainer used to fit "XGBClassifier()" with the library defaults (no tree method, no number of
+threads, no early stopping) -- and then it predicted the whole train set and the whole test set once
+more, only to compute the two F1 scores.
+
+So, in this file we keep the "training engines" -- one class per engine (like the rebalancing strategies
+in "rebalancing.py"). Every engine has "train(x, y, x_test, y_test, sample_weight) -> TrainingResult":
+    xgbclassifier  -- "XGBClassifier()" exactly as before; the F1 scores come from two extra predictions
+    booster        -- the default; "xgboost.train" on a prebuilt quantized "QuantileDMatrix": the values are
+                      put into their histogram bins once (and the test/validation matrices reuse the bins of the
+                      train matrix), instead of every time the data is handed to xgboost
+                        - tree method "hist" (the QuantileDMatrix) or "approx" (a plain DMatrix -- the
+                          approx method sketches the data again at every round)
+                        - a configurable number of threads
+                        - early stopping: a stratified validation split is held out of the train rows and
+                          the training stops once its logloss did not improve for "early_stopping_rounds"
+                        - the F1 scores of train and test are evaluated by xgboost at every round (the
+                          evaluation log) -- so no extra prediction passes are needed
+                        - the memory mapped train set (refer "load_transformed_dataset" in "utils.py") is
+                          quantized in batches of "batch_size" rows -- only the quantized matrix (the bins of
+                          the values) and one batch of the file are in memory at a time; "XGBClassifier"
+                          reads the whole train set into memory first
+                      the model is a "BoosterClassifier" -- it has "predict"/"predict_proba" like
+                      "XGBClassifier", so the model evaluation and the batch prediction use it the same way
+
+("QuantileDMatrix" and "DataIter" need xgboost 1.7 or newer -- refer "requirements.txt")
+
+Both engines can also continue boosting an existing model ("base_model" -- the warm start of the
+incremental training, refer "incremental.py"): the new rounds are added on top of its trees.
+'''
+
+import sys
+import mmap
+import numpy as np
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Optional
+# xgboost is imported at the top here -- "_RowBatches" has to subclass "xgboost.DataIter"; so this file is
+# imported inside the functions which use it
+import xgboost as xgb
+from sensor.exception import SensorException
+from sensor.logger import logging
+
+
+@dataclass
+class TrainingResult:
+    model:object
+    f1_train_score:float
+    f1_test_score:float
+    best_iteration:Optional[int] = None
+    # the evaluation log of xgboost -- {data name: {metric: [value of every round]}}
+    evals_result:dict = field(default_factory=dict)
+
+
+def _f1(y_true:np.ndarray, y_pred:np.ndarray) -> float:
+    y_true, y_pred = y_true == 1, y_pred == 1
+    true_positive = np.count_nonzero(y_true & y_pred)
+    denominator = np.count_nonzero(y_true) + np.count_nonzero(y_pred)
+    return 0.0 if denominator == 0 else 2.0 * true_positive / denominator
+
+
+# the custom metric of "xgboost.train" -- "predt" are the probabilities of the "pos" class
+def _f1_metric(predt:np.ndarray, dmatrix) -> tuple:
+    return "f1", _f1(dmatrix.get_label(), (predt > 0.5).astype(np.int64))
+
+
+# drops the pages of a memory mapped array (refer "load_transformed_dataset" in "utils.py") from the memory
+# of the process -- they stay in the page cache of the OS, so reading them again costs no disk read. Every
+# page which was read through the mapping counts in the RSS of the process until then; so a mapped file
+# which is read batch by batch would end up resident as a whole. Nothing happens for an array in memory
+# (or where "madvise" is not available, eg windows).
+def _release_mapped_pages(x):
+    buffer = getattr(x, "_mmap", None)
+    if buffer is not None and hasattr(mmap, "MADV_DONTNEED"):
+        buffer.madvise(mmap.MADV_DONTNEED)
+
+
+# feeds the rows "rows" of x (and y, weight) to xgboost in batches -- so that a split of the train rows
+# can be quantized without copying the split as a whole; rows None => all the rows. If x is memory mapped
+# (refer "utils.py"), the pages of a batch are released again before the next batch is read -- so only
+# about one batch of the file is resident at a time
+class _RowBatches(xgb.DataIter):
+
+    def __init__(self, x, y:np.ndarray, weight:Optional[np.ndarray], rows:Optional[np.ndarray], batch_size:int):
+        self.x, self.y, self.weight, self.rows, self.batch_size = x, y, weight, rows, batch_size
+        self.n_rows = x.shape[0] if rows is None else rows.shape[0]
+        self.position = 0
+        super().__init__()
+
+    def next(self, input_data) -> int:
+        # (xgboost reads the previous batch after "next" returned -- so its pages are released here)
+        _release_mapped_pages(self.x)
+        if self.position >= self.n_rows:
+            return 0
+        stop = min(self.position + self.batch_size, self.n_rows)
+        batch = slice(self.position, stop) if self.rows is None else self.rows[self.position:stop]
+        input_data(data=self.x[batch], label=self.y[batch],
+                   weight=None if self.weight is None else self.weight[batch])
+        self.position = stop
+        return 1
+
+    def reset(self):
+        self.position = 0
+
+
+# the model of the "booster" engine -- the trained booster and the number of rounds to use
+class BoosterClassifier:
+
+    def __init__(self, booster, best_iteration:Optional[int]=None):
+        self.booster = booster
+        self.best_iteration = best_iteration
+        self.classes_ = np.array([0, 1])
+
+    # the rounds up to the best one (early stopping) -- (0, 0) => all the rounds
+    @property
+    def iteration_range(self) -> tuple:
+        return (0, 0) if self.best_iteration is None else (0, self.best_iteration + 1)
+
+    def predict_proba(self, x) -> np.ndarray:
+        probability = self.booster.inplace_predict(x, iteration_range=self.iteration_range)
+        return np.column_stack([1 - probability, probability])
+
+    def predict(self, x) -> np.ndarray:
+        return (self.booster.inplace_predict(x, iteration_range=self.iteration_range) > 0.5).astype(np.int64)
+
+
+# the booster of a trained model (an "XGBClassifier" or a "BoosterClassifier") -- to continue boosting it;
+# only the rounds which the model uses (up to its best iteration) are kept
+def get_base_booster(model) -> xgb.Booster:
+    if isinstance(model, BoosterClassifier):
+        booster = model.booster
+        if model.best_iteration is not None:
+            booster = booster[:model.best_iteration + 1]
+        return booster
+    if isinstance(model, xgb.XGBModel):
+        return model.get_booster()
+    raise Exception(f"cannot continue boosting a model of type {type(model).__name__}")
+
+
+class TrainingEngine(ABC):
+    engine = None
+    # True => the engine takes "n_jobs" (number of threads)
+    parallel = False
+
+    # base_model: continue boosting this model (None => a new model)
+    # rounds: the number of (new) rounds -- None => the number of rounds of the engine
+    @abstractmethod
+    def train(self, x, y:np.ndarray, x_test, y_test:np.ndarray, sample_weight:Optional[np.ndarray]=None,
+              base_model=None, rounds:Optional[int]=None) -> TrainingResult:
+        pass
+
+
+class XGBClassifierEngine(TrainingEngine):
+    engine = "xgbclassifier"
+    parallel = True
+
+    # params: the arguments of "XGBClassifier" (eg: {"tree_method": "hist"}) -- none => the library defaults
+    def __init__(self, n_jobs:Optional[int]=None, **params):
+        self.n_jobs = n_jobs
+        self.params = params
+
+    def train(self, x, y:np.ndarray, x_test, y_test:np.ndarray, sample_weight:Optional[np.ndarray]=None,
+              base_model=None, rounds:Optional[int]=None) -> TrainingResult:
+        try:
+            params = self.params if rounds is None else {**self.params, "n_estimators": rounds}
+            model = xgb.XGBClassifier(n_jobs=self.n_jobs, **params)
+            model.fit(x, y, sample_weight=sample_weight,
+                      xgb_model=None if base_model is None else get_base_booster(base_model))
+            return TrainingResult(model=model, f1_train_score=_f1(y, model.predict(x)),
+                                  f1_test_score=_f1(y_test, model.predict(x_test)))
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+class BoosterEngine(TrainingEngine):
+    engine = "booster"
+    parallel = True
+
+    # tree_method: "hist" or "approx"
+    # num_boost_round: the largest number of rounds (trees) -- 100, the same as "XGBClassifier()"
+    # early_stopping_rounds: stop once the validation logloss did not improve for so many rounds (None => no
+    #                        early stopping, and no validation split)
+    # validation_fraction: the part of the train rows held out for the early stopping
+    # max_bin: the number of histogram bins of every column
+    # batch_size: the rows of a split are quantized in batches of so many rows (a batch is copied before it
+    #             is quantized -- 16384 rows x 170 float32 columns is about 11 MB)
+    # params: more parameters of xgboost (eg: {"max_depth": 6, "eta": 0.3})
+    def __init__(self, tree_method:str="hist", n_jobs:Optional[int]=None, num_boost_round:int=100,
+                 early_stopping_rounds:Optional[int]=10, validation_fraction:float=0.1, max_bin:int=256,
+                 batch_size:int=16384, random_state:int=42, **params):
+        if tree_method not in ("hist", "approx"):
+            raise Exception(f"unknown tree method: {tree_method}, available tree methods: ['hist', 'approx']")
+        self.tree_method = tree_method
+        self.n_jobs = n_jobs
+        self.num_boost_round = num_boost_round
+        self.early_stopping_rounds = early_stopping_rounds
+        self.validation_fraction = validation_fraction
+        self.max_bin = max_bin
+        self.batch_size = batch_size
+        self.random_state = random_state
+        self.params = params
+
+    @property
+    def quantized(self) -> bool:
+        return self.tree_method == "hist"
+
+    # the matrix of the rows "rows" (None => all the rows); ref: the train matrix whose bins are reused
+    # a memory mapped x is always quantized batch by batch (refer "_RowBatches") -- only the quantized
+    # matrix stays in memory, not the pages of the file
+    def make_matrix(self, x, y:np.ndarray, weight:Optional[np.ndarray]=None, rows:Optional[np.ndarray]=None, ref=None):
+        if not self.quantized:
+            if rows is not None:
+                x, y, weight = x[rows], y[rows], None if weight is None else weight[rows]
+            return xgb.DMatrix(x, label=y, weight=weight, nthread=self.n_jobs)
+        if rows is not None or isinstance(x, np.memmap):
+            x = _RowBatches(x, y, weight, rows, self.batch_size)
+            return xgb.QuantileDMatrix(x, max_bin=self.max_bin, ref=ref, nthread=self.n_jobs)
+        return xgb.QuantileDMatrix(x, label=y, weight=weight, max_bin=self.max_bin, ref=ref, nthread=self.n_jobs)
+
+    # a stratified split of the train rows -- (train rows, validation rows), both sorted
+    def split_rows(self, y:np.ndarray) -> tuple:
+        from sklearn.model_selection import train_test_split
+        train_rows, validation_rows = train_test_split(np.arange(y.shape[0]), test_size=self.validation_fraction,
+                                                       random_state=self.random_state, stratify=y)
+        return np.sort(train_rows), np.sort(validation_rows)
+
+    def train(self, x, y:np.ndarray, x_test, y_test:np.ndarray, sample_weight:Optional[np.ndarray]=None,
+              base_model=None, rounds:Optional[int]=None) -> TrainingResult:
+        try:
+            params = {"objective": "binary:logistic", "eval_metric": "logloss", "tree_method": self.tree_method,
+                      "max_bin": self.max_bin, "seed": self.random_state, **self.params}
+            if self.n_jobs is not None:
+                params["nthread"] = self.n_jobs
+
+            callbacks = []
+            if self.early_stopping_rounds is not None:
+                train_rows, validation_rows = self.split_rows(y)
+                dtrain = self.make_matrix(x, y, sample_weight, rows=train_rows)
+                dvalidation = self.make_matrix(x, y, sample_weight, rows=validation_rows, ref=dtrain)
+                # the early stopping looks at the logloss of the validation rows (not at the F1 score -- with
+                # few "pos" rows, the F1 score of a small split jumps from round to round)
+                callbacks.append(xgb.callback.EarlyStopping(rounds=self.early_stopping_rounds, metric_name="logloss",
+                                                            data_name="validation", save_best=False))
+            else:
+                dtrain = self.make_matrix(x, y, sample_weight)
+            dtest = self.make_matrix(x_test, y_test, ref=dtrain)
+            evals = [(dtrain, "train"), (dtest, "test")]
+            if self.early_stopping_rounds is not None:
+                evals.append((dvalidation, "validation"))
+
+            base_booster = None if base_model is None else get_base_booster(base_model)
+            evals_result = dict()
+            booster = xgb.train(params, dtrain, num_boost_round=self.num_boost_round if rounds is None else rounds,
+                                evals=evals, custom_metric=_f1_metric, evals_result=evals_result, callbacks=callbacks,
+                                xgb_model=base_booster, verbose_eval=False)
+
+            # the scores of the round which is used -- straight from the evaluation log
+            # (the log has the new rounds only -- the best new round is found from the log itself, so it does
+            # not depend on how the version of xgboost counts the rounds of the base model)
+            best_iteration, round_index = None, -1
+            if self.early_stopping_rounds is not None:
+                round_index = int(np.argmin(evals_result["validation"]["logloss"]))
+                best_iteration = round_index + (0 if base_booster is None else base_booster.num_boosted_rounds())
+            logging.info(f"booster trained: {len(evals_result['train']['f1'])} rounds, best iteration: {best_iteration}")
+            return TrainingResult(model=BoosterClassifier(booster=booster, best_iteration=best_iteration),
+                                  f1_train_score=evals_result["train"]["f1"][round_index],
+                                  f1_test_score=evals_result["test"]["f1"][round_index],
+                                  best_iteration=best_iteration, evals_result=evals_result)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+TRAINING_ENGINES = {engine.engine: engine for engine in [XGBClassifierEngine, BoosterEngine]}
+
+
+# engine: one of "TRAINING_ENGINES"; params: the arguments of that engine
+# n_jobs: number of threads (None => the default of xgboost, ie all the cpus)
+def get_training_engine(engine:str, params:Optional[dict]=None, n_jobs:Optional[int]=None) -> TrainingEngine:
+    try:
+        if engine not in TRAINING_ENGINES:
+            raise Exception(f"unknown training engine: {engine}, available engines: {list(TRAINING_ENGINES)}")
+        engine_class = TRAINING_ENGINES[engine]
+        params = dict(params or {})
+        if engine_class.parallel and n_jobs is not None:
+            params["n_jobs"] = n_jobs
+        return engine_class(**params)
+    except Exception as e:
+        raise SensorException(e, sys)
@@ -0,0 +1,325 @@
+'''
+The model trainer trains exactly one model with the default hyperparameters of xgboost. The task of the
+file "tuning.py" is to search better hyperparameters first -- cheaply:
+
+successive halving -- "n_candidates" random configurations (from the search space) are trained on a
+    small budget (a stratified part of the train rows AND a part of the boosting rounds), the best
+    1/eta of them go on to a budget eta times larger, and so on until the full budget (all the train
+    rows, all the rounds). eg: 27 candidates, eta = 3, min_budget = 1/9:
+        27 candidates on 1/9 of the rows and rounds -> 9 on 1/3 -> 3 on everything -> the best one
+hyperband -- several rounds ("brackets") of successive halving, from many candidates on a small budget
+    to a few candidates on the full budget -- so a good configuration which needs many rounds to show
+    it is not dropped in the first rung
+
+every trial:
+    - is scored on a stratified validation split held out of the train rows (never on the test set) --
+      by its logloss (smooth, ie it also ranks trials which have the same F1 score); the F1 score is
+      kept too. Both come from the evaluation log of xgboost (refer "training_engine.py")
+    - runs in a local process pool -- every worker is pinned to its own cpus ("os.sched_setaffinity")
+      and xgboost uses only those, so the trials do not fight for the same cores
+    - is cached: by the fingerprint of the data (the hashes of the transformed files), the configuration
+      and the budget -- a repeated tuning run on the same data reads the finished trials instead of
+      training them again (ie it resumes where it stopped)
+'''
+
+import os
+import sys
+import json
+import math
+import hashlib
+import numpy as np
+from dataclasses import dataclass, field
+from typing import Optional
+from sensor.exception import SensorException
+from sensor.logger import logging
+
+TUNING_STRATEGIES = ("none", "successive_halving", "hyperband")
+TUNING_CACHE_VERSION = 1
+FILE_HASH_INDEX_FILE_NAME = "file_hashes.json"
+
+# name -> (kind, low, high) -- "int": an integer in [low, high], "log": uniform on a log scale,
+# "uniform": uniform in [low, high]
+DEFAULT_SEARCH_SPACE = {
+    "max_depth": ("int", 3, 10),
+    "learning_rate": ("log", 0.02, 0.5),
+    "min_child_weight": ("log", 0.5, 20.0),
+    "subsample": ("uniform", 0.5, 1.0),
+    "colsample_bytree": ("uniform", 0.4, 1.0),
+    "reg_lambda": ("log", 0.1, 10.0),
+}
+
+
+@dataclass
+class Trial:
+    params:dict
+    budget:float            # the part of the full budget (rows and rounds)
+    n_rows:int
+    n_rounds:int
+    logloss:Optional[float] = None
+    f1:Optional[float] = None
+    cached:bool = False
+
+
+@dataclass
+class TuningResult:
+    best_params:dict
+    best_trial:Trial
+    trials:list = field(default_factory=list)
+
+
+# n random configurations of the search space -- plain python numbers, so they can be saved as json
+def sample_params(search_space:dict, n:int, random_state:int) -> list:
+    random = np.random.default_rng(random_state)
+    candidates = []
+    for _ in range(n):
+        params = dict()
+        for name, (kind, low, high) in search_space.items():
+            if kind == "int":
+                params[name] = int(random.integers(low, high + 1))
+            elif kind == "log":
+                params[name] = float(np.exp(random.uniform(np.log(low), np.log(high))))
+            elif kind == "uniform":
+                params[name] = float(random.uniform(low, high))
+            else:
+                raise Exception(f"unknown kind of search space parameter {name}: {kind}")
+        candidates.append(params)
+    return candidates
+
+
+# a stratified part of "rows" -- the same random order of every class for every n_rows, so a smaller
+# budget is always a part of a larger one
+def subsample_rows(rows:np.ndarray, y:np.ndarray, n_rows:int, random_state:int) -> np.ndarray:
+    if n_rows >= rows.shape[0]:
+        return rows
+    random = np.random.default_rng(random_state)
+    labels = y[rows]
+    picked = []
+    for label in np.unique(labels):
+        class_rows = rows[labels == label]
+        n_class_rows = max(1, int(round(n_rows * class_rows.shape[0] / rows.shape[0])))
+        picked.append(random.permutation(class_rows)[:n_class_rows])
+    return np.sort(np.concatenate(picked))
+
+
+# the number of threads of xgboost inside a pinned worker (None => all the cpus of the process)
+_worker_threads = None
+
+
+# the initializer of every worker -- it takes its own group of cpus from the queue
+def _pin_worker(cpu_groups):
+    global _worker_threads
+    cpus = cpu_groups.get()
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    _worker_threads = len(cpus)
+
+
+# trains one trial -- in a worker (or in this process); returns (logloss, f1) of the validation rows
+def _run_trial(dataset_path:str, sample_weight_path:Optional[str], params:dict, n_rows:int, n_rounds:int,
+               validation_fraction:float, random_state:int, max_bin:int) -> tuple:
+    import xgboost as xgb
+    from sensor import utils
+    from sensor.training_engine import BoosterEngine, _f1_metric
+    # memory mapped -- ie the workers share the pages of the files, nothing is copied to them
+    x, y = utils.load_transformed_dataset(dir_path=dataset_path, mmap_mode="r")
+    weight = None if sample_weight_path is None else utils.load_numpy_array_data(file_path=sample_weight_path, mmap_mode="r")
+
+    engine = BoosterEngine(tree_method="hist", n_jobs=_worker_threads, max_bin=max_bin,
+                           validation_fraction=validation_fraction, random_state=random_state)
+    train_rows, validation_rows = engine.split_rows(y)
+    rows = subsample_rows(train_rows, y, n_rows=n_rows, random_state=random_state)
+    dtrain = engine.make_matrix(x, y, weight, rows=rows)
+    dvalidation = engine.make_matrix(x, y, weight, rows=validation_rows, ref=dtrain)
+
+    train_params = {"objective": "binary:logistic", "eval_metric": "logloss", "tree_method": "hist",
+                    "max_bin": max_bin, "seed": random_state, **params}
+    if _worker_threads is not None:
+        train_params["nthread"] = _worker_threads
+    evals_result = dict()
+    xgb.train(train_params, dtrain, num_boost_round=n_rounds, evals=[(dvalidation, "validation")],
+              custom_metric=_f1_metric, evals_result=evals_result, verbose_eval=False)
+    return evals_result["validation"]["logloss"][-1], evals_result["validation"]["f1"][-1]
+
+
+def _run_trial_task(task:tuple) -> tuple:
+    return _run_trial(*task)
+
+
+class HyperparameterTuner:
+
+    # dataset_path: the transformed train set (refer "save_transformed_dataset" in "utils.py")
+    # sample_weight_path: the weights of its rows (None => all rows weigh the same)
+    # strategy: "successive_halving" or "hyperband"
+    # n_candidates: the configurations of successive halving (hyperband: of its largest bracket)
+    # min_budget: the part of the rows and rounds of the first rung
+    # eta: 1/eta of the trials of a rung go on to the next one, with an eta times larger budget
+    # max_rounds: the rounds of the full budget -- 100, the same as "XGBClassifier()"
+    # search_space: overrides/extends "DEFAULT_SEARCH_SPACE"
+    # max_workers: worker processes (None => number of cpus, never more than the cpus; 1 => no pool)
+    # cache_dir: where the finished trials are kept (None => no cache)
+    def __init__(self, dataset_path:str, sample_weight_path:Optional[str]=None, strategy:str="successive_halving",
+                 n_candidates:int=27, min_budget:float=1 / 9, eta:int=3, max_rounds:int=100,
+                 search_space:Optional[dict]=None, validation_fraction:float=0.1, min_rows:int=1000,
+                 max_bin:int=256, random_state:int=42, max_workers:Optional[int]=None,
+                 cache_dir:Optional[str]=None):
+        try:
+            if strategy not in TUNING_STRATEGIES or strategy == "none":
+                raise Exception(f"unknown tuning strategy: {strategy}, available strategies: {list(TUNING_STRATEGIES[1:])}")
+            self.dataset_path = dataset_path
+            self.sample_weight_path = sample_weight_path
+            self.strategy = strategy
+            self.n_candidates = n_candidates
+            self.min_budget = min_budget
+            self.eta = eta
+            self.max_rounds = max_rounds
+            self.search_space = {**DEFAULT_SEARCH_SPACE, **(search_space or {})}
+            self.validation_fraction = validation_fraction
+            self.min_rows = min_rows
+            self.max_bin = max_bin
+            self.random_state = random_state
+            cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+            self.cpus = cpus
+            self.max_workers = min(max_workers or len(cpus), len(cpus))
+            self.cache_dir = cache_dir
+            # set by "tune" -- the finished trials, the fingerprint of the data, the rows of the full budget
+            self._cache = None
+            self._fingerprint = None
+            self._n_train_rows = None
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    # the hashes of the files of the data -- a new file (other rows, other transformation) => other trials
+    def data_fingerprint(self) -> str:
+        try:
+            from sensor.utils import FileHashIndex, file_sha256
+            paths = []
+            for path in [self.dataset_path, self.sample_weight_path]:
+                if path is None:
+                    continue
+                if os.path.isdir(path):
+                    paths.extend(os.path.join(path, file_name) for file_name in sorted(os.listdir(path)))
+                else:
+                    paths.append(path)
+            if self.cache_dir is None:
+                hashes = [file_sha256(path) for path in paths]
+            else:
+                with FileHashIndex(os.path.join(self.cache_dir, FILE_HASH_INDEX_FILE_NAME)) as hash_index:
+                    hashes = [hash_index.sha256(path) for path in paths]
+            return hashlib.sha256(json.dumps([TUNING_CACHE_VERSION, hashes]).encode()).hexdigest()[:32]
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    @property
+    def cache_file_path(self) -> str:
+        return os.path.join(self.cache_dir, f"{self._fingerprint}.jsonl")
+
+    def _trial_key(self, trial:Trial) -> str:
+        content = {"params": trial.params, "n_rows": trial.n_rows, "n_rounds": trial.n_rounds,
+                   "validation_fraction": self.validation_fraction, "max_bin": self.max_bin,
+                   "random_state": self.random_state}
+        return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()[:32]
+
+    def _load_cache(self) -> dict:
+        cache = dict()
+        if self.cache_dir is not None and os.path.exists(self.cache_file_path):
+            with open(self.cache_file_path, "r") as file_obj:
+                for line in file_obj:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # a line cut off by an interrupted run -- that trial is trained again
+                        continue
+                    cache[entry["key"]] = entry
+        return cache
+
+    def _save_to_cache(self, trials:list):
+        if self.cache_dir is None or len(trials) == 0:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(self.cache_file_path, "a") as file_obj:
+            for trial in trials:
+                entry = {"key": self._trial_key(trial), "logloss": trial.logloss, "f1": trial.f1}
+                file_obj.write(json.dumps(entry) + "\n")
+                self._cache[entry["key"]] = entry
+
+    # the rows and rounds of a budget
+    def _make_trial(self, params:dict, budget:float) -> Trial:
+        n_rows = max(self.min_rows, int(round(budget * self._n_train_rows)))
+        n_rounds = max(1, int(round(budget * self.max_rounds)))
+        return Trial(params=params, budget=budget, n_rows=n_rows, n_rounds=n_rounds)
+
+    # trains every trial which is not in the cache -- in the pool
+    def evaluate(self, trials:list) -> list:
+        try:
+            todo = []
+            for trial in trials:
+                entry = self._cache.get(self._trial_key(trial))
+                if entry is not None:
+                    trial.logloss, trial.f1, trial.cached = entry["logloss"], entry["f1"], True
+                else:
+                    todo.append(trial)
+            tasks = [(self.dataset_path, self.sample_weight_path, trial.params, trial.n_rows, trial.n_rounds,
+                      self.validation_fraction, self.random_state, self.max_bin) for trial in todo]
+            if self.max_workers <= 1 or len(tasks) <= 1:
+                results = [_run_trial_task(task) for task in tasks]
+            else:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                n_workers = min(self.max_workers, len(tasks))
+                # one group of cpus per worker -- eg: 8 cpus, 4 workers => 2 cpus (and 2 threads) each
+                cpu_groups = multiprocessing.Queue()
+                for index in range(n_workers):
+                    cpu_groups.put(set(self.cpus[index::n_workers]))
+                with ProcessPoolExecutor(max_workers=n_workers, initializer=_pin_worker, initargs=(cpu_groups,)) as pool:
+                    results = list(pool.map(_run_trial_task, tasks))
+            for trial, (logloss, f1) in zip(todo, results):
+                trial.logloss, trial.f1 = float(logloss), float(f1)
+            self._save_to_cache(todo)
+            logging.info(f"rung: {len(trials)} trials ({len(trials) - len(todo)} from the cache), "
+                         f"{trials[0].n_rows} rows, {trials[0].n_rounds} rounds")
+            return trials
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    # successive halving from "candidates" on "min_budget" up to the full budget
+    def successive_halving(self, candidates:list, min_budget:float) -> list:
+        history = []
+        survivors, budget = candidates, min_budget
+        while True:
+            trials = self.evaluate([self._make_trial(params, budget) for params in survivors])
+            history.extend(trials)
+            if budget >= 1.0:
+                return history
+            trials = sorted(trials, key=lambda trial: trial.logloss)
+            survivors = [trial.params for trial in trials[:max(1, len(trials) // self.eta)]]
+            budget = min(1.0, budget * self.eta)
+
+    def tune(self) -> TuningResult:
+        try:
+            from sensor import utils
+            _, y = utils.load_transformed_dataset(dir_path=self.dataset_path, mmap_mode="r")
+            self._n_train_rows = y.shape[0] - int(math.ceil(self.validation_fraction * y.shape[0]))
+            self._fingerprint = self.data_fingerprint()
+            self._cache = self._load_cache()
+            logging.info(f"tuning ({self.strategy}) on {self._n_train_rows} rows with {self.max_workers} workers, "
+                         f"{len(self._cache)} trials in the cache")
+
+            if self.strategy == "successive_halving":
+                candidates = sample_params(self.search_space, self.n_candidates, self.random_state)
+                trials = self.successive_halving(candidates, self.min_budget)
+            else:
+                # hyperband -- bracket s starts with more candidates on a budget eta^s times smaller
+                s_max = int(round(math.log(1 / self.min_budget, self.eta)))
+                trials = []
+                for s in range(s_max, -1, -1):
+                    n = int(math.ceil(self.n_candidates * (s_max + 1) / (s + 1) / self.eta ** (s_max - s)))
+                    candidates = sample_params(self.search_space, n, self.random_state + s)
+                    trials.extend(self.successive_halving(candidates, self.eta ** -s))
+
+            # the best trial on the full budget
+            best_trial = min([trial for trial in trials if trial.budget >= 1.0], key=lambda trial: trial.logloss)
+            logging.info(f"best configuration: {best_trial.params} (validation logloss {best_trial.logloss:.5f}, "
+                         f"f1 {best_trial.f1:.4f}) out of {len(trials)} trials")
+            return TuningResult(best_params=best_trial.params, best_trial=best_trial, trials=trials)
+        except Exception as e:
+            raise SensorException(e, sys)
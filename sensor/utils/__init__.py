@@ -0,0 +1,2 @@
+from sensor.utils.utils import *
+from sensor.utils.dataset_storage import get_dataset_storage, get_storage_for_path, save_dataframe, load_dataframe, read_dataframe_columns, iter_dataframe_chunks
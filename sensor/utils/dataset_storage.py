@@ -0,0 +1,202 @@
+'''
+The pipeline used to write every dataset (feature store, train, test) as ".csv" and then parse that
+text again in each and every component. With 170 float columns, parsing the text takes most of the
+time of the component.
+
+So, in this file we keep a small "storage layer" -- one class per file format -- which knows how to
+save a dataframe and how to load it back (only the columns which are asked for).
+    csv     -- text, kept for exporting / for the files given by the user
+    parquet -- columnar, compressed (default)
+    arrow   -- arrow IPC ("feather" v2), compressed, very fast to read
+The format of a file is found from its extension -- so a reader never has to know which format the
+previous component was configured with.
+'''
+
+import os
+import sys
+import pandas as pd
+from abc import ABC, abstractmethod
+from typing import Iterator, Optional
+from sensor.exception import SensorException
+from sensor.logger import logging
+from sensor.instrumentation import instrument, file_size
+
+
+# a reader which takes no options -- an unknown argument is an error (and not silently dropped)
+def _reject_kwargs(file_format:str, kwargs:dict):
+    if len(kwargs) > 0:
+        raise TypeError(f"unexpected arguments for the {file_format} reader: {sorted(kwargs)}")
+
+
+class DatasetStorage(ABC):
+    file_format = None
+    extension = None
+
+    def __init__(self, compression:Optional[str]=None):
+        self.compression = compression
+
+    @abstractmethod
+    def save(self, df:pd.DataFrame, file_path:str):
+        pass
+
+    # columns: only these columns are read (None => all the columns)
+    # kwargs: the options of the reader of the format (eg: "na_values" of "pd.read_csv")
+    @abstractmethod
+    def load(self, file_path:str, columns:Optional[list]=None, **kwargs) -> pd.DataFrame:
+        pass
+
+    # the column names of the file -- without reading the data
+    @abstractmethod
+    def read_columns(self, file_path:str) -> list:
+        pass
+
+    # the file as dataframes of at most "chunk_size" rows -- ie without loading the whole file
+    @abstractmethod
+    def iter_chunks(self, file_path:str, chunk_size:int, columns:Optional[list]=None, **kwargs) -> Iterator[pd.DataFrame]:
+        pass
+
+
+class CsvStorage(DatasetStorage):
+    file_format = "csv"
+    extension = ".csv"
+
+    def save(self, df:pd.DataFrame, file_path:str):
+        df.to_csv(path_or_buf=file_path, index=False, header=True)
+
+    def load(self, file_path:str, columns:Optional[list]=None, **kwargs) -> pd.DataFrame:
+        return pd.read_csv(file_path, usecols=columns, **kwargs)
+
+    def read_columns(self, file_path:str) -> list:
+        return list(pd.read_csv(file_path, nrows=0).columns)
+
+    def iter_chunks(self, file_path:str, chunk_size:int, columns:Optional[list]=None, **kwargs) -> Iterator[pd.DataFrame]:
+        with pd.read_csv(file_path, usecols=columns, chunksize=chunk_size, **kwargs) as reader:
+            for chunk in reader:
+                yield chunk
+
+
+class ParquetStorage(DatasetStorage):
+    file_format = "parquet"
+    extension = ".parquet"
+
+    def __init__(self, compression:Optional[str]="zstd"):
+        super().__init__(compression=compression)
+
+    def save(self, df:pd.DataFrame, file_path:str):
+        df.to_parquet(file_path, index=False, compression=self.compression)
+
+    def load(self, file_path:str, columns:Optional[list]=None, **kwargs) -> pd.DataFrame:
+        return pd.read_parquet(file_path, columns=columns, **kwargs)
+
+    def read_columns(self, file_path:str) -> list:
+        import pyarrow.parquet as pq
+        return list(pq.read_schema(file_path).names)
+
+    def iter_chunks(self, file_path:str, chunk_size:int, columns:Optional[list]=None, **kwargs) -> Iterator[pd.DataFrame]:
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(file_path).iter_batches(batch_size=chunk_size, columns=columns, **kwargs):
+            yield batch.to_pandas()
+
+
+class ArrowStorage(DatasetStorage):
+    file_format = "arrow"
+    extension = ".arrow"
+
+    def __init__(self, compression:Optional[str]="lz4"):
+        super().__init__(compression=compression)
+
+    def save(self, df:pd.DataFrame, file_path:str):
+        df.reset_index(drop=True).to_feather(file_path, compression=self.compression)
+
+    def load(self, file_path:str, columns:Optional[list]=None, **kwargs) -> pd.DataFrame:
+        return pd.read_feather(file_path, columns=columns, **kwargs)
+
+    def read_columns(self, file_path:str) -> list:
+        import pyarrow.ipc as ipc
+        with ipc.open_file(file_path) as reader:
+            return list(reader.schema.names)
+
+    def iter_chunks(self, file_path:str, chunk_size:int, columns:Optional[list]=None, **kwargs) -> Iterator[pd.DataFrame]:
+        _reject_kwargs(self.file_format, kwargs)
+        import pyarrow as pa
+        import pyarrow.ipc as ipc
+        # memory mapped -- only the record batch which is being read is decompressed into memory
+        with pa.memory_map(file_path, "r") as source:
+            reader = ipc.open_file(source)
+            for index in range(reader.num_record_batches):
+                batch = reader.get_batch(index)
+                if columns is not None:
+                    batch = batch.select(columns)
+                for start in range(0, batch.num_rows, chunk_size):
+                    yield batch.slice(start, chunk_size).to_pandas()
+
+
+DATASET_STORAGES = {storage.file_format: storage for storage in [CsvStorage, ParquetStorage, ArrowStorage]}
+
+
+# file_format: "csv", "parquet" or "arrow"
+# compression: None => the default of the format
+def get_dataset_storage(file_format:str, compression:Optional[str]=None) -> DatasetStorage:
+    try:
+        if file_format not in DATASET_STORAGES:
+            raise Exception(f"unknown dataset format: {file_format}, available formats: {list(DATASET_STORAGES)}")
+        storage_class = DATASET_STORAGES[file_format]
+        return storage_class() if compression is None else storage_class(compression=compression)
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+# finds the storage from the extension of the file (eg: "train.parquet" -> ParquetStorage)
+def get_storage_for_path(file_path:str) -> DatasetStorage:
+    try:
+        extension = os.path.splitext(file_path)[1].lower()
+        for storage_class in DATASET_STORAGES.values():
+            if storage_class.extension == extension:
+                return storage_class()
+        if extension == ".feather":
+            return ArrowStorage()
+        raise Exception(f"unknown dataset file extension: {file_path}")
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def save_dataframe(df:pd.DataFrame, file_path:str, file_format:Optional[str]=None, compression:Optional[str]=None):
+    try:
+        storage = get_storage_for_path(file_path) if file_format is None else get_dataset_storage(file_format, compression)
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        logging.info(f"saving dataframe {df.shape} as {storage.file_format}: {file_path}")
+        with instrument(f"io.save_{storage.file_format}", rows=df.shape[0]) as measurement:
+            storage.save(df, file_path)
+            measurement.bytes = file_size(file_path)
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+# columns: column projection -- only these columns are read from the file
+# kwargs are passed on to the reader of the format (eg: na_values of the csv reader)
+def load_dataframe(file_path:str, columns:Optional[list]=None, **kwargs) -> pd.DataFrame:
+    try:
+        storage = get_storage_for_path(file_path)
+        with instrument(f"io.load_{storage.file_format}", bytes=file_size(file_path)) as measurement:
+            df = storage.load(file_path, columns=columns, **kwargs)
+            measurement.rows = df.shape[0]
+        return df
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+# the file in chunks of at most "chunk_size" rows (kwargs are passed on to the reader of the format)
+def iter_dataframe_chunks(file_path:str, chunk_size:int, columns:Optional[list]=None, **kwargs) -> Iterator[pd.DataFrame]:
+    try:
+        storage = get_storage_for_path(file_path)
+        for chunk in storage.iter_chunks(file_path, chunk_size=chunk_size, columns=columns, **kwargs):
+            yield chunk
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def read_dataframe_columns(file_path:str) -> list:
+    try:
+        return get_storage_for_path(file_path).read_columns(file_path)
+    except Exception as e:
+        raise SensorException(e, sys)
@@ -1,14 +1,16 @@
 #-------------------------------------------------------------------------------------------------
 # (A)
 import pandas as pd
-from sensor.config import mongo_client
+from sensor.config import get_mongo_client, TARGET_COLUMN, NA_TOKENS
 import os
 import sys
 import yaml
 import dill
 import numpy as np
+from typing import Iterator, Optional
 
 from sensor.logger import logging              # These 2 are v.v.imp
+from sensor.instrumentation import instrument, file_size
 from sensor.exception import SensorException   # We will import them and use them in every file
 
 # get_collection_as_dataframe() -> pd.DataFrame: -- means that this function gives the output as
@@ -19,7 +21,7 @@ from sensor.exception import SensorException   # We will import them and use the
 def get_collection_as_dataframe(database_name:str, collection_name:str) -> pd.DataFrame:
     try:       # (B)
         logging.info("reading Data from DataBase: {database_name} and Collection: {collection_name}")
-        df = pd.DataFrame(list(mongo_client[database_name][collection_name].find())) 
+        df = pd.DataFrame(list(get_mongo_client()[database_name][collection_name].find())) 
         return df
     
     except Exception as e:
@@ -35,7 +37,263 @@ def get_collection_as_dataframe(database_name:str, collection_name:str) -> pd.Da
     # where each document = one row/one record from our original csv file
 
     # we will also use our exceptions and logger module
-      
+
+
+# -------------------------------------------------------------------------------------------------
+# (A.1) streaming ingestion
+
+# "list(...find())" keeps every BSON document as a python dict and then copies all of them once more
+# into the dataframe -- for the full APS history that is several times the size of the final frame.
+# so, instead, we read the cursor in batches of "batch_size" documents and convert every batch into
+# typed (float32) column chunks straight away -- the python dicts of one batch are freed before the
+# next batch is read
+
+def _documents_to_dataframe(documents:list, columns:list, exclude_columns:list, dtype:str) -> pd.DataFrame:
+    try:
+        data = dict()
+        for column in columns:
+            values = [document.get(column) for document in documents]
+            if column in exclude_columns:
+                # ie the target column ("pos"/"neg") -- we keep it as it is
+                data[column] = np.array(values, dtype=object)
+                continue
+            # replace the "na" tokens (and missing fields) with np.nan, and then convert the whole
+            # column to "dtype" in one go
+            values = [np.nan if value is None or value in NA_TOKENS else value for value in values]
+            try:
+                data[column] = np.asarray(values, dtype=dtype)
+            except (TypeError, ValueError):
+                # some other unexpected string in the column -- coerce it to NaN
+                data[column] = pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(dtype=dtype)
+        return pd.DataFrame(data, columns=columns, copy=False)
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+# this function yields the collection -- one dataframe ("chunk") per "batch_size" documents
+# columns: names of the fields to read (projection) -- if None, every field except "_id" is read
+# query/sort: optional mongodb filter and sort specification
+# keep_id: if True, "_id" is also returned (used to track which documents were already read)
+def iter_collection_chunks(database_name:str, collection_name:str, batch_size:int=10000,
+                           columns:Optional[list]=None, query:Optional[dict]=None, sort:Optional[list]=None,
+                           exclude_columns:Optional[list]=None, dtype:str="float32",
+                           keep_id:bool=False, client=None) -> Iterator[pd.DataFrame]:
+    try:
+        logging.info(f"streaming Data from DataBase: {database_name} and Collection: {collection_name} in batches of {batch_size}")
+        if exclude_columns is None:
+            exclude_columns = [TARGET_COLUMN]
+        exclude_columns = list(exclude_columns) + (["_id"] if keep_id else [])
+
+        # projection -- we never want "_id" as a feature column
+        if columns is None:
+            projection = None if keep_id else {"_id": 0}
+        else:
+            projection = {column: 1 for column in columns}
+            if not keep_id:
+                projection["_id"] = 0
+
+        # client: an already created MongoClient (eg: one per worker process) -- default is the shared one
+        client = get_mongo_client() if client is None else client
+        cursor = client[database_name][collection_name].find(query or {}, projection, batch_size=batch_size)
+        if sort is not None:
+            cursor = cursor.sort(sort)
+
+        documents = []
+        chunk_columns = None if columns is None else (["_id"] if keep_id else []) + list(columns)
+        for document in cursor:
+            documents.append(document)
+            if len(documents) == batch_size:
+                if chunk_columns is None:
+                    chunk_columns = list(documents[0].keys())
+                yield _documents_to_dataframe(documents, chunk_columns, exclude_columns, dtype)
+                documents = []
+
+        if len(documents) > 0:
+            if chunk_columns is None:
+                chunk_columns = list(documents[0].keys())
+            yield _documents_to_dataframe(documents, chunk_columns, exclude_columns, dtype)
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+# this function takes the chunks (from "iter_collection_chunks") and builds one dataframe out of them
+# n_rows: expected number of rows -- we allocate the final array only once, and then fill it chunk by
+#         chunk, so that the peak memory stays close to the size of the final array
+def concat_dataframe_chunks(chunks:Iterator[pd.DataFrame], n_rows:int=0) -> pd.DataFrame:
+    try:
+        numeric_columns, other_columns, all_columns = None, None, None
+        numeric_arr, other_values = None, dict()
+        row = 0
+        for chunk in chunks:
+            if all_columns is None:
+                all_columns = list(chunk.columns)
+                numeric_columns = [column for column in all_columns if pd.api.types.is_numeric_dtype(chunk[column])]
+                other_columns = [column for column in all_columns if column not in numeric_columns]
+                dtype = chunk[numeric_columns[0]].dtype if len(numeric_columns) > 0 else np.float32
+                # fortran order -- so that every column is one contiguous block of memory
+                numeric_arr = np.empty((max(n_rows, len(chunk)), len(numeric_columns)), dtype=dtype, order="F")
+                other_values = {column: [] for column in other_columns}
+
+            end = row + len(chunk)
+            if end > numeric_arr.shape[0]:
+                # more documents than expected (eg: inserted while we were reading) -- grow the array
+                grown_arr = np.empty((max(end, 2 * numeric_arr.shape[0]), numeric_arr.shape[1]), dtype=numeric_arr.dtype, order="F")
+                grown_arr[:row] = numeric_arr[:row]
+                numeric_arr = grown_arr
+
+            for index, column in enumerate(numeric_columns):
+                numeric_arr[row:end, index] = chunk[column].to_numpy()
+            for column in other_columns:
+                other_values[column].append(chunk[column].to_numpy())
+            row = end
+
+        if all_columns is None:
+            return pd.DataFrame()
+
+        df = pd.DataFrame(numeric_arr[:row], columns=numeric_columns, copy=False)
+        # "insert" adds the non-numeric columns back at their original position without copying the
+        # numeric block
+        for column in other_columns:
+            df.insert(all_columns.index(column), column, np.concatenate(other_values[column]))
+        return df
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+# this is the "assembled" version of the streaming mode -- one dataframe built from the chunks
+# in "_id" order (like the partitioned read) -- so both the reading modes give the same rows in the same order
+def get_collection_as_dataframe_streaming(database_name:str, collection_name:str, batch_size:int=10000,
+                                          columns:Optional[list]=None) -> pd.DataFrame:
+    try:
+        collection = get_mongo_client()[database_name][collection_name]
+        n_rows = collection.estimated_document_count()
+        chunks = iter_collection_chunks(database_name=database_name, collection_name=collection_name,
+                                        batch_size=batch_size, columns=columns, sort=[("_id", 1)])
+        df = concat_dataframe_chunks(chunks, n_rows=n_rows)
+        logging.info(f"read {df.shape[0]} rows and {df.shape[1]} columns from Collection: {collection_name}")
+        return df
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+# -------------------------------------------------------------------------------------------------
+# (A.2) parallel partitioned reads
+
+# decoding BSON is CPU bound -- so one cursor on one core is the bottleneck even with streaming.
+# we split the collection into "_id" ranges and read every range in a separate worker process,
+# each worker with its own MongoClient (a MongoClient must not be shared across processes).
+# the partitions are read in "_id" order and concatenated in "_id" order -- so the rows always come
+# in the same order and "train_test_split(..., random_state=42)" stays reproducible
+
+# the "_id" as an integer, to split the range of the "_id"s -- an ObjectId by its 12 bytes (its time comes
+# first), an int as it is; None for any other type (eg a string), which cannot be split
+def _id_to_int(value) -> Optional[int]:
+    if type(value).__name__ == "ObjectId":
+        return int.from_bytes(value.binary, "big")
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    return None
+
+
+def _int_to_id(number:int, like):
+    if type(like).__name__ == "ObjectId":
+        return type(like)(number.to_bytes(12, "big"))
+    return number
+
+
+# we need the "_id" values where one partition ends and the next one starts
+# only the smallest and the largest "_id" are read (two lookups in the "_id" index) and the range between
+# them is split evenly -- no "count" and no "skip" (which walks the index up to the offset, for every
+# boundary, and shifts when documents are inserted while we read). For ObjectIds this splits by insertion
+# time, so the partitions are only as even as the rate of the inserts was. The ranges never overlap and
+# cover everything (the first and the last one are open) -- so every document is read exactly once.
+# An "_id" which cannot be split (eg a string) gives one partition.
+# query: optional filter (eg: only the documents after a watermark)
+def get_partition_boundaries(database_name:str, collection_name:str, n_partitions:int, client=None,
+                             query:Optional[dict]=None) -> list:
+    try:
+        client = get_mongo_client() if client is None else client
+        collection = client[database_name][collection_name]
+        first = list(collection.find(query or {}, {"_id": 1}).sort([("_id", 1)]).limit(1))
+        last = list(collection.find(query or {}, {"_id": 1}).sort([("_id", -1)]).limit(1))
+        boundaries = []
+        if len(first) > 0 and type(first[0]["_id"]) == type(last[0]["_id"]):
+            low, high = _id_to_int(first[0]["_id"]), _id_to_int(last[0]["_id"])
+            if low is not None:
+                for partition in range(1, n_partitions):
+                    boundary = low + (high - low) * partition // n_partitions
+                    if boundary > low and (len(boundaries) == 0 or boundary > boundaries[-1]):
+                        boundaries.append(boundary)
+            boundaries = [_int_to_id(boundary, first[0]["_id"]) for boundary in boundaries]
+        # ie [None, b1, b2, ..., None] -- partition i is the range [boundaries[i], boundaries[i+1])
+        return [None] + boundaries + [None]
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+# this runs inside a worker -- it reads one "_id" range [lower, upper) with its own client
+# client_factory: a function which takes the mongodb url and returns a client (default pymongo.MongoClient)
+def _read_partition(database_name:str, collection_name:str, lower, upper, batch_size:int,
+                    columns:Optional[list], mongo_db_url:str, client_factory, min_id=None,
+                    keep_id:bool=False) -> pd.DataFrame:
+    try:
+        client = client_factory(mongo_db_url)
+        query = dict()
+        if min_id is not None:
+            query["$gt"] = min_id
+        if lower is not None:
+            query["$gte"] = lower
+        if upper is not None:
+            query["$lt"] = upper
+        chunks = iter_collection_chunks(database_name=database_name, collection_name=collection_name,
+                                        batch_size=batch_size, columns=columns,
+                                        query={"_id": query} if len(query) > 0 else None,
+                                        sort=[("_id", 1)], client=client, keep_id=keep_id)
+        return concat_dataframe_chunks(chunks)
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+# n_partitions: number of "_id" ranges
+# max_workers: number of worker processes (default: n_partitions)
+# executor: "process" (default) or "thread" -- eg: "thread" for a mock client which lives in this process
+# min_id: if given, only the documents with "_id" > min_id are read (incremental ingestion)
+def get_collection_as_dataframe_partitioned(database_name:str, collection_name:str, n_partitions:int=4,
+                                            batch_size:int=10000, columns:Optional[list]=None,
+                                            max_workers:Optional[int]=None, executor:str="process",
+                                            mongo_db_url:Optional[str]=None, client_factory=None,
+                                            min_id=None, keep_id:bool=False) -> pd.DataFrame:
+    try:
+        from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+        from sensor.config import env_var
+        import pymongo
+
+        mongo_db_url = env_var.mongo_db_url if mongo_db_url is None else mongo_db_url
+        client_factory = pymongo.MongoClient if client_factory is None else client_factory
+
+        boundaries = get_partition_boundaries(database_name=database_name, collection_name=collection_name,
+                                              n_partitions=n_partitions, client=client_factory(mongo_db_url),
+                                              query=None if min_id is None else {"_id": {"$gt": min_id}})
+        partitions = list(zip(boundaries[:-1], boundaries[1:]))
+        logging.info(f"reading Collection: {collection_name} in {len(partitions)} partitions")
+
+        pool_class = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+        with pool_class(max_workers=max_workers or len(partitions)) as pool:
+            futures = [pool.submit(_read_partition, database_name, collection_name, lower, upper,
+                                   batch_size, columns, mongo_db_url, client_factory, min_id, keep_id)
+                       for lower, upper in partitions]
+            # "futures" is in partition order (ie "_id" order) -- not in the order the workers finish
+            frames = [future.result() for future in futures]
+
+        frames = [frame for frame in frames if frame.shape[0] > 0]
+        df = concat_dataframe_chunks(iter(frames), n_rows=sum(frame.shape[0] for frame in frames))
+        logging.info(f"read {df.shape[0]} rows and {df.shape[1]} columns from Collection: {collection_name}")
+        return df
+    except Exception as e:
+        raise SensorException(e, sys)
+
 
 
 #-------------------------------------------------------------------------------------------------
@@ -135,8 +393,9 @@ def save_numpy_array_data(file_path: str, array: np.array):
     try:
         dir_path = os.path.dirname(file_path)
         os.makedirs(dir_path, exist_ok=True)
-        with open(file_path, "wb") as file_obj:
-            np.save(file_obj, array)
+        with instrument("io.save_numpy", rows=array.shape[0], bytes=array.nbytes):
+            with open(file_path, "wb") as file_obj:
+                np.save(file_obj, array)
 
     except Exception as e:
         raise SensorException(e, sys) from e
@@ -145,18 +404,195 @@ def save_numpy_array_data(file_path: str, array: np.array):
 # we need to give the location where we want to save -- as input
 # and then, we will load that file into an numpy array format ie the file that we have saved, it 
 # should be loaded back as a numpy array
-def load_numpy_array_data(file_path: str) -> np.array:
+# mmap_mode: eg "r" -- the file is memory mapped instead of read, ie only the pages which are used are
+#            read from disk, and they can be dropped again by the OS (None => read into memory)
+def load_numpy_array_data(file_path: str, mmap_mode: Optional[str] = None) -> np.array:
 
     """
     load numpy array data from file
     file_path: str location of file to load
+    mmap_mode: None, or a mode of "np.load" (eg "r") to memory map the file
     return: np.array data loaded
     """
 
     try:
-        with open(file_path, "rb") as file_obj:
-            return np.load(file_obj)
+        with instrument("io.load_numpy", bytes=file_size(file_path)) as measurement:
+            if mmap_mode is None:
+                with open(file_path, "rb") as file_obj:
+                    array = np.load(file_obj)
+            else:
+                array = np.load(file_path, mmap_mode=mmap_mode)
+            measurement.rows = array.shape[0]
+        return array
         
     except Exception as e:
         raise SensorException(e, sys) from e
+
+
+# the transformed train/test sets used to be one file each -- "np.c_[features, target]" in float64.
+# so, the model trainer had to read the whole file into memory and then copy the features out of it
+# ("arr[:, :-1]" of a loaded array is a copy as soon as it is passed to xgboost).
+# now, every set is a directory with two files:
+#     features.npy -- float32, C-contiguous (the dtype the transformer outputs, and the one xgboost
+#                     uses internally -- so nothing has to be converted)
+#     labels.npy   -- the encoded target
+# both are loaded memory mapped -- the features are used straight from the page cache, zero-copy
+# (a scipy CSR matrix -- refer "missing_values.py" -- is saved as "features.npz" instead, and loaded
+# into memory: it holds only the observed values)
+TRANSFORMED_FEATURES_FILE_NAME = "features.npy"
+TRANSFORMED_SPARSE_FEATURES_FILE_NAME = "features.npz"
+TRANSFORMED_LABELS_FILE_NAME = "labels.npy"
+TRANSFORMED_FEATURES_DTYPE = np.float32
+
+
+def save_transformed_dataset(dir_path: str, features: np.array, labels: np.array) -> None:
+    try:
+        os.makedirs(dir_path, exist_ok=True)
+        if hasattr(features, "tocsr"):
+            from scipy import sparse
+            with instrument("io.save_sparse", rows=features.shape[0]):
+                sparse.save_npz(os.path.join(dir_path, TRANSFORMED_SPARSE_FEATURES_FILE_NAME),
+                                features.tocsr().astype(TRANSFORMED_FEATURES_DTYPE), compressed=False)
+        else:
+            # no copy if the features are float32 and C-contiguous already
+            save_numpy_array_data(file_path=os.path.join(dir_path, TRANSFORMED_FEATURES_FILE_NAME),
+                                  array=np.ascontiguousarray(features, dtype=TRANSFORMED_FEATURES_DTYPE))
+        save_numpy_array_data(file_path=os.path.join(dir_path, TRANSFORMED_LABELS_FILE_NAME),
+                              array=np.asarray(labels))
+    except Exception as e:
+        raise SensorException(e, sys) from e
+
+
+# returns (features, labels)
+# a single ".npz" file of the old layout (features + target in the last column) is also accepted
+def load_transformed_dataset(dir_path: str, mmap_mode: Optional[str] = "r") -> tuple:
+    try:
+        if os.path.isfile(dir_path):
+            array = load_numpy_array_data(file_path=dir_path, mmap_mode=mmap_mode)
+            return array[:, :-1], array[:, -1]
+        sparse_file_path = os.path.join(dir_path, TRANSFORMED_SPARSE_FEATURES_FILE_NAME)
+        if os.path.exists(sparse_file_path):
+            from scipy import sparse
+            with instrument("io.load_sparse", bytes=file_size(sparse_file_path)):
+                features = sparse.load_npz(sparse_file_path)
+        else:
+            features = load_numpy_array_data(file_path=os.path.join(dir_path, TRANSFORMED_FEATURES_FILE_NAME), mmap_mode=mmap_mode)
+        labels = load_numpy_array_data(file_path=os.path.join(dir_path, TRANSFORMED_LABELS_FILE_NAME), mmap_mode=mmap_mode)
+        if features.shape[0] != labels.shape[0]:
+            raise Exception(f"{dir_path}: {features.shape[0]} rows of features but {labels.shape[0]} labels")
+        return features, labels
+    except Exception as e:
+        raise SensorException(e, sys) from e
     
+
+# ---------------------------------------------------------------------------------------------------
+#  (F)
+
+'''
+Some results (eg: the profile of the base dataset) depend only on the CONTENT of a file -- so we key
+them by a hash of that content. Hashing reads the file once in blocks (no parsing), which is much
+cheaper than parsing a large csv again.
+'''
+
+# sha256 of the content of a file -- read block by block, so the memory stays small
+def file_sha256(file_path:str, block_size:int=1 << 20) -> str:
+    try:
+        import hashlib
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as file_obj:
+            for block in iter(lambda: file_obj.read(block_size), b""):
+                digest.update(block)
+        return digest.hexdigest()
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+# the same hash -- but remembered in a small json index, together with the size, the modification time and
+# the status change time ("ctime") of the file; an unchanged file is then not read again. The index is keyed by
+# the inode of the file (not its path) -- so a hard link of a file (eg: an artifact restored from a cache) is
+# found too (it is hashed once more after the link was made -- making a link changes the ctime)
+#
+# an inode number is reused for a new file once the old one is deleted, and the mtime can be set back to an
+# old value (eg: "touch -d", "cp -p") -- but the ctime cannot: it is always set by the kernel to "now". And a
+# file which is written again within the clock granularity of the file system keeps its mtime and ctime --
+# so a file which changed less than "racy_seconds" ago is hashed, but not remembered (the same rule as the
+# "racy clean" files of the git index)
+#
+# the index is read once when it is opened, and written once by "save" (eg: at the end of a whole
+# fingerprint pass, not once per file) -- under a file lock, and merged with what the other processes
+# wrote into it in the meantime (so no hash of another process is lost):
+#     with FileHashIndex(index_file_path) as index:
+#         hashes = [index.sha256(file_path) for file_path in file_paths]
+class FileHashIndex:
+
+    # racy_seconds: files which changed less than so many seconds ago are not remembered
+    def __init__(self, index_file_path:str, racy_seconds:float=2.0):
+        self.index_file_path = index_file_path
+        self.racy_seconds = racy_seconds
+        self.lock_file_path = f"{index_file_path}.lock"
+        self.entries = self._read()
+        # the entries which were hashed since the index was read -- the ones "save" writes
+        self.new_entries = dict()
+
+    def _read(self) -> dict:
+        import json
+        if not os.path.exists(self.index_file_path):
+            return dict()
+        try:
+            with open(self.index_file_path, "r") as file_obj:
+                return json.load(file_obj)
+        except ValueError:
+            # a broken index only costs hashing the files again
+            return dict()
+
+    def sha256(self, file_path:str) -> str:
+        try:
+            import time
+            stat = os.stat(file_path)
+            file_key = f"{stat.st_dev}:{stat.st_ino}"
+            entry = self.entries.get(file_key)
+            if (entry is not None and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns
+                    and entry.get("ctime_ns") == stat.st_ctime_ns):
+                return entry["sha256"]
+            sha256 = file_sha256(file_path)
+            # (an entry of an older index has no "ctime_ns" -- the file is hashed once more, and the entry replaced)
+            if time.time_ns() - max(stat.st_mtime_ns, stat.st_ctime_ns) >= self.racy_seconds * 1e9:
+                entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "ctime_ns": stat.st_ctime_ns,
+                         "sha256": sha256}
+                self.entries[file_key] = self.new_entries[file_key] = entry
+            return sha256
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def save(self):
+        try:
+            if len(self.new_entries) == 0:
+                return
+            import json
+            from sensor.model_registry import file_lock
+            os.makedirs(os.path.dirname(self.index_file_path) or ".", exist_ok=True)
+            with file_lock(self.lock_file_path):
+                entries = self._read()
+                entries.update(self.new_entries)
+                tmp_file_path = f"{self.index_file_path}.{os.getpid()}.tmp"
+                with open(tmp_file_path, "w") as file_obj:
+                    json.dump(entries, file_obj)
+                os.replace(tmp_file_path, self.index_file_path)
+            self.entries, self.new_entries = entries, dict()
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.save()
+
+
+# the hash of one file through the index (refer "FileHashIndex" -- for many files, open the index once)
+def cached_file_sha256(file_path:str, index_file_path:str) -> str:
+    try:
+        with FileHashIndex(index_file_path) as index:
+            return index.sha256(file_path)
+    except Exception as e:
+        raise SensorException(e, sys)
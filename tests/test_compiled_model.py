@@ -0,0 +1,51 @@
+# parity of the compiled model (refer "sensor/compiled_model.py") with the model it was compiled from -- for the
+# models of both training engines (refer "sensor/training_engine.py"), the margins have to be the same bit for
+# bit and the labels the same, for a dense input, a dense input with np.nan (the "native" missing value mode)
+# and its CSR form
+
+import numpy as np
+import pytest
+
+from sensor.components.data_transformation import DataTransformation
+from sensor.config import TARGET_COLUMN
+from sensor.synthetic import make_aps_dataframe
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    df = make_aps_dataframe(3000, seed=0)
+    x, y = df.drop(columns=TARGET_COLUMN).astype(np.float32), (df[TARGET_COLUMN] == "pos").to_numpy().astype(np.int64)
+    return x, y
+
+
+# the inputs of a missing value mode -- "impute": dense without np.nan; "native": dense with np.nan, and its CSR form
+def transformed_inputs(x, missing_value_mode:str) -> dict:
+    from scipy import sparse
+    from sensor.missing_values import dense_steps
+    transformer = DataTransformation.get_data_transformer_object(missing_value_mode=missing_value_mode).fit(x)
+    dense = np.asarray(dense_steps(transformer).transform(x), dtype=np.float32)
+    if missing_value_mode == "impute":
+        return {"dense": dense}
+    # the observed values only -- a missing value is an absent entry
+    observed = ~np.isnan(dense)
+    indptr = np.concatenate([[0], np.cumsum(observed.sum(axis=1))])
+    csr = sparse.csr_matrix((dense[observed], np.nonzero(observed)[1], indptr), shape=dense.shape)
+    return {"nan": dense, "csr": csr}
+
+
+@pytest.mark.parametrize("engine", ["xgbclassifier", "booster"])
+@pytest.mark.parametrize("missing_value_mode", ["impute", "native"])
+def test_compiled_model_parity(dataset, engine, missing_value_mode):
+    from sensor.compiled_model import compile_model
+    from sensor.training_engine import get_base_booster, get_training_engine
+    x, y = dataset
+    inputs = transformed_inputs(x, missing_value_mode)
+    train_input = inputs["dense"] if missing_value_mode == "impute" else inputs["nan"]
+    model = get_training_engine(engine).train(train_input, y, train_input, y).model
+    compiled = compile_model(model)
+    assert compiled is not None
+    booster = get_base_booster(model)
+    for name, matrix in inputs.items():
+        margin = booster.inplace_predict(matrix, predict_type="margin")
+        assert np.array_equal(margin, compiled.predict_margin(matrix)), f"the margins differ ({name})"
+        assert np.array_equal(model.predict(matrix), compiled.predict(matrix)), f"the labels differ ({name})"
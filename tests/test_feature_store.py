@@ -0,0 +1,45 @@
+# the feature store (refer "sensor/feature_store.py") writes a new partition, then the file of its recent ids and
+# then the manifest which points to both -- a crash before the new manifest is written leaves the store as it was
+# (on disk and in memory), and the next append of the same rows succeeds; every row is in the store exactly once
+
+import pandas as pd
+import pytest
+
+from sensor.feature_store import FeatureStore
+
+bson = pytest.importorskip("bson")
+
+
+def make_rows(start_second:int, n_rows:int) -> pd.DataFrame:
+    ids = [bson.ObjectId((start_second + index).to_bytes(4, "big") + bytes(8)) for index in range(n_rows)]
+    return pd.DataFrame({"_id": ids, "sensor_0": [float(start_second + index) for index in range(n_rows)]})
+
+
+def test_failed_manifest_write_leaves_the_store_unchanged(tmp_path, monkeypatch):
+    store = FeatureStore(store_dir=str(tmp_path))
+    assert store.append_new_rows(make_rows(1_600_000_000, 10), overlap_seconds=5) == 10
+    manifest = store.manifest
+    new_rows = make_rows(1_600_000_010, 10)
+
+    def fail(manifest=None):
+        raise OSError("disk full")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(store, "_write_manifest", fail)
+        with pytest.raises(Exception):
+            store.append_new_rows(new_rows, overlap_seconds=5)
+    # the partition and the recent ids were written -- but neither the manifest file nor the object points to them
+    assert store.manifest == manifest
+    reopened = FeatureStore(store_dir=str(tmp_path))
+    assert reopened.manifest == manifest
+    assert (tmp_path / manifest["recent_ids"]).exists()
+
+    # the same rows again -- now they are appended once (and the next read of the overlap window adds nothing)
+    assert reopened.append_new_rows(new_rows, overlap_seconds=5) == 10
+    overlap_rows = new_rows[new_rows["_id"] > reopened.read_after_id(overlap_seconds=5)]
+    assert overlap_rows.shape[0] > 0
+    assert reopened.append_new_rows(overlap_rows, overlap_seconds=5) == 0
+    assert reopened.read()["sensor_0"].tolist() == [float(1_600_000_000 + index) for index in range(20)]
+    # the ids of the last 5 seconds (and of the second of the watermark itself)
+    assert reopened.recent_ids == set(new_rows["_id"].astype(str)[4:])
+    assert [path.name for path in tmp_path.glob("recent-ids-*")] == [reopened.manifest["recent_ids"]]
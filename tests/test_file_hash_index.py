@@ -0,0 +1,56 @@
+# the file hash index (refer "FileHashIndex" in "sensor/utils/utils.py") must never give the hash of an old content
+# of a file -- not when the file is rewritten with the same size and its old mtime, not when a new file gets the
+# inode of a deleted one, and not when the file was written just now (within the clock granularity)
+
+import hashlib
+import os
+import time
+
+from sensor.utils.utils import FileHashIndex
+
+
+def sha256(content:bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def test_rewritten_file_with_old_mtime_is_hashed_again(tmp_path):
+    file_path = tmp_path / "data.bin"
+    file_path.write_bytes(b"a" * 1000)
+    stat = os.stat(file_path)
+    index = FileHashIndex(str(tmp_path / "index.json"), racy_seconds=0)
+    assert index.sha256(str(file_path)) == sha256(b"a" * 1000)
+
+    # (later than the granularity of the ctime -- the kernel sets it from a coarse clock)
+    time.sleep(0.05)
+    file_path.write_bytes(b"b" * 1000)
+    os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert index.sha256(str(file_path)) == sha256(b"b" * 1000)
+
+
+def test_new_file_on_a_reused_inode_is_hashed_again(tmp_path):
+    index = FileHashIndex(str(tmp_path / "index.json"), racy_seconds=0)
+    file_path = tmp_path / "data.bin"
+    file_path.write_bytes(b"a" * 1000)
+    assert index.sha256(str(file_path)) == sha256(b"a" * 1000)
+    stat = os.stat(file_path)
+
+    time.sleep(0.05)
+    os.remove(file_path)
+    new_file_path = tmp_path / "other.bin"
+    new_file_path.write_bytes(b"b" * 1000)
+    os.utime(new_file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    # the same inode (as far as the file system reuses it) -- the index sees the same key, size and mtime
+    assert index.sha256(str(new_file_path)) == sha256(b"b" * 1000)
+
+
+def test_recently_written_file_is_not_remembered(tmp_path):
+    file_path = tmp_path / "data.bin"
+    file_path.write_bytes(b"a" * 1000)
+    with FileHashIndex(str(tmp_path / "index.json")) as index:
+        assert index.sha256(str(file_path)) == sha256(b"a" * 1000)
+        assert index.new_entries == {}
+    # the same file changed within the clock granularity -- same size, same mtime
+    stat = os.stat(file_path)
+    file_path.write_bytes(b"b" * 1000)
+    os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert FileHashIndex(str(tmp_path / "index.json")).sha256(str(file_path)) == sha256(b"b" * 1000)
@@ -0,0 +1,61 @@
+# the entry points of the package must not import the heavy libraries (refer "benchmarks/bench_import_time.py") --
+# they are imported only inside the functions which use them. Every entry point is imported in a fresh python
+# process, so nothing which another test imported is in "sys.modules" already
+# the import time of an entry point has a budget too -- relative to the import time of pandas (which every entry
+# point needs), measured the same way right before it; an absolute budget in milliseconds would depend on the
+# machine (and on how busy it is) -- a ratio of two imports on the same machine does not (much)
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ["pymongo", "sklearn", "xgboost", "imblearn", "scipy"]
+ENTRY_POINTS = ["sensor.pipeline.training_pipeline", "sensor.pipeline.batch_prediction"]
+
+# an entry point may take at most 2x the import time of pandas -- it takes about 1.1x now; importing sklearn
+# and xgboost eagerly takes about 4x
+IMPORT_TIME_BUDGET = 2.0
+REPEAT = 5
+
+IMPORT_SCRIPT = """
+import json, sys
+import {module}
+print(json.dumps(sorted({{name.split(".")[0] for name in sys.modules}} & set({heavy}))))
+"""
+
+TIME_SCRIPT = """
+import time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+
+def run_script(script:str, work_dir) -> str:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([PACKAGE_ROOT, os.environ.get("PYTHONPATH", "")]))
+    # inside a temporary folder -- so the log files of the package do not end up in the repo
+    output = subprocess.run([sys.executable, "-c", script], cwd=work_dir, env=env, capture_output=True, text=True,
+                            check=True)
+    # the last line is ours -- the package itself may print something while it is imported
+    return output.stdout.strip().splitlines()[-1]
+
+
+@pytest.mark.parametrize("module", ENTRY_POINTS)
+def test_entry_point_does_not_import_heavy_modules(module, tmp_path):
+    heavy = json.loads(run_script(IMPORT_SCRIPT.format(module=module, heavy=HEAVY_MODULES), tmp_path))
+    assert heavy == [], f"importing {module} imported {heavy}"
+
+
+@pytest.mark.parametrize("module", ENTRY_POINTS)
+def test_entry_point_import_time_budget(module, tmp_path):
+    # the best of a few imports -- one after the other, so a slow moment of the machine hits both of them
+    baseline, elapsed = float("inf"), float("inf")
+    for _ in range(REPEAT):
+        baseline = min(baseline, float(run_script(TIME_SCRIPT.format(module="pandas"), tmp_path)))
+        elapsed = min(elapsed, float(run_script(TIME_SCRIPT.format(module=module), tmp_path)))
+    assert elapsed <= IMPORT_TIME_BUDGET * baseline, \
+        f"importing {module} took {elapsed * 1000:.0f} ms, more than {IMPORT_TIME_BUDGET}x pandas ({baseline * 1000:.0f} ms)"
@@ -0,0 +1,100 @@
+# the partitioned read of a collection (refer "get_collection_as_dataframe_partitioned" in "sensor/utils/utils.py")
+# has to give exactly the rows of one cursor in "_id" order -- the same rows, the same order, the same values --
+# for any number of partitions, with and without a watermark ("min_id"), for ObjectIds, integer and string "_id"s
+# (a mongomock collection -- the workers are threads which share its client); the streaming read has to give the
+# same rows in the same order too
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sensor import config
+from sensor.config import TARGET_COLUMN
+from sensor.utils import utils
+
+mongomock = pytest.importorskip("mongomock")
+bson = pytest.importorskip("bson")
+
+N_DOCUMENTS = 997
+
+
+def make_ids(id_kind:str, rng:np.random.Generator) -> list:
+    if id_kind == "objectid":
+        # the time of the ObjectIds is spread over a day, and they are inserted out of order
+        seconds = np.sort(rng.integers(1_600_000_000, 1_600_086_400, size=N_DOCUMENTS))
+        return [bson.ObjectId(int(second).to_bytes(4, "big") + rng.bytes(8)) for second in seconds]
+    if id_kind == "int":
+        # consecutive -- so every boundary is the "_id" of a document (which has to be read exactly once)
+        return list(range(1000, 1000 + N_DOCUMENTS))
+    return [f"sensor-{index:05d}" for index in range(N_DOCUMENTS)]
+
+
+@pytest.fixture(params=["objectid", "int", "string"])
+def collection(request):
+    rng = np.random.default_rng(0)
+    ids = make_ids(request.param, rng)
+    documents = []
+    for index, _id in enumerate(ids):
+        document = {"_id": _id, TARGET_COLUMN: "pos" if index % 50 == 0 else "neg"}
+        for column in range(5):
+            value = rng.normal()
+            # a missing value -- "na" as in the APS csv
+            document[f"sensor_{column}"] = "na" if rng.random() < 0.05 else value
+        documents.append(document)
+    client = mongomock.MongoClient()
+    client["aps"]["sensor"].insert_many([documents[index] for index in rng.permutation(N_DOCUMENTS)])
+    return client, ids
+
+
+def single_cursor(client, min_id=None) -> pd.DataFrame:
+    chunks = utils.iter_collection_chunks(database_name="aps", collection_name="sensor", batch_size=100,
+                                          query=None if min_id is None else {"_id": {"$gt": min_id}},
+                                          sort=[("_id", 1)], keep_id=True, client=client)
+    return utils.concat_dataframe_chunks(chunks)
+
+
+@pytest.mark.parametrize("n_partitions", [1, 2, 3, 8])
+@pytest.mark.parametrize("watermark", [False, True])
+def test_partitioned_read_matches_single_cursor(collection, n_partitions, watermark):
+    client, ids = collection
+    min_id = ids[N_DOCUMENTS // 3] if watermark else None
+    expected = single_cursor(client, min_id=min_id)
+    assert expected.shape[0] == (N_DOCUMENTS - N_DOCUMENTS // 3 - 1 if watermark else N_DOCUMENTS)
+
+    df = utils.get_collection_as_dataframe_partitioned(database_name="aps", collection_name="sensor",
+                                                       n_partitions=n_partitions, batch_size=100,
+                                                       executor="thread", mongo_db_url="mongodb://mongomock",
+                                                       client_factory=lambda url: client, min_id=min_id,
+                                                       keep_id=True)
+    pd.testing.assert_frame_equal(df, expected)
+
+
+def test_streaming_read_matches_partitioned_read(collection, monkeypatch):
+    client, ids = collection
+    monkeypatch.setattr(config, "_mongo_client", client)
+    monkeypatch.setattr(config, "_mongo_client_pid", os.getpid())
+    df = utils.get_collection_as_dataframe_streaming(database_name="aps", collection_name="sensor", batch_size=100)
+    expected = utils.get_collection_as_dataframe_partitioned(database_name="aps", collection_name="sensor",
+                                                             n_partitions=3, batch_size=100, executor="thread",
+                                                             mongo_db_url="mongodb://mongomock",
+                                                             client_factory=lambda url: client)
+    pd.testing.assert_frame_equal(df, expected)
+
+
+def test_partition_boundaries_are_id_ranges(collection):
+    client, ids = collection
+    boundaries = utils.get_partition_boundaries(database_name="aps", collection_name="sensor", n_partitions=4,
+                                                client=client)
+    assert boundaries[0] is None and boundaries[-1] is None
+    if isinstance(ids[0], str):
+        # a string "_id" cannot be split -- one partition
+        assert boundaries == [None, None]
+        return
+    # 3 boundaries, strictly increasing, strictly inside the range of the "_id"s -- ie no empty partition at
+    # either end, and no partition twice
+    inner = boundaries[1:-1]
+    assert len(inner) == 3
+    assert all(ids[0] < boundary <= ids[-1] for boundary in inner)
+    assert all(lower < upper for lower, upper in zip(inner[:-1], inner[1:]))
@@ -0,0 +1,51 @@
+# the train/test split of the incremental ingestion (refer "split_test_rows" in "sensor/components/data_ingestion.py")
+# has to keep the side of every row when the feature store grows -- the test rows of a split are test rows in every
+# later split too (so the production model was never trained on a row of a later test set), and only the new rows
+# are split (a mongomock collection which gets more documents between two ingestions)
+
+import numpy as np
+import pytest
+
+from sensor import config
+from sensor.components.data_ingestion import DataIngestion, split_test_rows
+from sensor.entity import config_entity
+from sensor.feature_store import FeatureStore
+from sensor.synthetic import make_aps_dataframe
+
+mongomock = pytest.importorskip("mongomock")
+
+
+def ingest(work_dir, run:int) -> tuple:
+    training_pipeline_config = config_entity.TrainingPipelineConfig(artifact_dir=str(work_dir / "artifacts" / f"{run}"))
+    data_ingestion_config = config_entity.DataIngestionConfig(training_pipeline_config=training_pipeline_config)
+    DataIngestion(data_ingestion_config=data_ingestion_config).initiate_data_ingestion()
+    n_rows = FeatureStore(store_dir=data_ingestion_config.feature_store_dir).n_rows
+    train_rows = np.load(data_ingestion_config.train_rows_file_path)
+    return n_rows, set(range(n_rows)) - set(train_rows.tolist())
+
+
+def test_test_rows_of_a_split_stay_test_rows(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    client = mongomock.MongoClient()
+    monkeypatch.setattr(config, "_mongo_client", client)
+    monkeypatch.setattr(config, "_mongo_client_pid", __import__("os").getpid())
+    collection = client["aps"]["sensor"]
+
+    documents = make_aps_dataframe(2600, seed=0).to_dict("records")
+    splits = []
+    for run, (start, stop) in enumerate([(0, 2000), (2000, 2300), (2300, 2600)]):
+        collection.insert_many(documents[start:stop])
+        splits.append(ingest(tmp_path, run))
+
+    for (n_rows, test_rows), (next_n_rows, next_test_rows) in zip(splits[:-1], splits[1:]):
+        assert next_n_rows > n_rows
+        # the old rows kept their side -- the new test rows are all new rows
+        assert test_rows <= next_test_rows
+        assert next_test_rows - test_rows <= set(range(n_rows, next_n_rows))
+
+
+def test_split_test_rows_fraction():
+    is_test = split_test_rows(np.arange(100000), test_size=0.2)
+    assert abs(is_test.mean() - 0.2) < 0.01
+    # the side of a row depends only on its row number
+    assert np.array_equal(split_test_rows(np.arange(50000, 60000), test_size=0.2), is_test[50000:60000])